@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import argparse
+import statistics
+
+# Frame cost of the menu buttons' hover animation. Seven buttons (as on the main menu) are moved to a new
+# offset every frame and the window repainted synchronously:
+#   stylesheet  the previous approach, a freshly formatted setStyleSheet per button per frame
+#   paint       Button today, the offset is drawn in paintEvent and the clock just calls update()
+#
+#   python benchmarks/button_animation.py [--frames 300]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton
+from PyQt5.QtCore import QTimer
+
+labels = ["New Game", "Load a saved session", "Load a DMT", "DMT Editor", "About", "Settings", "Exit"]
+
+# what Button.update_style did on every anim_offset tick
+class StyleSheetButton(QPushButton):
+    def __init__(self, text):
+        super().__init__("> " + text.lower())
+        self.setFixedWidth(350)
+        self.set_offset(0)
+
+    def set_offset(self, offset):
+        self.setStyleSheet(f"""
+            StyleSheetButton {{
+                background-color: rgba(0,0,0,0.2);
+                color: white;
+                border: rgba(0,0,0,0);
+                border-radius: 10px;
+                padding: 10px;
+                margin-left: {10 + offset}px;
+                font-size: 16px;
+                text-align: left;
+            }}
+            StyleSheetButton:hover {{
+                background-color:rgba(0,0,0,0.3);
+            }}
+        """)
+
+def window_with(buttons) -> QMainWindow:
+    window = QMainWindow()
+    widget = QWidget()
+    layout = QVBoxLayout(widget)
+    for button in buttons:
+        layout.addWidget(button)
+    window.setCentralWidget(widget)
+    window.resize(600, 600)
+    window.show()
+    return window
+
+def measure(window, buttons, set_offset, frames: int) -> list[float]:
+    costs = []
+    for frame in range(frames):
+        offset = frame % 11
+        started = time.perf_counter()
+        for button in buttons:
+            set_offset(button, offset)
+        window.repaint()
+        costs.append(time.perf_counter() - started)
+    return costs
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the per-frame cost of the button animations.")
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    from style import assets
+    from button import Button
+    from animation import animation_clock
+
+    legacy = [StyleSheetButton(label) for label in labels]
+    legacy_window = window_with(legacy)
+    legacy_window.setStyleSheet(assets.stylesheet())
+
+    def paint_offset(button, offset):
+        button.anim_offset = offset
+        button.update()
+
+    buttons = [Button(label) for label in labels]
+    window = window_with(buttons)
+    window.setStyleSheet(assets.stylesheet())
+    app.processEvents()
+
+    results = {
+        "stylesheet": measure(legacy_window, legacy, lambda button, offset: button.set_offset(offset), args.frames),
+        "paint": measure(window, buttons, paint_offset, args.frames),
+    }
+
+    print(f"{len(labels)} buttons, {args.frames} frames")
+    print(f"{'approach':<12} {'median':>10} {'p95':>10}")
+    for name, costs in results.items():
+        costs = sorted(costs)
+        print(f"{name:<12} {statistics.median(costs) * 1000:>8.3f}ms {costs[int(len(costs) * 0.95)] * 1000:>8.3f}ms")
+    print(f"speedup {statistics.median(results['stylesheet']) / statistics.median(results['paint']):.1f}x")
+
+    # the clock runs while the buttons type and blink, and with one timer for all of them
+    frames = animation_clock().frames
+    QTimer.singleShot(2000, app.quit)
+    app.exec_()
+    print(f"clock: {animation_clock().frames - frames} wakeups in 2s for {len(buttons)} buttons, "
+          f"{len(window.findChildren(QTimer)) + len(animation_clock().findChildren(QTimer))} timer(s)")
+
+if __name__ == "__main__":
+    main()
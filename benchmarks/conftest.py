@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import pytest
+
+# Benchmarks for the hot paths, on pytest-benchmark (pip install pytest-benchmark):
+#
+#   pytest benchmarks                                          run them, the results are saved under benchmarks/results
+#   pytest benchmarks --benchmark-compare                      and compare against the last saved run
+#   pytest benchmarks --benchmark-compare=0003 --benchmark-compare-fail=mean:15%
+#   pytest-benchmark --storage benchmarks/results compare       every saved run side by side
+#
+# Every saved run records the commit it was made on, so results can be lined up across commits.
+#
+# corpus/turns.jsonl is a 24 turn session (the player's message and the model's GameModel JSON for every turn)
+# that the longer sessions are made from, corpus/world.json the fields of a DMT world.
+
+here = os.path.dirname(os.path.abspath(__file__))
+corpus_dir = os.path.join(here, "corpus")
+results_dir = os.path.join(here, "results")
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("TOGETHER_NO_BANNER", "1")
+sys.path.insert(0, os.path.join(os.path.dirname(here), "src"))
+
+from google.genai import types
+import chat
+from chat import Chat, make_response
+from gameModel import GameModel
+from settings import SettingsObject
+
+# compaction defaults rather than whatever the local settings file has
+chat.settings = SettingsObject()
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    if config.getoption("benchmark_storage", None) == "file://./.benchmarks":
+        config.option.benchmark_storage = "file://" + results_dir
+
+def load_corpus() -> list[dict]:
+    with open(os.path.join(corpus_dir, "turns.jsonl"), "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+# a session `turns` long, made by playing the corpus over and over
+def build_chat(corpus: list[dict], turns: int) -> Chat:
+    session = Chat(types.GenerateContentConfig(
+        temperature = 2.0,
+        response_mime_type = "application/json",
+        response_schema = GameModel,
+        system_instruction = "You are the Dungeon Master.",
+    ))
+    for turn in range(turns):
+        record = corpus[turn % len(corpus)]
+        session.history.append(types.Content(role="user", parts=[types.Part(text=record["user"])]))
+        session.history.append(make_response(record["model"], GameModel))
+    session.state.commit(session.history[-1].parsed)
+    return session
+
+@pytest.fixture(scope="session")
+def corpus() -> list[dict]:
+    return load_corpus()
+
+@pytest.fixture(scope="session")
+def world() -> dict:
+    with open(os.path.join(corpus_dir, "world.json"), "r", encoding="utf-8") as file:
+        return json.load(file)
+
+@pytest.fixture(scope="session")
+def qapp():
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+# How many concurrent sessions one src/server.py process can carry. The server runs in its own process with a
+# stubbed Gemini client (a lognormally distributed response time and a valid GameModel, no images),
+# so what's measured is the server itself: per-turn overhead on top of the model's latency, memory per session,
+# and eviction and reloading of sessions whose players disconnect.
+#
+# For each step, that many players connect at once and play --turns turns each, thinking --think seconds
+# between turns. A --reconnect share of them disconnect halfway and come back once their session was unloaded.
+#
+#   python benchmarks/server_load.py [--sessions 50 200 800] [--turns 5] [--latency 0.5] [--think 1.0]
+
+src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, src)
+
+def percentile(values: list[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else float("nan")
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# ---- server process
+
+def serve(args):
+    import chat
+    from settings import SettingsObject
+    from transport import StubGenai, lognormal_latency
+    from server import GameServer
+
+    settings = SettingsObject("stub", "stub")
+    chat.settings = settings
+    stub = StubGenai(lognormal_latency(args.latency, 0.4, seed=1), seed=1)
+    server = GameServer(stub, None, settings, args.directory, idle_timeout=args.idle)
+
+    async def report():
+        while True:
+            print(json.dumps(server.stats() | { "rss_mb": rss_mb() }), flush=True)
+            await asyncio.sleep(0.5)
+
+    async def run():
+        asyncio.create_task(report())
+        await server.serve("127.0.0.1", 0, lambda port: print(json.dumps({ "port": port }), flush=True))
+
+    asyncio.run(run())
+
+# ---- players
+
+class Player:
+    def __init__(self, url: str, turns: int, think: float, reconnect_after: float | None):
+        self.url = url
+        self.turns = turns
+        self.think = think
+        self.reconnect_after = reconnect_after
+        self.turn_seconds: list[float] = []
+        self.first_text: list[float] = []
+        self.errors: list[str] = []
+        self.session = None
+        self.rehydrated = False
+
+    async def play(self):
+        from websockets.asyncio.client import connect
+        played = 0
+        while played < self.turns:
+            async with connect(self.url, max_size=2 ** 22) as websocket:
+                await websocket.send(json.dumps({ "type": "hello", "session": self.session }))
+                hello = json.loads(await websocket.recv())
+                if self.session and hello["id"] == self.session:
+                    self.rehydrated = True
+                self.session = hello["id"]
+                game = hello["game"]
+
+                started = time.perf_counter()
+                while played < self.turns:
+                    if game is None:
+                        game = await self.wait_for_game(websocket, started)
+                        if game is None:
+                            return
+                        played += 1
+                        # half way through, go away for long enough to be unloaded, then come back
+                        if self.reconnect_after is not None and played == self.turns // 2:
+                            reconnect_after, self.reconnect_after = self.reconnect_after, None
+                            await websocket.close()
+                            await asyncio.sleep(reconnect_after)
+                            break
+                        continue
+
+                    await asyncio.sleep(random.uniform(0.5, 1.5) * self.think)
+                    await websocket.send(json.dumps({ "type": "choose", "text": random.choice(game["choices"])["text"] }))
+                    started = time.perf_counter()
+                    game = None
+
+    async def wait_for_game(self, websocket, started: float) -> dict | None:
+        texted = False
+        async for raw in websocket:
+            message = json.loads(raw)
+            if message["type"] == "text" and not texted:
+                texted = True
+                self.first_text.append(time.perf_counter() - started)
+            elif message["type"] == "game":
+                self.turn_seconds.append(time.perf_counter() - started)
+                return message["game"]
+            elif message["type"] == "error":
+                self.errors.append(message["message"])
+                return None
+        return None
+
+async def run_step(url: str, sessions: int, args) -> dict:
+    players = [
+        Player(url, args.turns, args.think, args.idle * 3 if random.random() < args.reconnect else None)
+        for _ in range(sessions)
+    ]
+    started = time.perf_counter()
+    results = await asyncio.gather(*(player.play() for player in players), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+
+    turns = [seconds for player in players for seconds in player.turn_seconds]
+    first = [seconds for player in players for seconds in player.first_text]
+    return {
+        "sessions": sessions,
+        "elapsed": elapsed,
+        "turns": len(turns),
+        "turns_per_second": len(turns) / elapsed,
+        "turn_p50": percentile(turns, 0.5),
+        "turn_p95": percentile(turns, 0.95),
+        "first_text_p50": percentile(first, 0.5),
+        "errors": sum(len(player.errors) for player in players) + sum(1 for result in results if isinstance(result, BaseException)),
+        "rehydrated": sum(1 for player in players if player.rehydrated),
+    }
+
+async def drive(args) -> int:
+    with tempfile.TemporaryDirectory() as directory:
+        command = [sys.executable, os.path.abspath(__file__), "--serve", "--directory", directory,
+            "--latency", str(args.latency), "--idle", str(args.idle)]
+        process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE,
+            env=dict(os.environ, TOGETHER_NO_BANNER="1", QT_QPA_PLATFORM="offscreen"))
+
+        stats = {}
+        port = None
+        async def read():
+            nonlocal port
+            async for line in process.stdout:
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "port" in data:
+                    port = data["port"]
+                else:
+                    stats.update(data)
+        reader = asyncio.create_task(read())
+        while port is None:
+            if process.returncode is not None:
+                print("The server didn't start.")
+                return 1
+            await asyncio.sleep(0.05)
+
+        url = f"ws://127.0.0.1:{port}"
+        await asyncio.sleep(1)
+        baseline = stats.get("rss_mb", 0.0)
+        print(f"stub model latency {args.latency:.2f}s median, {args.turns} turns per player, server idle rss {baseline:.1f} MB")
+        print(f"{'sessions':>8} {'turns/s':>8} {'turn p50':>9} {'turn p95':>9} {'overhead':>9} {'1st text':>9} {'rss MB':>8} {'MB/sess':>8} {'reloads':>8} {'errors':>7}")
+
+        failed = False
+        for sessions in args.sessions:
+            peak = 0.0
+            async def watch():
+                nonlocal peak
+                while True:
+                    peak = max(peak, stats.get("rss_mb", 0.0))
+                    await asyncio.sleep(0.25)
+            watcher = asyncio.create_task(watch())
+            result = await run_step(url, sessions, args)
+            watcher.cancel()
+
+            overhead = result["turn_p50"] - args.latency
+            print(f"{sessions:>8} {result['turns_per_second']:>8.1f} {result['turn_p50']:>8.3f}s {result['turn_p95']:>8.3f}s "
+                f"{overhead:>8.3f}s {result['first_text_p50']:>8.3f}s {peak:>8.1f} {(peak - baseline) / sessions:>8.3f} "
+                f"{result['rehydrated']:>8} {result['errors']:>7}")
+            failed |= result["errors"] > 0
+            # let the step's sessions be unloaded before the next one
+            await asyncio.sleep(args.idle * 2)
+
+        print(f"server: {json.dumps({ key: value for key, value in stats.items() if key != 'rss_mb' })}")
+        process.terminate()
+        await process.wait()
+        reader.cancel()
+        return 1 if failed else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the WebSocket server with stubbed model backends.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[50, 200, 800], help="concurrent players for each step")
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.5, help="median stub model response time, in seconds")
+    parser.add_argument("--think", type=float, default=1.0, help="average time players take to choose")
+    parser.add_argument("--idle", type=float, default=1.0, help="server idle timeout, in seconds")
+    parser.add_argument("--reconnect", type=float, default=0.2, help="share of players that disconnect and come back")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--directory", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return 0
+    return asyncio.run(drive(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+# Cold-start benchmark for src/main.py. Every run is a fresh interpreter that imports main, shows the menu and
+# exits on its first paint. Reports the median of:
+#   process      spawning the interpreter until the menu has painted (what the player waits for)
+#   import       `import main`
+#   first_paint  `import main` until the menu has painted
+# and fails (exit code 1) if any is over the budget in startup_budget.json, or if one of the modules that
+# should load lazily was already imported when the menu painted.
+#
+#   python benchmarks/startup.py [--runs 10] [--update]
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+budget_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_budget.json")
+
+child = r"""
+import sys, time, json
+started = time.perf_counter()
+sys.path.insert(0, "src")
+import main
+imported = time.perf_counter()
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv)
+window = main.MainWindow()
+
+def painted():
+    now = time.perf_counter()
+    print(json.dumps({
+        "import": imported - started,
+        "first_paint": now - started,
+        "loaded": sorted(name for name in sys.modules if name.split(".")[0] in ("google", "together", "PIL", "pydantic")),
+    }), flush=True)
+    app.quit()
+
+window.first_painted.connect(painted)
+window.show()
+app.exec_()
+"""
+
+def run_once(env: dict) -> dict:
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", child], cwd=root, env=env, capture_output=True, text=True, timeout=120)
+    elapsed = time.perf_counter() - started
+    for line in out.stdout.splitlines():
+        if line.startswith("{"):
+            result = json.loads(line)
+            result["process"] = elapsed
+            return result
+    raise RuntimeError(f"Startup run failed:\n{out.stderr}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Dungeon Master's cold start.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--platform", default=os.environ.get("QT_QPA_PLATFORM", "offscreen"), help="Qt platform plugin, offscreen by default")
+    parser.add_argument("--update", action="store_true", help="write the measured medians (+50%%) as the new budget")
+    args = parser.parse_args()
+
+    env = dict(os.environ, QT_QPA_PLATFORM=args.platform, PYTHONDONTWRITEBYTECODE="1")
+    # the first run pays for .pyc compilation and a cold disk cache, it isn't counted
+    run_once(env)
+    runs = [run_once(env) for _ in range(args.runs)]
+
+    metrics = ["process", "import", "first_paint"]
+    medians = { metric: statistics.median(run[metric] for run in runs) for metric in metrics }
+    loaded = sorted({ name for run in runs for name in run["loaded"] })
+
+    with open(budget_path, "r", encoding="utf-8") as file:
+        budget = json.load(file)
+
+    failed = False
+    print(f"{'metric':<12} {'median':>9} {'min':>9} {'max':>9} {'budget':>9}")
+    for metric in metrics:
+        values = [run[metric] for run in runs]
+        limit = budget["seconds"][metric]
+        over = medians[metric] > limit
+        failed |= over
+        print(f"{metric:<12} {medians[metric]:>8.3f}s {min(values):>8.3f}s {max(values):>8.3f}s {limit:>8.3f}s{'  OVER BUDGET' if over else ''}")
+
+    eager = [name for name in loaded if name.split(".")[0] in budget["lazy"]]
+    if eager:
+        failed = True
+        print(f"Loaded before the menu painted, should be lazy: {', '.join(eager)}")
+
+    if args.update:
+        budget["seconds"] = { metric: round(medians[metric] * 1.5, 3) for metric in metrics }
+        with open(budget_path, "w", encoding="utf-8") as file:
+            json.dump(budget, file, indent=4)
+            file.write("\n")
+        print(f"Budget updated: {budget_path}")
+        return 0
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
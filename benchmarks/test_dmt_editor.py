@@ -0,0 +1,27 @@
+import pytest
+from generate_dmt import DMTEditor
+
+@pytest.fixture
+def editor(qapp, world):
+    editor = DMTEditor(None)
+    editor.new_file()
+    editor.storyline.setPlainText(world["STORYLINE"])
+    editor.start_session.setPlainText(world["START_OF_SESSION"])
+    editor.characters.setPlainText(world["CHARACTERS"])
+    editor.items.setPlainText(world["STARTER_ITEMS"])
+    yield editor
+    editor.deleteLater()
+
+# runs on every keystroke in the editor
+def test_update_dmt(benchmark, editor):
+    benchmark(editor.update_dmt)
+
+# filling the editor from a loaded or generated world
+def test_update_text(benchmark, editor):
+    dmt_data = editor.dmt_data
+
+    def update():
+        editor.dmt_data = dmt_data
+        editor.update_text()
+
+    benchmark(update)
@@ -0,0 +1,23 @@
+from chat import make_response
+from gameModel import GameModel
+from stream_parser import GameModelStreamParser
+
+def test_validate_turns(benchmark, corpus):
+    texts = [record["model"] for record in corpus]
+    benchmark(lambda: [GameModel.model_validate_json(text) for text in texts])
+
+def test_make_response(benchmark, corpus):
+    texts = [record["model"] for record in corpus]
+    benchmark(lambda: [make_response(text, GameModel) for text in texts])
+
+# a streamed response arriving in 40 character chunks
+def test_stream_parser(benchmark, corpus):
+    text = corpus[5]["model"]
+    chunks = [text[i:i + 40] for i in range(0, len(text), 40)]
+
+    def parse():
+        parser = GameModelStreamParser(GameModel)
+        for chunk in chunks:
+            parser.feed(chunk)
+
+    benchmark(parse)
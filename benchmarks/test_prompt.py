@@ -0,0 +1,35 @@
+import pytest
+from google.genai import types
+from conftest import build_chat
+from transport import StubGenai
+
+lengths = [10, 100, 500]
+
+def choice() -> types.Content:
+    return types.Content(role="user", parts=[types.Part(text="I have chosen: Search the room")])
+
+@pytest.mark.parametrize("turns", lengths)
+def test_build_contents(benchmark, corpus, turns):
+    session = build_chat(corpus, turns)
+    session.history.append(choice())
+    benchmark(session.build_contents)
+
+# without compaction every turn is sent, the worst case
+@pytest.mark.parametrize("turns", lengths)
+def test_build_contents_uncompacted(benchmark, corpus, turns):
+    session = build_chat(corpus, turns)
+    session.keep_turns = 0
+    session.history.append(choice())
+    benchmark(session.build_contents)
+
+# a whole Chat.send_message against an instant stub model, on a fresh copy of the session every round
+@pytest.mark.parametrize("turns", lengths)
+def test_send_message(benchmark, corpus, turns):
+    session = build_chat(corpus, turns)
+    session.client = StubGenai(seed=1)
+    session.build_contents()
+
+    def setup():
+        return (session.fork(),), {}
+
+    benchmark.pedantic(lambda fork: fork.send_message("I have chosen: Search the room"), setup=setup, rounds=50)
@@ -0,0 +1,74 @@
+import time
+import itertools
+import pytest
+from PIL import Image
+from gameModel import GameModel
+from journal import SessionJournal
+from settings import SettingsObject
+from conftest import build_chat
+
+# A GameWindow on a saved 10 turn session, offscreen. The transport replays from an empty cassette, so nothing
+# goes out to the network and image requests fail straight away.
+@pytest.fixture
+def window(qapp, corpus, tmp_path, monkeypatch):
+    from PyQt5.QtWidgets import QMainWindow
+    import game
+    import image_cache
+
+    settings = SettingsObject(transport_mode="replay", cassette_dir=str(tmp_path / "cassettes"))
+    monkeypatch.setattr(game, "loadSettings", lambda: settings)
+    monkeypatch.setattr(image_cache, "image_cache", image_cache.ImageCache(str(tmp_path / "images")))
+
+    path = str(tmp_path / "session.dms")
+    SessionJournal(path).write(build_chat(corpus, 10))
+
+    main_window = QMainWindow()
+    window = game.GameWindow(main_window, file=path)
+    window.resize(1366, 768)
+    window.show()
+    window.load_task.future.result(timeout=10)
+    deadline = time.monotonic() + 2
+    while window.session is None and time.monotonic() < deadline:
+        qapp.processEvents()
+    yield window
+    window.close()
+    main_window.close()
+    qapp.processEvents()
+
+# what a turn costs the UI: filling in the window, the layout pass and a paint
+def test_update_game(benchmark, window, corpus):
+    games = itertools.cycle([GameModel.model_validate_json(record["model"]) for record in corpus])
+
+    def update():
+        window.update_game(next(games))
+        window.relayout()
+        window.repaint()
+
+    benchmark(update)
+
+# a new image arriving: scaled down to the label and painted
+def test_display_new_image(benchmark, window):
+    from image_pipeline import prepare_image
+    images = itertools.cycle([
+        prepare_image(Image.effect_noise((1024, 768), 40 + n * 10).convert("RGB"), (800, 600))
+        for n in range(2)
+    ])
+
+    def display():
+        window.display_image(next(images))
+        window.image_label.repaint()
+
+    benchmark(display)
+
+# the same image at label sizes it has already been shown at, as happens while resizing
+def test_display_image_resized(benchmark, window):
+    from image_pipeline import prepare_image
+    window.display_image(prepare_image(Image.effect_noise((1024, 768), 40).convert("RGB"), (800, 600)))
+    sizes = itertools.cycle([(284, 213), (320, 240), (356, 267)])
+
+    def display():
+        window.image_label.setFixedSize(*next(sizes))
+        window.display_image()
+        window.image_label.repaint()
+
+    benchmark(display)
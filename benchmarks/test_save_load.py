@@ -0,0 +1,38 @@
+import pickle
+import pytest
+from conftest import build_chat
+from journal import SessionJournal, load_session
+
+lengths = [10, 100, 500]
+
+# the format older versions saved, still loaded
+@pytest.mark.parametrize("turns", lengths)
+def test_pickle_round_trip(benchmark, corpus, turns):
+    session = build_chat(corpus, turns)
+    benchmark(lambda: pickle.loads(pickle.dumps(session)))
+
+@pytest.mark.parametrize("turns", lengths)
+def test_save(benchmark, corpus, turns, tmp_path):
+    session = build_chat(corpus, turns)
+    path = str(tmp_path / "session.dms")
+    benchmark(lambda: SessionJournal(path).write(session))
+
+@pytest.mark.parametrize("turns", lengths)
+def test_load(benchmark, corpus, turns, tmp_path):
+    path = str(tmp_path / "session.dms")
+    SessionJournal(path).write(build_chat(corpus, turns))
+    benchmark(lambda: load_session(path))
+
+# an autosave: one more turn appended to a long session
+def test_append_turn(benchmark, corpus, tmp_path):
+    session = build_chat(corpus, 500)
+    path = str(tmp_path / "session.dms")
+    journal = SessionJournal(path)
+    journal.write(session)
+    turn = build_chat(corpus, 1).history
+
+    def setup():
+        session.history += turn
+        return (), {}
+
+    benchmark.pedantic(lambda: journal.append(session), setup=setup, rounds=50)
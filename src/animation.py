@@ -0,0 +1,57 @@
+import time
+from PyQt5.QtCore import QObject, QTimer, Qt
+
+# One timer for every animated widget. Animators are scheduled for the time they next need a frame, and
+# tick(now) returns when that is after this one (or None when they're done). The timer only ever waits for
+# the earliest of those and stops when nothing is scheduled, so idle or slow animations (a blinking cursor)
+# don't cost a 60 fps timer each.
+class AnimationClock(QObject):
+    frame_interval = 1 / 60
+
+    def __init__(self):
+        super().__init__()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+        self.animators: dict[QObject, float] = {}
+        self.known: set[QObject] = set()
+        self.frames = 0
+
+    def schedule(self, animator: QObject, at: float = None):
+        at = time.monotonic() if at is None else at
+        if animator not in self.known:
+            self.known.add(animator)
+            animator.destroyed.connect(lambda: self.forget(animator))
+        self.animators[animator] = min(at, self.animators.get(animator, at))
+        self.arm()
+
+    def forget(self, animator: QObject):
+        self.animators.pop(animator, None)
+        self.known.discard(animator)
+
+    def arm(self):
+        if not self.animators:
+            self.timer.stop()
+            return
+        delay = min(self.animators.values()) - time.monotonic()
+        self.timer.start(max(0, int(delay * 1000)))
+
+    def tick(self):
+        self.frames += 1
+        now = time.monotonic()
+        due = [animator for animator, at in self.animators.items() if at <= now + 0.001]
+        for animator in due:
+            del self.animators[animator]
+            next_frame = animator.tick(now)
+            if next_frame is not None:
+                self.animators[animator] = next_frame
+        self.arm()
+
+clock: AnimationClock = None
+
+def animation_clock() -> AnimationClock:
+    global clock
+    if clock is None:
+        clock = AnimationClock()
+    return clock
@@ -0,0 +1,187 @@
+import os
+import sys
+import csv
+import json
+import time
+import random
+import asyncio
+import argparse
+import importlib
+from typing import Callable
+import chat
+from gameModel import GameModel
+from settings import SettingsObject, loadSettings
+from session import GameSession, GenerationError
+from transport import make_clients, lognormal_latency, StubGenai, StubTogether
+
+# Plays whole sessions without a window, many at once, and reports what every turn cost.
+#
+#   python src/autoplay.py [--sessions 10] [--turns 20] [--parallel 4] [--policy random|first|items|module:function]
+#                          [--world FILE.dmt] [--stub [--latency 0.5] [--invalid 0.1]] [--report autoplay.csv|.json] [--seed 0]
+#
+# A policy gets the current game and a random.Random and returns ("choose", choice) or ("use_item", item, option).
+# --stub plays against transport.StubGenai, offline and without API keys, otherwise the settings' clients are used
+# (so a replay transport works too).
+
+def random_policy(game: GameModel, rng: random.Random) -> tuple:
+    return ("choose", rng.choice(game.choices).text)
+
+def first_policy(game: GameModel, rng: random.Random) -> tuple:
+    return ("choose", game.choices[0].text)
+
+# uses an item every other turn when there's one to use
+def items_policy(game: GameModel, rng: random.Random) -> tuple:
+    usable = [(item.name, option) for item in game.inventory for option in item.options if option != "discard"]
+    if usable and rng.random() < 0.5:
+        return ("use_item", *rng.choice(usable))
+    return random_policy(game, rng)
+
+policies = {
+    "random": random_policy,
+    "first": first_policy,
+    "items": items_policy,
+}
+
+def load_policy(name: str) -> Callable[[GameModel, random.Random], tuple]:
+    if name in policies:
+        return policies[name]
+    module, _, function = name.partition(":")
+    if not function:
+        raise ValueError(f"Unknown policy '{name}', use one of {', '.join(policies)} or module:function.")
+    return getattr(importlib.import_module(module), function)
+
+fields = ["session", "turn", "action", "latency", "prompt_tokens", "cached_tokens", "output_tokens", "sent_tokens", "retries", "repairs",
+    "rule_repairs", "history", "choices", "health", "error"]
+
+async def play(number: int, args, make_session: Callable[[], GameSession], policy, limit: asyncio.Semaphore) -> list[dict]:
+    rng = random.Random(f"{args.seed}-{number}")
+    rows = []
+    async with limit:
+        session = await asyncio.to_thread(make_session)
+        session.name = f"autoplay-{number}"
+        action = ("start",)
+        for turn in range(1, args.turns + 1):
+            retries, repairs, rule_repairs = session.retries, len(session.repairs.records), sum(session.rules.repairs.values())
+            started = time.perf_counter()
+            error = ""
+            try:
+                if action[0] == "start":
+                    game = await session.astart()
+                elif action[0] == "choose":
+                    game = await session.achoose(action[1])
+                else:
+                    game = await session.ause_item(action[1], action[2])
+            except GenerationError as e:
+                error = str(e)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            latency = time.perf_counter() - started
+
+            last = session.chat.history[-1] if session.chat.history else None
+            usage = getattr(last, "usage_metadata", None)
+            rows.append({
+                "session": number,
+                "turn": turn,
+                "action": " ".join(action),
+                "latency": round(latency, 4),
+                "prompt_tokens": usage.prompt_token_count if usage and not error else None,
+                "cached_tokens": usage.cached_content_token_count or 0 if usage and not error else None,
+                "output_tokens": usage.candidates_token_count if usage and not error else None,
+                "sent_tokens": session.chat.last_compaction.get("sent_tokens") if session.chat.last_compaction else None,
+                "retries": session.retries - retries,
+                "repairs": len(session.repairs.records) - repairs,
+                "rule_repairs": sum(session.rules.repairs.values()) - rule_repairs,
+                "history": len(session.chat.history),
+                "choices": len(game.choices) if not error else 0,
+                "health": game.health if not error else None,
+                "error": error,
+            })
+            if error:
+                break
+            action = policy(game, rng)
+    return rows
+
+def summarize(rows: list[dict], elapsed: float) -> dict:
+    latencies = sorted(row["latency"] for row in rows if not row["error"])
+    def percentile(share):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * share))] if latencies else None
+    return {
+        "turns": len(rows),
+        "sessions": len({ row["session"] for row in rows }),
+        "elapsed": round(elapsed, 3),
+        "turns_per_second": round(len(rows) / elapsed, 3) if elapsed else None,
+        "latency_p50": percentile(0.5),
+        "latency_p95": percentile(0.95),
+        "prompt_tokens": sum(row["prompt_tokens"] or 0 for row in rows),
+        "cached_tokens": sum(row["cached_tokens"] or 0 for row in rows),
+        "output_tokens": sum(row["output_tokens"] or 0 for row in rows),
+        "retries": sum(row["retries"] for row in rows),
+        "repairs": sum(row["repairs"] for row in rows),
+        "rule_repairs": sum(row["rule_repairs"] for row in rows),
+        "errors": sum(1 for row in rows if row["error"]),
+    }
+
+def write_report(path: str, rows: list[dict], summary: dict):
+    if path.endswith(".csv"):
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({ "summary": summary, "turns": rows }, file, indent=1)
+
+async def run(args) -> int:
+    settings = loadSettings() or SettingsObject()
+    settings.gemini_api_key = os.environ.get("GEMINI_API_KEY", settings.gemini_api_key)
+    settings.together_api_key = os.environ.get("TOGETHER_API_KEY", settings.together_api_key)
+    if args.mode:
+        settings.response_mode = args.mode
+    chat.settings = settings
+
+    if args.stub:
+        latency = lognormal_latency(args.latency, 0.4, args.seed) if args.latency else None
+        genai_client, together_client = StubGenai(latency, args.seed, args.invalid), StubTogether()
+    else:
+        if not settings.gemini_api_key and settings.transport_mode != "replay":
+            print("No Gemini API key, set GEMINI_API_KEY, save one in the settings or use --stub.")
+            return 1
+        genai_client, together_client = make_clients(settings)
+
+    def make_session() -> GameSession:
+        if args.world:
+            return GameSession.load(args.world, genai_client, together_client, settings)
+        return GameSession.new(genai_client, together_client, settings)
+
+    policy = load_policy(args.policy)
+    limit = asyncio.Semaphore(args.parallel)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(play(number, args, make_session, policy, limit) for number in range(args.sessions)))
+    elapsed = time.perf_counter() - started
+
+    rows = [row for result in results for row in result]
+    summary = summarize(rows, elapsed)
+    if args.report:
+        write_report(args.report, rows, summary)
+    for key, value in summary.items():
+        print(f"{key:<17} {value}")
+    return 1 if summary["errors"] else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Dungeon Master sessions automatically and report on every turn.")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=20, help="turns per session, including the first")
+    parser.add_argument("--parallel", type=int, default=4, help="sessions played at once")
+    parser.add_argument("--policy", default="random", help="random, first, items, or module:function")
+    parser.add_argument("--world", help="a .dmt file to start from instead of the default prompt")
+    parser.add_argument("--mode", choices=["full", "delta"], help="response mode, the settings' by default")
+    parser.add_argument("--stub", action="store_true", help="play against a made-up model, offline")
+    parser.add_argument("--latency", type=float, default=0.0, help="median stub response time, in seconds")
+    parser.add_argument("--invalid", type=float, default=0.0, help="share of stub responses without choices")
+    parser.add_argument("--report", help="where to write every turn, .csv or .json")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,93 +1,123 @@
 from PyQt5.QtWidgets import QPushButton, QSizePolicy
-from PyQt5.QtCore import QPropertyAnimation, QRect, QTimer, pyqtProperty
-from PyQt5.QtGui import QFont, QFontDatabase
+from PyQt5.QtCore import Qt, QSize, QRectF
+from PyQt5.QtGui import QFont, QFontDatabase, QPainter, QColor, QPainterPath
+from animation import animation_clock
 import random
+import time
 
+# Menu button with a typewriter intro, a blinking cursor and a slide on hover. All of it is drawn in paintEvent
+# and driven by the shared animation clock, so a frame is a repaint rather than a restyle.
 class Button(QPushButton):
+    padding = 10
+    hover_offset = 10
+    hover_duration = 0.1
+    blink_interval = 0.5
+
+    background = QColor(0, 0, 0, int(255 * 0.2))
+    background_hover = QColor(0, 0, 0, int(255 * 0.3))
+    text_color = QColor("white")
+
     def __init__(self, text, *args, **kwargs):
         self.full_text = "> " + text.lower()
         super().__init__("", *args, **kwargs)
         self.setFixedWidth(350)
         self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
         self.setSizePolicy(QSizePolicy.Minimum, QSizePolicy.Minimum)
-        self._anim_offset = 0
-        self.animation = QPropertyAnimation(self, b"anim_offset")
-        # self.original_position = self.geometry()
-        self.update_style()
+        # set once, the font family comes from the window's stylesheet
+        self.setStyleSheet("Button { font-size: 16px; }")
+        self.setAttribute(Qt.WA_Hover)
+
+        self.hovered = False
+        self.anim_offset = 0.0
+        self.offset_from = 0.0
+        self.offset_to = 0.0
+        self.offset_started: float = None
+
+        self.clock = animation_clock()
         self.start_animation()
 
-    @pyqtProperty(int)
-    def anim_offset(self):
-        return self._anim_offset
-
-    @anim_offset.setter
-    def anim_offset(self, value):
-        self._anim_offset = value
-        self.update_style()
-
-    def update_style(self):
-        padding = 10 + self._anim_offset
-        self.setStyleSheet(f"""
-
-            Button {{
-                background-color: rgba(0,0,0,0.2);
-                color: white;
-                border: rgba(0,0,0,0);
-                border-radius: 10px;
-                padding: 10px;
-                margin-left: {padding}px;
-                font-size: 16px;
-                text-align: left;
-            }}
-
-            Button:hover {{
-                background-color:rgba(0,0,0,0.3);
-                /* padding-left: 10px; */
-            }}
-
-        """)
-    
+    def sizeHint(self) -> QSize:
+        return QSize(350, self.fontMetrics().height() + 2 * self.padding)
+
     def enterEvent(self, event):
-        # self.original_position = self.geometry()
-        self.animate_move(10)
+        self.hovered = True
+        if not self.typing():
+            self.cursor_on = True
+            self.next_blink = time.monotonic() + self.blink_interval
+        self.animate_move(self.hover_offset)
         super().enterEvent(event)
 
     def leaveEvent(self, event):
+        self.hovered = False
         self.animate_move(0)
         super().leaveEvent(event)
 
     def animate_move(self, offset):
-        self.animation.stop()
-        self.animation.setDuration(100)
-        # start = self.geometry()
-        # end = QRect(self.original_position.x() + offset, self.original_position.y(), self.original_position.width(), self.original_position.height())
-        self.animation.setStartValue(self._anim_offset)
-        self.animation.setEndValue(offset)
-        self.animation.start()
+        self.offset_from = self.anim_offset
+        self.offset_to = offset
+        self.offset_started = None
+        self.clock.schedule(self)
 
     def start_animation(self):
         self.current_index = 0
         self.done = ""
         self.setText("")
-        
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_text)
-        self.timer.start(random.randint(100,300))
 
         self.cursor_on = True
-        self.cursor_timer = QTimer(self)
-        self.cursor_timer.timeout.connect(self.toggle_cursor)
-        self.cursor_timer.start(500)
-        
-    def update_text(self):
+        now = time.monotonic()
+        self.next_char = now + random.randint(100, 300) / 1000
+        self.next_blink = now + self.blink_interval
+        self.clock.schedule(self, min(self.next_char, self.next_blink))
+
+    def typing(self) -> bool:
+        return self.current_index < len(self.full_text)
+
+    # called by the animation clock, returns when the next frame is needed (None once there's nothing to animate)
+    def tick(self, now: float) -> float | None:
+        wake = []
+
+        if self.offset_from != self.offset_to:
+            if self.offset_started is None:
+                self.offset_started = now
+            progress = min(1.0, (now - self.offset_started) / self.hover_duration)
+            self.anim_offset = self.offset_from + (self.offset_to - self.offset_from) * progress
+            if progress >= 1.0:
+                self.offset_from = self.offset_to
+            else:
+                wake.append(now + self.clock.frame_interval)
+
         if self.current_index < len(self.full_text):
-            self.done += self.full_text[self.current_index]
-            self.setText(self.done + ("_" if self.cursor_on else ""))
-            self.current_index += 1
-            self.timer.start(random.randint(100, 300))
+            if now >= self.next_char:
+                self.done += self.full_text[self.current_index]
+                self.current_index += 1
+                self.setText(self.done)
+                self.next_char = now + random.randint(100, 300) / 1000
+            if self.current_index < len(self.full_text):
+                wake.append(self.next_char)
+
+        # the cursor blinks while the text is typed out and while hovered, otherwise it's hidden so the clock can go idle
+        if self.typing() or self.hovered:
+            if now >= self.next_blink:
+                self.cursor_on = not self.cursor_on
+                self.next_blink = now + self.blink_interval
+            wake.append(self.next_blink)
         else:
-            self.timer.stop()
+            self.cursor_on = False
+
+        self.update()
+        return min(wake) if wake else None
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+
+        left = self.padding + self.anim_offset
+        box = QRectF(self.rect()).adjusted(left, 0, 0, 0)
+        path = QPainterPath()
+        path.addRoundedRect(box, 10, 10)
+        painter.fillPath(path, self.background_hover if self.underMouse() else self.background)
 
-    def toggle_cursor(self):
-        self.cursor_on = not self.cursor_on
-        self.setText(self.done + ("_" if self.cursor_on else ""))
+        painter.setFont(self.font())
+        painter.setPen(self.text_color)
+        text_box = box.adjusted(self.padding, 0, -self.padding, 0)
+        painter.drawText(text_box, Qt.AlignVCenter | Qt.AlignLeft, self.done + ("_" if self.cursor_on else ""))
@@ -1,20 +1,222 @@
 from google import genai
 from google.genai import types
 from google.genai import Client
-from gameModel import GameModel
-from typing import Union
+from gameModel import GameModel, GameDelta
+from game_state import GameState
+from typing import Callable, Union
 from settings import loadSettings
+import copy
+import asyncio
+from pydantic import ValidationError
+from tracing import span
+from context_cache import ContextCache, cache_error
 
-settings = loadSettings()
+# read on first use rather than at import, so importing this module stays cheap
+settings = None
+
+def get_settings():
+    global settings
+    if settings is None:
+        settings = loadSettings()
+    return settings
+
+summary_instruction = '''
+You are summarising an ongoing text RPG session for the Dungeon Master, so that older chapters can be dropped from its context.
+Merge the new chapters below into the existing summary. Keep names, places, NPCs, promises, unresolved threads and anything the player would expect the Dungeon Master to remember.
+Do not list inventory, stats, health or quest progress, these are tracked separately. Reply with the updated summary only, in plain text, in at most 300 words.
+'''
+
+def estimate_tokens(content: types.Content) -> int:
+    return sum(len(part.text or "") for part in content.parts or []) // 4 + 1
+
+def is_model_turn(res: Union[types.GenerateContentResponse, types.Content]) -> bool:
+    return isinstance(res, types.GenerateContentResponse) or res.role == "model"
+
+def make_response(text: str, schema=None, usage_metadata: types.GenerateContentResponseUsageMetadata=None) -> types.GenerateContentResponse:
+    res = types.GenerateContentResponse(
+        candidates = [
+            types.Candidate(
+                content = types.Content(
+                    role = "model",
+                    parts = [types.Part(text=text)],
+                ),
+            ),
+        ],
+        usage_metadata = usage_metadata,
+    )
+    # left unparsed when the text doesn't fit the schema, like the SDK does for responses that aren't streamed
+    if schema:
+        with span("parse", "parse", chars=len(text)):
+            try:
+                res.parsed = schema.model_validate_json(text)
+            except ValidationError:
+                pass
+    return res
 
 class Chat:
     def __init__(self, config: types.GenerateContentConfig, client: Client=None):
         self.history: list[Union[types.GenerateContentResponse, types.Content]] = []
-        self.model = settings.gemini_model or "gemini-flash-latest"
+        self.model = get_settings().gemini_model or "gemini-flash-latest"
         self.config = config
         self.client = client
+        self.state = GameState()
+        self.init_compaction()
+        self.init_context_cache()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "summary" not in state:
+            self.init_compaction()
+        if "context_cache" not in state:
+            self.init_context_cache()
+        if "state" not in state:
+            self.state = GameState()
+            for res in reversed(self.history):
+                if isinstance(res, types.GenerateContentResponse) and isinstance(res.parsed, GameModel):
+                    self.state.commit(res.parsed)
+                    break
+
+    def last_game(self) -> GameModel | None:
+        for res in reversed(self.history):
+            if isinstance(res, types.GenerateContentResponse) and isinstance(res.parsed, GameModel):
+                return res.parsed
+        return None
+
+    @property
+    def response_mode(self) -> str:
+        return "delta" if self.config.response_schema is GameDelta else "full"
+
+    # a copy that can be sent messages without affecting this chat's history
+    def fork(self) -> "Chat":
+        fork = copy.copy(self)
+        fork.history = list(self.history)
+        fork.compaction_stats = list(self.compaction_stats)
+        fork.state = copy.copy(self.state)
+        return fork
+
+    # older turns are folded into a running summary, only the last `keep_turns` are sent as-is
+    def init_compaction(self):
+        settings = get_settings()
+        self.keep_turns: int = getattr(settings, "history_turns", 6)
+        self.token_budget: int = getattr(settings, "history_token_budget", 8000)
+        self.summary_mode: str = getattr(settings, "summary_mode", "local")
+        self.summary: str = ""
+        self.summarized: int = 0
+        self.compaction_stats: list[dict] = []
+        self.last_compaction: dict = {}
+
+    # None when caching is turned off in the settings. Forks share it, they start with the same prefix.
+    def init_context_cache(self):
+        self.context_cache: ContextCache | None = ContextCache() if getattr(get_settings(), "context_cache", True) else None
+
+    def to_content(self, res: Union[types.GenerateContentResponse, types.Content]) -> types.Content:
+        if isinstance(res, types.GenerateContentResponse):
+            return res.candidates[0].content
+        return res
+
+    def build_contents(self) -> list[types.Content]:
+        history = [self.to_content(res) for res in self.history]
+        full_tokens = sum(estimate_tokens(content) for content in history)
+
+        cut = self.compaction_cut(history)
+        if cut > self.summarized:
+            self.fold_turns(self.summarized, cut)
+            self.summarized = cut
+
+        if self.summarized:
+            history = [self.summary_content()] + history[self.summarized:]
+
+        # deltas only make sense against the current state, so it is attached to the latest message (but not kept in history).
+        # Full responses only need it when the rules changed the last one, the model would carry on from its own numbers otherwise.
+        if (self.response_mode == "delta" or self.state.repaired(self.last_game())) and history and history[-1].role == "user":
+            history[-1] = types.Content(
+                role = "user",
+                parts = list(history[-1].parts) + [types.Part(text=f"(Current game state: {self.state.summary()})")],
+            )
+
+        sent_tokens = sum(estimate_tokens(content) for content in history)
+        self.last_compaction = {
+            "turn": sum(1 for res in self.history if is_model_turn(res)) + 1,
+            "full_tokens": full_tokens,
+            "sent_tokens": sent_tokens,
+            "saved_tokens": full_tokens - sent_tokens,
+            "prompt_tokens": None,
+            "cached_tokens": None,
+        }
+        return history
+
+    def compaction_cut(self, history: list[types.Content]) -> int:
+        if not self.keep_turns:
+            return 0
+
+        # each turn starts after the previous model response
+        starts = [0] + [idx + 1 for idx, res in enumerate(self.history) if is_model_turn(res)]
+        pending = 1 if starts[-1] < len(self.history) else 0
+        if not pending:
+            starts.pop()
+        if not starts:
+            return self.summarized
+
+        # always keep the turn in progress plus the last `keep_turns` finished ones
+        kept = min(len(starts), self.keep_turns + pending)
+        cut = starts[-kept]
+
+        while kept > 1 + pending and sum(estimate_tokens(content) for content in history[cut:]) + estimate_tokens(self.summary_content()) > self.token_budget:
+            kept -= 1
+            cut = starts[-kept]
+
+        return max(cut, self.summarized)
+
+    def fold_turns(self, start: int, end: int):
+        lines = []
+        choice = ""
+        for res in self.history[start:end]:
+            if isinstance(res, types.GenerateContentResponse) and res.parsed:
+                excerpt = res.parsed.chapterText.replace("\\n", " ").replace("\n", " ").strip()
+                if len(excerpt) > 240:
+                    excerpt = excerpt[:240].rsplit(" ", 1)[0] + "..."
+                lines.append(f"- {choice or 'Story continues'}: {excerpt}")
+                choice = ""
+            elif not is_model_turn(res):
+                choice = " ".join(part.text for part in res.parts if part.text).removeprefix("I have chosen: ").strip(". ")
+
+        if not lines:
+            return
+
+        if self.summary_mode == "model" and self.client:
+            try:
+                with span("summary", "network"):
+                    res = self.client.models.generate_content(
+                        model = self.model,
+                        config = types.GenerateContentConfig(
+                            temperature = 0.3,
+                            system_instruction = summary_instruction,
+                        ),
+                        contents = f"Existing summary:\n{self.summary or '(none)'}\n\nNew chapters:\n" + "\n".join(lines),
+                    )
+                if res.text:
+                    self.summary = res.text.strip()
+                    return
+            except Exception:
+                pass
+
+        # keep the local summary bounded too, dropping the oldest lines but never the first (character selection)
+        lines = self.summary.splitlines() + lines
+        while len(lines) > 2 and sum(len(line) for line in lines) // 4 > self.token_budget // 4:
+            lines.pop(1)
+        self.summary = "\n".join(lines)
 
-    def send_message(self, content: types.Part) -> list[types.Content]:
+    def summary_content(self) -> types.Content:
+        return types.Content(
+            role = "user",
+            parts = [
+                types.Part(
+                    text = f"(Earlier chapters have been condensed to save space.)\n\nStory so far:\n{self.summary}\n\nCurrent game state:\n{self.state.summary()}",
+                ),
+            ],
+        )
+
+    def send_message(self, content: types.Part, on_chunk: Callable[[str], None]=None) -> types.GenerateContentResponse:
         if content:
             if isinstance(content, str): content = types.Part(text=content)
             self.history.append(
@@ -24,19 +226,125 @@ class Chat:
                 ),
             )
         if self.client:
-            history = []
-            for res in self.history:
-                if isinstance(res, types.GenerateContentResponse):
-                    history.append(res.candidates[0].content)
-                else:
-                    history.append(res)
-
-            res = self.client.models.generate_content(
-                model = self.model,
-                config = self.config,
-                contents = history,
-            )
+            with span("build_contents", "prompt", history=len(self.history)):
+                contents = self.build_contents()
+            config, sent = self.config, contents
+            if self.context_cache:
+                with span("context_cache", "network"):
+                    config, sent = self.context_cache.prepare(self.client, self.model, self.config, contents)
+            with span("gemini", "network", stream=bool(on_chunk), cached=config is not self.config):
+                try:
+                    res = self.generate(config, sent, on_chunk)
+                except Exception as e:
+                    # the cache expired or was deleted under us, send the whole prompt instead
+                    if config is self.config or not cache_error(e):
+                        raise
+                    self.context_cache.failed(self.model)
+                    res = self.generate(self.config, contents, on_chunk)
+            self.record_usage(res)
+            self.compaction_stats.append(self.last_compaction)
             self.history.append(res)
             return res
         else:
-            raise RuntimeError("Client not set.")
\ No newline at end of file
+            raise RuntimeError("Client not set.")
+
+    def generate(self, config: types.GenerateContentConfig, contents: list[types.Content], on_chunk: Callable[[str], None]=None) -> types.GenerateContentResponse:
+        if on_chunk:
+            return self.stream_response(contents, on_chunk, config)
+        return self.client.models.generate_content(
+            model = self.model,
+            config = config,
+            contents = contents,
+        )
+
+    def record_usage(self, res: types.GenerateContentResponse):
+        if res.usage_metadata:
+            self.last_compaction["prompt_tokens"] = res.usage_metadata.prompt_token_count
+            self.last_compaction["cached_tokens"] = res.usage_metadata.cached_content_token_count or 0
+
+    def stream_response(self, contents: list[types.Content], on_chunk: Callable[[str], None], config: types.GenerateContentConfig = None) -> types.GenerateContentResponse:
+        text = ""
+        usage_metadata = None
+        for chunk in self.client.models.generate_content_stream(
+            model = self.model,
+            config = config or self.config,
+            contents = contents,
+        ):
+            usage_metadata = chunk.usage_metadata or usage_metadata
+            if chunk.text:
+                text += chunk.text
+                on_chunk(chunk.text)
+
+        return make_response(text, self.config.response_schema, usage_metadata)
+
+    # same as send_message, on the async client (client.aio). If the request is cancelled, the message is taken back
+    # out of the history so the chat is left as it was.
+    async def send_message_async(self, content: types.Part, on_chunk: Callable[[str], None]=None) -> types.GenerateContentResponse:
+        if not self.client:
+            raise RuntimeError("Client not set.")
+
+        appended = False
+        if content:
+            if isinstance(content, str): content = types.Part(text=content)
+            self.history.append(
+                types.Content(
+                    role="user",
+                    parts=[content],
+                ),
+            )
+            appended = True
+
+        try:
+            with span("build_contents", "prompt", history=len(self.history)):
+                if self.summary_mode == "model":
+                    # may make a (blocking) summary request
+                    contents = await asyncio.to_thread(self.build_contents)
+                else:
+                    contents = self.build_contents()
+
+            config, sent = self.config, contents
+            if self.context_cache:
+                with span("context_cache", "network"):
+                    config, sent = await self.context_cache.aprepare(self.client, self.model, self.config, contents)
+
+            with span("gemini", "network", stream=bool(on_chunk), cached=config is not self.config):
+                try:
+                    res = await self.agenerate(config, sent, on_chunk)
+                except Exception as e:
+                    if config is self.config or not cache_error(e):
+                        raise
+                    self.context_cache.failed(self.model)
+                    res = await self.agenerate(self.config, contents, on_chunk)
+        except asyncio.CancelledError:
+            if appended:
+                self.history.pop()
+            raise
+
+        self.record_usage(res)
+        self.compaction_stats.append(self.last_compaction)
+        self.history.append(res)
+        return res
+
+    async def agenerate(self, config: types.GenerateContentConfig, contents: list[types.Content], on_chunk: Callable[[str], None]=None) -> types.GenerateContentResponse:
+        if on_chunk:
+            return await self.stream_response_async(contents, on_chunk, config)
+        return await self.client.aio.models.generate_content(
+            model = self.model,
+            config = config,
+            contents = contents,
+        )
+
+    async def stream_response_async(self, contents: list[types.Content], on_chunk: Callable[[str], None], config: types.GenerateContentConfig = None) -> types.GenerateContentResponse:
+        text = ""
+        usage_metadata = None
+        async for chunk in await self.client.aio.models.generate_content_stream(
+            model = self.model,
+            config = config or self.config,
+            contents = contents,
+        ):
+            usage_metadata = chunk.usage_metadata or usage_metadata
+            if chunk.text:
+                text += chunk.text
+                on_chunk(chunk.text)
+
+        return make_response(text, self.config.response_schema, usage_metadata)
@@ -0,0 +1,230 @@
+import time
+import hashlib
+import threading
+from google.genai import types, errors
+import metrics
+
+# Explicit Gemini context caching for what every request starts with: the system instruction (the whole world, for
+# a DMT) and the part of the history that's the same as in the last request. The cache is created once and reused
+# for as long as that prefix doesn't change, and the cached tokens are billed at the cached rate.
+#
+# A different prefix (another world, the response mode switched, compaction rewriting the start of the history)
+# creates a new cache and deletes the old one. The TTL is extended when the cache is used with less than half of it
+# left. Requests go out uncached, as before, when the client can't cache (the replay transport), when the prefix is
+# below the model's minimum, or after the API has refused to create caches max_failures times in a row.
+
+def estimate_tokens(contents: list[types.Content]) -> int:
+    return sum(len(part.text or "") for content in contents for part in content.parts or []) // 4
+
+def common_prefix(a: list, b: list) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+# expired or deleted caches (and the cache refused for the request) come back as these, anything else is a real error
+def cache_error(error: Exception) -> bool:
+    if not isinstance(error, errors.ClientError) or error.code not in (400, 403, 404):
+        return False
+    message = (error.message or "").lower().replace("_", "").replace(" ", "")
+    return "cachedcontent" in message
+
+class ContextCache:
+    # the smallest cache the API accepts, by estimate. Pro models need more.
+    min_tokens = 1024
+    min_tokens_pro = 4096
+    # the history is added to the cache once at least this much more of it would be reused
+    grow_tokens = 2048
+    max_failures = 3
+
+    def __init__(self, ttl: int = 1800):
+        self.ttl = ttl
+        self.name: str = None
+        self.key: str = None
+        self.contents: list[types.Content] = []
+        self.expires = 0.0
+        self.previous: list[types.Content] = []
+        self.failures = 0
+        # speculative forks share the cache and send from other threads: the lock guards the state above and is
+        # never held over a request. One request at a time creates or refreshes (busy), the others use what's there.
+        self.lock = threading.RLock()
+        self.busy = False
+
+    # a pickled Chat (a .dmt, or a session saved before the JSON-lines .dms journal) keeps the settings, not the handle
+    def __getstate__(self):
+        return { "ttl": self.ttl }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @staticmethod
+    def prefix_key(model: str, config: types.GenerateContentConfig) -> str:
+        return hashlib.sha256(f"{model}\n{config.system_instruction}".encode("utf-8")).hexdigest()
+
+    def usable(self, client, config: types.GenerateContentConfig) -> bool:
+        return self.failures < self.max_failures and bool(config.system_instruction) and hasattr(client, "caches")
+
+    # what should be cached for this request: the current cache's contents while they're still at the start, more of
+    # the history once enough of it has stayed the same, or None if it's all too small to cache
+    def plan(self, model: str, config: types.GenerateContentConfig, contents: list[types.Content]) -> list[types.Content] | None:
+        with self.lock:
+            stable = common_prefix(self.previous, contents[:-1])
+            self.previous = contents
+
+            prefix = []
+            if self.key == self.prefix_key(model, config) and self.contents == contents[:len(self.contents)] and len(self.contents) <= stable:
+                prefix = self.contents
+            if estimate_tokens(contents[len(prefix):stable]) >= self.grow_tokens:
+                prefix = contents[:stable]
+
+        minimum = self.min_tokens_pro if "pro" in model else self.min_tokens
+        if len(config.system_instruction) // 4 + estimate_tokens(prefix) < minimum:
+            return None
+        return prefix
+
+    def current(self, model: str, config: types.GenerateContentConfig, prefix: list[types.Content]) -> bool:
+        with self.lock:
+            return self.name is not None and self.key == self.prefix_key(model, config) and self.contents is prefix
+
+    def expiring(self) -> bool:
+        return self.expires - time.time() < self.ttl / 2
+
+    # what this request should do about the cache: "create" (deleting the old one), "release", "refresh" or None,
+    # the prefix to cache and the cache's name. None while another request is already at it.
+    def claim(self, model: str, config: types.GenerateContentConfig, contents: list[types.Content]) -> tuple[str | None, list[types.Content] | None, str | None]:
+        with self.lock:
+            if self.busy:
+                return None, None, None
+            prefix = self.plan(model, config, contents)
+            if prefix is None:
+                action = "release" if self.name else None
+            elif not self.current(model, config, prefix):
+                action = "create"
+            elif self.expiring():
+                action = "refresh"
+            else:
+                action = None
+            self.busy = action is not None
+            return action, prefix, self.name
+
+    def done(self):
+        with self.lock:
+            self.busy = False
+
+    def create_config(self, config: types.GenerateContentConfig, prefix: list[types.Content]) -> types.CreateCachedContentConfig:
+        return types.CreateCachedContentConfig(
+            system_instruction = config.system_instruction,
+            contents = prefix or None,
+            ttl = f"{self.ttl}s",
+            display_name = "dungeon-master",
+        )
+
+    def created(self, cache: types.CachedContent, model: str, config: types.GenerateContentConfig, prefix: list[types.Content]):
+        with self.lock:
+            self.name = cache.name
+            self.key = self.prefix_key(model, config)
+            self.contents = prefix
+            self.expires = time.time() + self.ttl
+            self.failures = 0
+        metrics.context_cache.inc(model=model, operation="create")
+
+    def refreshed(self, model: str, name: str):
+        with self.lock:
+            if self.name == name:
+                self.expires = time.time() + self.ttl
+        metrics.context_cache.inc(model=model, operation="refresh")
+
+    def failed(self, model: str):
+        with self.lock:
+            self.forget()
+            self.failures += 1
+        metrics.context_cache.inc(model=model, operation="failed")
+
+    def forget(self):
+        with self.lock:
+            self.name = None
+            self.key = None
+            self.contents = []
+
+    # the name of the cache, forgotten so nothing sends with it any more
+    def take(self) -> str | None:
+        with self.lock:
+            name = self.name
+            self.forget()
+            return name
+
+    # the config and contents to send, from the cache if there's one for this request
+    def apply(self, model: str, config: types.GenerateContentConfig, contents: list[types.Content]) -> tuple[types.GenerateContentConfig, list[types.Content]]:
+        with self.lock:
+            name, key, prefix, expires = self.name, self.key, self.contents, self.expires
+        cached = len(prefix)
+        if (name is None or key != self.prefix_key(model, config) or cached >= len(contents)
+                or contents[:cached] != prefix or time.time() > expires):
+            return config, contents
+        return config.model_copy(update={ "system_instruction": None, "cached_content": name }), contents[cached:]
+
+    def prepare(self, client, model: str, config: types.GenerateContentConfig, contents: list[types.Content]) -> tuple[types.GenerateContentConfig, list[types.Content]]:
+        if not self.usable(client, config):
+            return config, contents
+        action, prefix, name = self.claim(model, config, contents)
+        try:
+            if action in ("create", "release"):
+                self.release(client)
+            if action == "create":
+                try:
+                    self.created(client.caches.create(model=model, config=self.create_config(config, prefix)), model, config, prefix)
+                except Exception:
+                    self.failed(model)
+            elif action == "refresh":
+                try:
+                    client.caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s"))
+                    self.refreshed(model, name)
+                except Exception:
+                    self.forget()
+        finally:
+            if action:
+                self.done()
+        return self.apply(model, config, contents)
+
+    # same as prepare, on client.aio
+    async def aprepare(self, client, model: str, config: types.GenerateContentConfig, contents: list[types.Content]) -> tuple[types.GenerateContentConfig, list[types.Content]]:
+        if not self.usable(client, config):
+            return config, contents
+        action, prefix, name = self.claim(model, config, contents)
+        try:
+            if action in ("create", "release"):
+                await self.arelease(client)
+            if action == "create":
+                try:
+                    self.created(await client.aio.caches.create(model=model, config=self.create_config(config, prefix)), model, config, prefix)
+                except Exception:
+                    self.failed(model)
+            elif action == "refresh":
+                try:
+                    await client.aio.caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s"))
+                    self.refreshed(model, name)
+                except Exception:
+                    self.forget()
+        finally:
+            if action:
+                self.done()
+        return self.apply(model, config, contents)
+
+    # deletes the cache, if there is one. A cache that can't be deleted expires with its TTL.
+    def release(self, client):
+        name = self.take()
+        if name:
+            try:
+                client.caches.delete(name=name)
+            except Exception:
+                pass
+
+    async def arelease(self, client):
+        name = self.take()
+        if name:
+            try:
+                await client.aio.caches.delete(name=name)
+            except Exception:
+                pass
@@ -1,6 +1,6 @@
 import sys
-import json
-import time
+import asyncio
+import threading
 from PyQt5.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -11,85 +11,57 @@ from PyQt5.QtWidgets import (
     QLabel,
     QHBoxLayout,
     QTextEdit,
-    QListWidget,
-    QListWidgetItem,
     QSplitter,
     QFileDialog,
     QSpacerItem,
     QSizePolicy,
     QMessageBox,
     QCheckBox,
+    QShortcut,
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtGui import QTextCursor, QFont, QPixmap, QImage, QTextOption, QIcon
-from PIL import Image
-from style import init_window, AutoResizingLabel
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QTextCursor, QFont, QPixmap, QImage, QTextOption, QKeySequence
+from style import init_window
 from settings import loadSettings
-from google import genai
 from google.genai import types
-from pydantic import BaseModel
-import pickle
-import together, base64
-from io import BytesIO
-from generate_dmt import system_instruction
-from chat import Chat
+import together
 from gameModel import GameModel
-
-class GenerateThread(QThread):
-    result_ready = pyqtSignal(GameModel)
-
-    def __init__(self, chat, message: types.Part):
-        super().__init__()
-        self.chat = chat
-        self.message = message
-
-    def run(self):
-        res = self.chat.send_message(content=self.message)
-        data = res.parsed
-        self.result_ready.emit(data)
-
-class ImageThread(QThread):
-    result_ready = pyqtSignal(object)
-
-    def __init__(self, client: together.client.Client, imagePrompt):
-        super().__init__()
-        self.image_prompt = imagePrompt
-        self.client = client
-    
-    def run(self):
-        runs = 0
-        res = None
-        while runs < 3:
-            try:
-                runs += 1
-                res = self.client.images.generate(
-                    prompt = self.image_prompt,
-                    model = "black-forest-labs/FLUX.1-schnell-Free",
-                    width = 1024,
-                    height = 768,
-                    steps = 2,
-                    n = 1,
-                    response_format = "b64_json",
-                )
-                break
-            except:
-                pass
-        
-        if not runs:
-            res
-
-        image = Image.open(BytesIO(base64.b64decode(res.data[0].b64_json)))
-        self.result_ready.emit(image)
-
+from session import GameSession, choice_message, item_message, fetch_image
+from speculation import Speculator
+from image_cache import ImageCache, get_image_cache
+from image_pipeline import ImagePresenter, prepare_image
+from inventory_view import InventoryView
+from save_writer import SaveWriter
+from transport import make_clients
+from tasks import Task
+from session_library import SessionIndex, save_thumbnail, session_entry
+import tracing
+from tracing import span, traced
+import metrics
+
+# runs on the task pool's executor, so the UI thread only has to turn the result into a pixmap
+def load_image(client, image_prompt: str, cache: ImageCache, max_size: tuple[int, int], session: str = "") -> QImage | None:
+    image = fetch_image(client, image_prompt, cache, session=session)
+    if not image:
+        return None
+    with span("prepare_image", "image"):
+        return prepare_image(image, max_size)
 
 class GameWindow(QMainWindow):
-    def __init__(self, main_window: QMainWindow, file=None):
+    # deadlines for a whole turn (including any retries) and for one image
+    generate_timeout = 180.0
+    image_timeout = 90.0
+    # milliseconds, how often the expensive part of a resize can run while the window is being dragged
+    relayout_interval = 50
+
+    def __init__(self, main_window: QMainWindow, file=None, preview: dict=None):
         super().__init__()
         self.setWindowTitle("Dungeon Master")
         self.setGeometry(100, 100, 1366, 768)
         self.message_history = []
 
         self.file = file
+        self.preview = preview
 
         self.main_window = main_window
 
@@ -106,7 +78,8 @@ class GameWindow(QMainWindow):
 
         self.inventory_layout = QVBoxLayout()
         self.inventory_label = QLabel("Inventory:")
-        self.inventory_list = QListWidget()
+        self.inventory_list = InventoryView()
+        self.inventory_list.option_clicked.connect(self.use_item)
         self.inventory_list.setFont(self.font)
         self.inventory_label.setFont(self.font)
         self.inventory_layout.addWidget(self.inventory_label)
@@ -135,7 +108,15 @@ class GameWindow(QMainWindow):
         self.save_button.clicked.connect(self.save_game)
         self.inventory_layout.addWidget(self.save_button)
 
-        self.autosave_location = None
+        self.session: GameSession = None
+        self.session_index = None
+        self.generate_task: Task = None
+        self.image_task: Task = None
+        self.load_task: Task = None
+        self.save_writer = SaveWriter()
+        self.save_writer.saved.connect(self.game_saved)
+        self.save_writer.failed.connect(self.save_failed)
+        self.save_writer.start()
         self.autosave_toggle = QCheckBox()
         self.autosave_toggle.setTristate(False)
         self.autosave_toggle.setText("Autosave")
@@ -187,6 +168,14 @@ class GameWindow(QMainWindow):
 
         self.game_layout.addWidget(self.status_widget)
 
+        self.relayout_timer = QTimer(self)
+        self.relayout_timer.setSingleShot(True)
+        self.relayout_timer.setInterval(self.relayout_interval)
+        self.relayout_timer.timeout.connect(self.relayout)
+        self.response_box_height = None
+        self.scaled_font_size = None
+        self.image_box = None
+
         self.response_box = QTextEdit()
         self.response_box.setReadOnly(True)
         self.response_box.setAcceptRichText(True)
@@ -194,15 +183,16 @@ class GameWindow(QMainWindow):
         self.response_box.setMaximumHeight(int(self.height() * 0.4))
         self.response_box.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.MinimumExpanding)
         self.response_box.setWordWrapMode(QTextOption.WordWrap)
-        self.response_box.textChanged.connect(self.adjust_response_box_height)
+        self.response_box.textChanged.connect(self.schedule_relayout)
 
         self.chapter_layout = QVBoxLayout()
         self.chapter_layout.addWidget(self.response_box)
 
-        self.image_label = AutoResizingLabel()
+        self.image_label = QLabel()
         self.image_label.setAlignment(Qt.AlignCenter)
         self.image_label.setFixedSize(400, 300)
         self.image_label.setText("Loading Image...")
+        self.image_presenter = ImagePresenter()
         # self.image_label.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Expanding)
 
         self.image_layout = QHBoxLayout()
@@ -230,17 +220,20 @@ class GameWindow(QMainWindow):
 
         init_window(self)
 
-        self.init_game()
+        QShortcut(QKeySequence("Ctrl+Shift+T"), self, self.toggle_trace)
+        self.show_tracing()
 
-    def set_window_icon(self):
-        pixmap = QPixmap("assets/icon.png")
-        self.setWindowIcon(QIcon(pixmap))
-        pixmap = QPixmap("assets/background.jpeg")
-        self.background = QLabel(self)
-        self.background.setPixmap(pixmap)
-        self.background.setGeometry(self.rect())
-        self.background.setScaledContents(True)
-        self.background.lower()
+        # Ctrl+Shift+M, this session's numbers from metrics.py over the top left of the game
+        self.metrics_overlay = QLabel(self)
+        self.metrics_overlay.setStyleSheet("background-color: rgba(0, 0, 0, 180); color: white; padding: 8px;")
+        self.metrics_overlay.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.metrics_overlay.hide()
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.setInterval(1000)
+        self.metrics_timer.timeout.connect(self.refresh_metrics)
+        QShortcut(QKeySequence("Ctrl+Shift+M"), self, self.toggle_metrics)
+
+        self.init_game()
 
     # ai code incoming
 
@@ -248,129 +241,176 @@ class GameWindow(QMainWindow):
         doc_height = self.response_box.document().size().height() - 50
         max_height = self.response_box.maximumHeight()
         new_height = int(min(doc_height, max_height, 20))
-        self.response_box.setFixedHeight(new_height)
+        if new_height != self.response_box_height:
+            self.response_box_height = new_height
+            self.response_box.setFixedHeight(new_height)
 
+    # Only geometry here, it runs for every resize event. Fonts, the image and the response box (which has to
+    # lay out the whole chapter to measure it) are left to relayout, at most once per relayout_interval.
     def resizeEvent(self, event):
         super().resizeEvent(event)
 
         self.response_box.setMaximumHeight(int(self.height() * 0.4))
+        self.game_widget.setFixedWidth(int(self.width() * 0.6))
+        self.background.setGeometry(self.rect())
+
+        self.schedule_relayout()
+
+    def schedule_relayout(self):
+        if not self.relayout_timer.isActive():
+            self.relayout_timer.start()
+
+    @traced("relayout", "ui")
+    def relayout(self):
         self.adjust_response_box_height()
-    
+
         width_factor = self.width() / 1920
         height_factor = self.height() / 1080
         scale_factor = min(width_factor, height_factor)
-    
-        new_font_size = max(8, int(8 * scale_factor))
-    
-        font = QFont()
-        font.setPointSize(new_font_size)
-        for button in self.choice_buttons:
-            button.setFont(font)
-        self.health_bar.setFont(font)
-        for label in self.stats_labels.values():
-            label.setFont(font)
-
 
-        game_width = int(self.width() * 0.6)
-        self.game_widget.setFixedWidth(game_width)
-        
-        self.image_label.setFixedSize(int(400 * width_factor), int(300 * height_factor))
-        self.display_image()
-
-        self.background.setGeometry(self.rect())
+        new_font_size = max(8, int(8 * scale_factor))
+        if new_font_size != self.scaled_font_size:
+            self.scaled_font_size = new_font_size
+            font = QFont()
+            font.setPointSize(new_font_size)
+            for button in self.choice_buttons:
+                button.setFont(font)
+            self.health_bar.setFont(font)
+            for label in self.stats_labels.values():
+                label.setFont(font)
+
+        image_box = (int(400 * width_factor), int(300 * height_factor))
+        if image_box != self.image_box:
+            self.image_box = image_box
+            self.image_label.setFixedSize(*image_box)
+            self.display_image()
 
     # end of ai code
 
     def init_game(self):
         self.settings = loadSettings()
-        self.genaiClient = genai.Client(api_key=self.settings.gemini_api_key)
-        self.togetherClient = together.Together(api_key=self.settings.together_api_key)
+        self.genaiClient, self.togetherClient = make_clients(self.settings)
+        self.image_cache = get_image_cache(self.settings.image_cache_mb * 1024 * 1024)
+
+        self.speculator = None
+        if self.settings.speculative:
+            self.speculator = Speculator(
+                max_concurrent = self.settings.speculative_concurrency,
+                token_budget = self.settings.speculative_token_budget,
+                timeout = self.generate_timeout,
+                stream = self.settings.stream_responses,
+            )
         
         if self.file:
             self.load_game()
         else:
-            self.chat = Chat(
-                config = types.GenerateContentConfig(
-                    temperature = 2.0,
-                    response_mime_type = "application/json",
-                    response_schema = GameModel,
-                    system_instruction = system_instruction,
-                ),
-                client = self.genaiClient,
-            )
-            self.start_generate_thread("...")
+            self.set_session(GameSession.new(self.genaiClient, self.togetherClient, self.settings, image_cache=self.image_cache))
+            self.start_generation("...")
+
+    def set_session(self, session: GameSession):
+        self.session = session
+        self.session.writer = self.save_writer
 
-    def start_generate_thread(self, message=None):
+    # replaces (and cancels) whatever was being generated before
+    def start_generation(self, message=None):
         self.response_box.setMarkdown("# Loading...")
-        self.resizeEvent(None)
-        if not hasattr(self.chat, "client"):
-            self.chat.client = self.genaiClient
-        self.generate_thread = GenerateThread(self.chat, message)
-        self.generate_thread.result_ready.connect(self.update_game)
-        self.generate_thread.start()
-
-    def regenerate_response(self, message):
-        self.response_box.setMarkdown("## Hold on, something went wrong.\n\n### We're trying to fix it, please wait a moment.\n`Technical Details: {message}`")
-        message = types.Part(text=f"Please regenerate your response. What you need to fix: {message}")
-        self.start_generate_thread(message)
+        self.schedule_relayout()
+        if self.generate_task:
+            self.generate_task.cancel()
+
+        task = Task()
+        callbacks = { "on_retry": task.later(task.retrying) }
+        if self.settings.stream_responses:
+            callbacks["on_text"] = task.later(task.text_ready)
+            callbacks["on_field"] = task.later(task.field_ready)
+        self.follow_generation(task)
+        task.start(self.session.asend(message, **callbacks), self.generate_timeout)
+
+    # saving is off until the turn is done: the session's history is being changed on the loop thread meanwhile
+    def follow_generation(self, task: Task):
+        self.generate_task = task
+        self.save_button.setEnabled(False)
+        task.result_ready.connect(self.update_game)
+        task.failed.connect(self.generation_failed)
+        task.text_ready.connect(self.update_chapter_text)
+        task.field_ready.connect(self.update_field)
+        task.retrying.connect(self.show_retry)
+
+    def show_retry(self, message):
+        self.response_box.setMarkdown(f"## Hold on, something went wrong.\n\n### We're trying to fix it, please wait a moment.\n`Technical Details: {message}`")
+
+    def generation_failed(self, message):
+        self.response_box.setMarkdown(f"## Sorry, something went wrong.\n\n### Pick a choice to try again.\n`Technical Details: {message}`")
+        self.update_choices(self.session.game.choices)
+        self.save_button.setEnabled(True)
     
+    @traced("update_game", "ui")
     def update_game(self, game: GameModel):
-        
-        if len(game.choices) == 0:
-            self.regenerate_response(f"Choices are empty")
-            return
-        
-        if self.autosave_toggle.isEnabled() and self.autosave_location:
-            self.save_game(self.autosave_location)
+        self.save_button.setEnabled(True)
+        if self.autosave_toggle.isEnabled() and self.session.path:
+            self.autosave_toggle.setText("Autosave - Saving...")
+            self.session.save_turn()
+            self.update_library(self.session.path)
 
-        chapter_text = game.chapterText.replace("\\n", "\n")
-        self.response_box.setMarkdown(chapter_text)
+        self.show_game(game)
+        self.status_widget.setToolTip(self.session.rules.report() + "\n" + self.session.repairs.report())
+
+        if self.speculator:
+            self.speculator.start(self.session, game.choices)
+
+    def show_game(self, game: GameModel, enabled: bool = True):
+        self.update_chapter_text(game.chapterText)
         self.response_box.moveCursor(QTextCursor.Start)
-        self.resizeEvent(None)
+        self.schedule_relayout()
 
-        self.health_bar.setMaximum(game.maxHealth)
-        self.health_bar.setValue(game.health)
+        self.update_health(game.health, game.maxHealth)
+        self.update_stats(game.stats)
+        self.update_inventory(game.inventory)
+        self.update_quest(game.currentQuest)
+        self.update_choices(game.choices, enabled)
+        
+        self.image_prompt = game.imagePrompt
+        if self.image_prompt:
+            self.start_image_request(self.image_prompt)
+
+    # fields from a streamed response, shown as soon as each one is complete
+    def update_field(self, name, value):
+        if name == "stats":
+            self.update_stats(value)
+        elif name == "inventory":
+            self.update_inventory(value)
+        elif name == "currentQuest":
+            self.update_quest(value)
+        elif name == "choices":
+            self.update_choices(value, enabled=False)
+        elif name == "maxHealth":
+            self.health_bar.setMaximum(value)
+        elif name == "health":
+            self.health_bar.setValue(min(value, self.health_bar.maximum()))
+
+    def update_chapter_text(self, text):
+        chapter_text = text.replace("\\n", "\n")
+        self.response_box.setMarkdown(chapter_text)
 
+    def update_health(self, health, max_health):
+        self.health_bar.setMaximum(max_health)
+        self.health_bar.setValue(health)
 
-        stats = game.stats
+    def update_stats(self, stats: GameModel.Stats):
         for stat_name, value in vars(stats).items():
             key = stat_name.lower()
             if key in self.stats_labels:
                 self.stats_labels[key].setText(f"{stat_name.capitalize()}: {value}")
 
-        self.inventory_list.clear()
-        inventory = game.inventory
-        for item in inventory:
-            item_listwidget = QListWidgetItem(self.inventory_list)
-            item_widget = QWidget()
-            item_widget.setFixedHeight(60)
-            layout = QHBoxLayout()
-            label = QLabel(item.name)
-            label.setProperty("labelType", "inventory")
-            label_layout = QHBoxLayout()
-            label_layout.addWidget(label)
-            label_layout.addStretch()
-            layout.addLayout(label_layout)
-
-            button_layout = QHBoxLayout()
-            button_layout.addStretch()
-            for option in item.options:
-                button = QPushButton(option)
-                button.setProperty("buttonType", "inventory")
-                button.setFixedHeight(30)
-                button.clicked.connect(lambda _, item_name=item.name, option=option: self.use_item(item_name, option))
-                button_layout.addWidget(button)
-
-            layout.addLayout(button_layout)
-            item_widget.setLayout(layout)
-            item_listwidget.setSizeHint(item_widget.sizeHint())
-            self.inventory_list.setItemWidget(item_listwidget, item_widget)
-
-        self.quest_title.setText(game.currentQuest.title)
-        self.quest_description.setMarkdown(game.currentQuest.description)
-        self.quest_progress.setValue(game.currentQuest.completed_percentage)
-
-        choices = game.choices
+    def update_inventory(self, inventory: list[GameModel.InventoryItem]):
+        self.inventory_list.set_items(inventory)
+
+    def update_quest(self, quest: GameModel.Quest):
+        self.quest_title.setText(quest.title)
+        self.quest_description.setMarkdown(quest.description)
+        self.quest_progress.setValue(quest.completed_percentage)
+
+    def update_choices(self, choices: list[GameModel.GameChoice], enabled: bool = True):
         for idx, button in enumerate(self.choice_buttons):
             try:
                 choice_text = choices[idx].text
@@ -379,108 +419,207 @@ class GameWindow(QMainWindow):
 
             if choice_text:
                 button.setText(choice_text)
-                button.setEnabled(True)
+                button.setEnabled(enabled)
                 button.show()
             else:
                 button.hide()
-        
-        self.image_prompt = game.imagePrompt
-        if self.image_prompt:
-            self.start_image_thread(self.image_prompt)
-    
-    def start_image_thread(self, image_prompt):
+
+    def start_image_request(self, image_prompt):
         self.image_label.setText("Loading Image...")
-        self.image_thread = ImageThread(self.togetherClient, image_prompt)
-        self.image_thread.result_ready.connect(self.display_image)
-        self.image = None
-        self.image_thread.start()
+        if self.image_task:
+            self.image_task.cancel()
+        self.image_task = Task()
+        self.image_task.result_ready.connect(self.image_loaded)
+        self.image_task.failed.connect(self.image_failed)
+        self.image_presenter.clear()
+        self.image_task.start(asyncio.to_thread(load_image, self.togetherClient, image_prompt, self.image_cache, self.max_image_size(), self.session.name if self.session else ""), self.image_timeout)
+
+    # the biggest the image label can get (see resizeEvent), no point keeping more pixels than that
+    def max_image_size(self):
+        geom = self.screen().availableGeometry()
+        width, height = max(geom.width(), self.width()), max(geom.height(), self.height())
+        ratio = self.devicePixelRatioF()
+        return (int(400 * width / 1920 * ratio), int(300 * height / 1080 * ratio))
+
+    # None when there's no image service, or it didn't return an image after its retries
+    def image_loaded(self, image: QImage | None):
+        if image is None:
+            self.image_failed("No image was returned.")
+        else:
+            self.display_image(image)
 
-    def display_image(self, pil_image=None):
-        if not hasattr(self, "image") and not pil_image:
-            return
-        
-        if self.image == None and not pil_image:
-            return
-        
-        if not pil_image and hasattr(self, "image") and self.image:
-            pil_image = self.image
-
-        if not hasattr(self, "image"):
-            self.image = pil_image
-        
-        self.image_label.setText("")
+    def image_failed(self, message):
+        self.image_presenter.clear()
+        self.image_label.setPixmap(QPixmap())
+        self.image_label.setText("Image unavailable")
+        self.image_label.setToolTip(f"{self.image_prompt}\n\n{message}")
 
+    @traced("display_image", "ui")
+    def display_image(self, image: QImage = None):
+        if image is not None:
+            self.image_presenter.set_image(image)
 
+        pixmap = self.image_presenter.pixmap_for(self.image_label.size())
+        if pixmap is None:
+            return
 
-        pil_image = pil_image.convert("RGBA")
-        data = pil_image.tobytes("raw", "RGBA")
-        qimage = QImage(data, pil_image.width, pil_image.height, QImage.Format_RGBA8888)
-        pixmap = QPixmap.fromImage(qimage)
-        scaled = pixmap.scaled(self.image_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        self.image_label.setPixmap(scaled)
+        self.image_label.setText("")
+        self.image_label.setPixmap(pixmap)
         self.image_label.setToolTip(self.image_prompt)
 
     def use_item(self, item_name, option):
-        choice = f"Use item '{item_name}' - Option '{option}'"
-        message = types.Part(
-            text = choice
-        )
+        choice = item_message(item_name, option)
         self.response_box.setMarkdown("# Loading...")
         for button in self.choice_buttons:
             button.setEnabled(False)
 
-        self.start_generate_thread(message)
+        # an item is never one of the speculated choices, so this isn't a miss
+        if self.speculator:
+            self.speculator.discard()
+        self.start_generation(choice)
         
     def handle_choice(self):
         sender = self.sender()
-        choice_text = sender.text()
-
-        message = types.Part(
-            text = f"I have chosen: {choice_text}",
-        )
+        choice = choice_message(sender.text())
 
         self.response_box.setMarkdown("# Loading...")
 
         for button in self.choice_buttons:
             button.setEnabled(False)
 
-        self.start_generate_thread(message)
+        branch = self.speculator.take(choice) if self.speculator else None
+        if branch:
+            self.session.adopt(branch.session)
+            if self.generate_task:
+                self.generate_task.cancel()
+            if branch.result:
+                self.update_game(branch.result)
+            else:
+                branch.replay(self.update_chapter_text, self.update_field)
+                self.follow_generation(branch.task)
+            return
+
+        self.start_generation(choice)
 
-    def save_game(self, saveLocation=None):
-        if not saveLocation and not self.autosave_location:
+    def save_game(self):
+        if not self.session.path:
             options = QFileDialog.Options()
             file_name, _ = QFileDialog.getSaveFileName(self, "Save Game", "", "Dungeon Master Session Files (*.dms)", options=options)
-            if file_name:
-                clean_chat = self.chat
-                clean_chat.client = None
-                with open(file_name, "wb") as file:
-                    pickle.dump(clean_chat, file)
-            self.autosave_location = file_name
+            if not file_name:
+                return
+            self.session.save(file_name)
+            self.update_library(file_name)
             self.autosave_toggle.setDisabled(False)
             self.autosave_toggle.setToolTip("")
         else:
             self.autosave_toggle.setText("Autosave - Saving...")
-            with open(saveLocation or self.autosave_location, "wb") as file:
-                pickle.dump(self.chat, file)
-            self.autosave_toggle.setText("Autosave - Saved!")
+            self.session.save_turn()
+            self.update_library(self.session.path)
 
-    def load_game(self):
-        if self.file:
-            self.autosave_location = self.file
-            with open(self.file, "rb") as file:
-                self.chat = pickle.load(file)
+    def game_saved(self, path, seconds):
+        if not self.session or path != self.session.path:
+            return
+        self.autosave_toggle.setText("Autosave - Saved!")
+        self.autosave_toggle.setToolTip("")
 
-            self.chat.client = self.genaiClient
+    def save_failed(self, path, error):
+        self.autosave_toggle.setText("Autosave - Failed!")
+        self.autosave_toggle.setToolTip(f"Could not save to {path}: {error}")
 
-            if isinstance(self.chat.history[-1], types.Content):
-                self.start_generate_thread()
+    def load_game(self):
+        if self.file:
+            # show the last state from the library index straight away, the full history loads in the background
+            if self.preview:
+                self.preview_game = GameModel.model_validate(self.preview["state"])
+                self.show_game(self.preview_game, enabled=False)
             else:
-                self.update_game(self.chat.history[-1].parsed)
+                self.preview_game = None
+                self.response_box.setMarkdown("# Loading...")
+
+            self.inventory_list.setEnabled(False)
+            self.save_button.setEnabled(False)
+            self.load_task = Task()
+            self.load_task.result_ready.connect(self.session_loaded)
+            self.load_task.failed.connect(self.load_failed)
+            self.load_task.start(asyncio.to_thread(
+                GameSession.load,
+                self.file,
+                genai_client = self.genaiClient,
+                together_client = self.togetherClient,
+                settings = self.settings,
+                image_cache = self.image_cache,
+            ))
+
+    def session_loaded(self, session: GameSession):
+        self.set_session(session)
+        self.inventory_list.setEnabled(True)
+        self.save_button.setEnabled(True)
+
+        if self.session.needs_response:
+            self.start_generation()
+        elif self.preview_game == self.session.game:
+            self.update_choices(self.preview_game.choices)
+            if self.speculator:
+                self.speculator.start(self.session, self.preview_game.choices)
+        else:
+            self.update_game(self.session.game)
+
+    def load_failed(self, error):
+        QMessageBox.critical(self, "Load Error", f"Could not load {self.file}:\n{error}")
+        self.close()
+
+    def update_library(self, path):
+        if not self.session_index:
+            self.session_index = SessionIndex()
+        thumbnail = save_thumbnail(path, self.image_presenter.image)
+        self.session_index.update(path, session_entry(path, self.session.chat, thumbnail))
+        self.save_writer.submit(self.session_index.path, self.session_index.data())
+
+    # Ctrl+Shift+T, see tracing.py
+    def toggle_trace(self):
+        path = tracing.toggle()
+        self.show_tracing()
+        if path:
+            QMessageBox.information(self, "Trace", f"Trace written to {path}\nOpen it in chrome://tracing or ui.perfetto.dev.")
+
+    def show_tracing(self):
+        self.setWindowTitle("Dungeon Master (tracing)" if tracing.tracer.enabled else "Dungeon Master")
+
+    def toggle_metrics(self):
+        if self.metrics_overlay.isVisible():
+            self.metrics_timer.stop()
+            self.metrics_overlay.hide()
+            return
+        self.refresh_metrics()
+        self.metrics_overlay.show()
+        self.metrics_overlay.raise_()
+        self.metrics_timer.start()
+
+    def refresh_metrics(self):
+        if not self.session:
+            return
+        lines = metrics.overview(self.session.name)
+        if self.image_cache:
+            lines.append(f"Image cache: {self.image_cache.stats()['hit_rate']:.0%} hit rate overall")
+        self.metrics_overlay.setText("\n".join(lines))
+        self.metrics_overlay.adjustSize()
+        self.metrics_overlay.move(10, 10)
 
     def closeEvent(self, event):
-        if hasattr(self, 'generate_thread') and self.generate_thread.isRunning():
-            self.generate_thread.quit()
-            self.generate_thread.wait()
+        # in-flight requests are cancelled, not waited for
+        for task in [self.generate_task, self.image_task, self.load_task]:
+            if task:
+                task.cancel()
+
+        if self.speculator:
+            self.speculator.discard()
+
+        # don't lose the last turn, but don't hang on a stuck disk either
+        self.save_writer.stop(timeout=2.0)
+
+        # the context cache would only expire on its own, deleting it is one request off the UI thread
+        if self.session and self.session.chat.context_cache and self.session.chat.context_cache.name:
+            threading.Thread(target=self.session.chat.context_cache.release, args=(self.session.chat.client,), daemon=True).start()
 
         self.main_window.show()
         event.accept()
@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import Optional
 
 class GameModel(BaseModel):
     class InventoryItem(BaseModel):
@@ -33,3 +34,29 @@ class GameModel(BaseModel):
     stats: Stats
 
     currentQuest: Quest
+
+# Alternative response schema where the model only reports what changed this turn.
+# GameState merges these into a full GameModel.
+class GameDelta(BaseModel):
+    class StatChanges(BaseModel):
+        STRENGTH: int
+        AGILITY: int
+        INTELLIGENCE: int
+        CHARISMA: int
+
+    chapterText: str
+
+    itemsAdded: list[GameModel.InventoryItem]
+    itemsRemoved: list[str]
+
+    healthChange: int
+    maxHealthChange: int
+
+    imagePrompt: str
+
+    choices: list[GameModel.GameChoice]
+
+    statChanges: StatChanges
+
+    newQuest: Optional[GameModel.Quest] = None
+    questProgressChange: int
@@ -0,0 +1,71 @@
+from gameModel import GameModel, GameDelta
+
+def initial_game() -> GameModel:
+    return GameModel(
+        chapterText = "",
+        inventory = [],
+        health = 100,
+        maxHealth = 100,
+        imagePrompt = "",
+        choices = [],
+        stats = GameModel.Stats(STRENGTH=0, AGILITY=0, INTELLIGENCE=0, CHARISMA=0),
+        currentQuest = GameModel.Quest(
+            title = "No Quest",
+            description = "Accept a quest from an NPC, and it will show up here!",
+            completed_percentage = 0,
+        ),
+    )
+
+# The authoritative game state on the client. In delta mode responses are merged into it,
+# in full mode every response simply replaces it.
+class GameState:
+    def __init__(self, game: GameModel = None):
+        self.game = game or initial_game()
+
+    def merge(self, data: GameModel | GameDelta) -> GameModel:
+        if isinstance(data, GameModel):
+            return data
+
+        game = self.game
+
+        removed = { name.strip().lower() for name in data.itemsRemoved }
+        added = { item.name.strip().lower(): item for item in data.itemsAdded }
+        inventory = [ item for item in game.inventory if item.name.strip().lower() not in removed | added.keys() ]
+        inventory += data.itemsAdded
+
+        stats = GameModel.Stats(**{
+            name: value + getattr(data.statChanges, name)
+            for name, value in game.stats.model_dump().items()
+        })
+
+        max_health = max(1, game.maxHealth + data.maxHealthChange)
+        health = min(max(0, game.health + data.healthChange), max_health)
+
+        quest = data.newQuest or game.currentQuest
+        quest = quest.model_copy(update={
+            "completed_percentage": min(max(0, quest.completed_percentage + data.questProgressChange), 100),
+        })
+
+        return GameModel(
+            chapterText = data.chapterText,
+            inventory = inventory,
+            health = health,
+            maxHealth = max_health,
+            imagePrompt = data.imagePrompt,
+            choices = data.choices,
+            stats = stats,
+            currentQuest = quest,
+        )
+
+    def commit(self, game: GameModel):
+        self.game = game
+
+    # whether the committed state isn't what the model last sent (the rules repaired it)
+    def repaired(self, game: GameModel | None) -> bool:
+        if game is None:
+            return False
+        fields = {"inventory", "health", "maxHealth", "stats", "currentQuest"}
+        return self.game.model_dump(include=fields) != game.model_dump(include=fields)
+
+    def summary(self) -> str:
+        return self.game.model_dump_json(include={"inventory", "health", "maxHealth", "stats", "currentQuest"})
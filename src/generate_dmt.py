@@ -35,7 +35,7 @@ Schema notes:
 - Image Prompt is the image prompt that will be fed to an AI Image Generator to provide the player a more immersive playing experience. Describe the scene in the image, in great detail. Do not include any text, as the model is unable to generate text.
 - Markdown should only be used in the chapterText block.
 - Choices should mostly be between 3-4 options, but if necessary you can go down to 2. Choices should NEVER have lots of text. Most text should be in the chapterText block, describing choices in detail if required.
-- Your stats will be out of 10, and can increase and decrease throughout the game by doing things like consuming potions.
+- Stats can increase and decrease throughout the game by doing things like consuming potions.
 
 
 This is how the story goes:
@@ -77,11 +77,11 @@ Quests can be tracked in the "currentQuest" section, where you can provide a tit
 
 If there is no quest, set the title to "No Quest", and set the description to "Accept a quest from an NPC, and it will show up here!". The percentage completion should default to 0.
 
-Furthermore, I have an inventory with limited slots to carry items, which might force you to make strategic decisions about what to keep and what to discard. You can make these as "choices" for the user. I can carry 4 items by default, but if I find items like a bag, it would give me 4 extra spaces for items, or if I go horseback riding, it gives another 4 extra slots for items, and so on.
+My inventory has limited slots (bags and mounts add more), so you can offer "choices" about what to keep and what to discard.
 
-You can't say I have an item in the chapter unless you also add it to the inventory. If I find an item, and decide to keep it, you must add it to the inventory list. If I lose an item, or discard it, you must remove it from the inventory list.
+You can't say I have an item in the chapter unless it is in the inventory list. Add items I keep, remove items I lose or discard.
 
-Health should passively regenerate over time, e.g. each response, I regain 5 health points, but ONLY if I'm not in combat or a dangerous situation.
+The game keeps stats, health and inventory slots within their limits and regenerates my health between chapters, so only change health for damage or healing. When my message includes the current game state, carry on from it.
 
 Finally, as we progress, I might encounter powerful artifacts that can change the course of the game. These artifacts might be hidden, cursed, or guarded by powerful creatures, so I'll have to be cautious.
 
@@ -93,6 +93,18 @@ Let's begin our adventure! Remember to BEGIN with listing 4 imaginative characte
 You can now start character selection. Remember to not use lots of text in the `choices` section.
 '''
 
+# Added to the system instruction for sessions using the GameDelta schema.
+delta_instruction = '''\n
+### Reporting changes only
+To keep responses short, you do not repeat the whole game state every turn. The current game state (inventory, health, stats and quest) is attached to each of my messages, and you only report what changed in this chapter:
+- itemsAdded: items added to the inventory this chapter, with their options. Empty if nothing was added.
+- itemsRemoved: names of items that were used up, lost or discarded this chapter.
+- statChanges: how much each stat went up or down this chapter, 0 if it did not change.
+- healthChange and maxHealthChange: how much health and max health changed this chapter, e.g. -10 after being hit.
+- newQuest: only set this when a new quest is accepted or the current quest changes. Otherwise leave it null.
+- questProgressChange: how many percentage points the current quest progressed this chapter.
+'''
+
 appends = '''\n
 There are also some custom rules for this game, which override the default settings.
 
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+cache_dir = os.path.join(os.path.dirname(__file__), "cache", "images")
+
+# Generated images on disk, keyed by a hash of everything that was sent to the image API.
+# Least recently used images are evicted once the cache grows past `max_bytes`.
+class ImageCache:
+    def __init__(self, directory: str = cache_dir, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[str, int] = None
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.fetch_seconds = 0.0
+
+    @staticmethod
+    def key(prompt: str, model: str, width: int, height: int, steps: int) -> str:
+        params = json.dumps([prompt, model, width, height, steps], ensure_ascii=False)
+        return hashlib.sha256(params.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".webp")
+
+    def load_index(self):
+        if self.entries is not None:
+            return
+        files = []
+        if os.path.isdir(self.directory):
+            for root, _, names in os.walk(self.directory):
+                for name in names:
+                    if name.endswith(".webp"):
+                        stat = os.stat(os.path.join(root, name))
+                        files.append((stat.st_mtime, name[:-5], stat.st_size))
+        files.sort()
+        self.entries = OrderedDict((key, size) for _, key, size in files)
+        self.total_bytes = sum(self.entries.values())
+
+    def get(self, key: str) -> Image.Image | None:
+        with self.lock:
+            self.load_index()
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            path = self.path(key)
+            try:
+                os.utime(path)
+                image = Image.open(path)
+                image.load()
+            except OSError:
+                self.total_bytes -= self.entries.pop(key)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return image
+
+    def put(self, key: str, image: Image.Image, fetch_seconds: float = 0.0):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # a temp file of its own: the cache is shared by every game window, and the server's send_image can put the
+        # same image for several sessions at once
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False) as file:
+            temp = file.name
+            try:
+                image.save(file, "WEBP", quality=90)
+            except BaseException:
+                file.close()
+                os.remove(temp)
+                raise
+        os.replace(temp, path)
+
+        with self.lock:
+            self.load_index()
+            self.fetches += 1
+            self.fetch_seconds += fetch_seconds
+            self.total_bytes -= self.entries.pop(key, 0)
+            self.entries[key] = os.path.getsize(path)
+            self.total_bytes += self.entries[key]
+            self.evict()
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        fetches = max(self.fetches, 1)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            # every hit is one image request that didn't go to together.ai
+            "requests_saved": self.hits,
+            "seconds_saved": self.hits * self.fetch_seconds / fetches,
+            "entries": len(self.entries or ()),
+            "bytes": self.total_bytes,
+        }
+
+image_cache: ImageCache = None
+
+def get_image_cache(max_bytes: int = None) -> ImageCache:
+    global image_cache
+    if image_cache is None:
+        image_cache = ImageCache()
+    if max_bytes:
+        image_cache.max_bytes = max_bytes
+    return image_cache
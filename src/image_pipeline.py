@@ -0,0 +1,47 @@
+from collections import OrderedDict
+from PIL import Image
+from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtGui import QImage, QPixmap
+
+# Runs in the image worker: converts and downsamples to the largest size the image can be shown at.
+# QImage (unlike QPixmap) is safe to create off the GUI thread.
+def prepare_image(image: Image.Image, max_size: tuple[int, int]) -> QImage:
+    image = image.convert("RGBA")
+    image.thumbnail(max_size, Image.LANCZOS)
+    data = image.tobytes("raw", "RGBA")
+    return QImage(data, image.width, image.height, QImage.Format_RGBA8888).copy()
+
+# Holds the display-resolution image and memoizes a scaled pixmap per label size,
+# so repeated resizes are a dictionary lookup instead of a smooth rescale.
+class ImagePresenter:
+    def __init__(self, max_sizes: int = 8):
+        self.max_sizes = max_sizes
+        self.image: QImage = None
+        self.pixmap: QPixmap = None
+        self.scaled: OrderedDict[tuple[int, int], QPixmap] = OrderedDict()
+
+    def set_image(self, image: QImage):
+        self.image = image
+        self.pixmap = None
+        self.scaled.clear()
+
+    def clear(self):
+        self.set_image(None)
+
+    def pixmap_for(self, size: QSize) -> QPixmap | None:
+        if self.image is None:
+            return None
+
+        key = (size.width(), size.height())
+        if key in self.scaled:
+            self.scaled.move_to_end(key)
+            return self.scaled[key]
+
+        if self.pixmap is None:
+            self.pixmap = QPixmap.fromImage(self.image)
+        scaled = self.pixmap.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+        self.scaled[key] = scaled
+        if len(self.scaled) > self.max_sizes:
+            self.scaled.popitem(last=False)
+        return scaled
@@ -0,0 +1,179 @@
+from PyQt5.QtWidgets import QListView, QStyledItemDelegate, QStyle, QStyleOptionViewItem
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QRect, QSize, QEvent, pyqtSignal
+from PyQt5.QtGui import QPainter, QColor, QPainterPath
+from gameModel import GameModel
+
+ItemRole = Qt.UserRole
+
+# Inventory rows, updated in place between turns: only items that were added, removed, moved or changed
+# touch the view. Items are matched by name (and occurrence, for duplicates).
+class InventoryModel(QAbstractListModel):
+    def __init__(self):
+        super().__init__()
+        self.items: list[GameModel.InventoryItem] = []
+        self.keys: list[tuple[str, int]] = []
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.items)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self.items[index.row()]
+        if role == Qt.DisplayRole:
+            return item.name
+        if role == ItemRole:
+            return item
+        return None
+
+    def set_items(self, items: list[GameModel.InventoryItem]):
+        new_keys = keys(items)
+        wanted = set(new_keys)
+
+        for row in reversed(range(len(self.items))):
+            if self.keys[row] not in wanted:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.items[row]
+                del self.keys[row]
+                self.endRemoveRows()
+
+        for row, (key, item) in enumerate(zip(new_keys, items)):
+            if row < len(self.keys) and self.keys[row] == key:
+                pass
+            elif key in self.keys:
+                old = self.keys.index(key, row)
+                self.beginMoveRows(QModelIndex(), old, old, QModelIndex(), row)
+                self.items.insert(row, self.items.pop(old))
+                self.keys.insert(row, self.keys.pop(old))
+                self.endMoveRows()
+            else:
+                self.beginInsertRows(QModelIndex(), row, row)
+                self.items.insert(row, item)
+                self.keys.insert(row, key)
+                self.endInsertRows()
+                continue
+
+            if self.items[row] != item:
+                self.items[row] = item
+                index = self.index(row)
+                self.dataChanged.emit(index, index)
+
+def keys(items: list[GameModel.InventoryItem]) -> list[tuple[str, int]]:
+    seen: dict[str, int] = {}
+    result = []
+    for item in items:
+        count = seen.get(item.name, 0)
+        seen[item.name] = count + 1
+        result.append((item.name, count))
+    return result
+
+# Paints the item name and its option buttons, matching the inventory styling in get_stylesheet.
+class InventoryDelegate(QStyledItemDelegate):
+    option_clicked = pyqtSignal(str, str)
+
+    row_height = 60
+    button_height = 30
+    padding = 10
+    spacing = 6
+
+    background = QColor(0, 0, 0, int(255 * 0.3))
+    button = QColor(0, 0, 0, int(255 * 0.2))
+    button_hover = QColor(0, 0, 0, int(255 * 0.3))
+    text = QColor("white")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # (row, option) under the mouse
+        self.hover: tuple[int, str] = None
+
+    def sizeHint(self, option: QStyleOptionViewItem, index: QModelIndex) -> QSize:
+        return QSize(option.rect.width(), self.row_height)
+
+    def button_rects(self, option: QStyleOptionViewItem, item: GameModel.InventoryItem) -> list[tuple[str, QRect]]:
+        metrics = option.fontMetrics
+        rects = []
+        right = option.rect.right() - self.padding
+        top = option.rect.top() + (option.rect.height() - self.button_height) // 2
+        for name in reversed(item.options):
+            width = metrics.horizontalAdvance(name) + 2 * self.padding
+            rects.append((name, QRect(right - width, top, width, self.button_height)))
+            right -= width + self.spacing
+        rects.reverse()
+        return rects
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex):
+        item = index.data(ItemRole)
+        enabled = bool(option.state & QStyle.State_Enabled)
+        rect = option.rect.adjusted(0, 2, 0, -2)
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setFont(option.font)
+        if not enabled:
+            painter.setOpacity(0.5)
+
+        path = QPainterPath()
+        path.addRoundedRect(rect.x(), rect.y(), rect.width(), rect.height(), 10, 10)
+        painter.fillPath(path, self.background)
+
+        buttons = self.button_rects(option, item)
+        name_right = buttons[0][1].left() - self.spacing if buttons else rect.right() - self.padding
+        name_rect = QRect(rect.left() + self.padding, rect.top(), name_right - rect.left() - self.padding, rect.height())
+        painter.setPen(self.text)
+        painter.drawText(name_rect, Qt.AlignVCenter | Qt.AlignLeft, option.fontMetrics.elidedText(item.name, Qt.ElideRight, name_rect.width()))
+
+        for name, button_rect in buttons:
+            hovered = enabled and self.hover == (index.row(), name)
+            path = QPainterPath()
+            path.addRoundedRect(button_rect.x(), button_rect.y(), button_rect.width(), button_rect.height(), 10, 10)
+            painter.fillPath(path, self.button_hover if hovered else self.button)
+            painter.drawText(button_rect, Qt.AlignCenter, name)
+
+        painter.restore()
+
+    def editorEvent(self, event: QEvent, model, option: QStyleOptionViewItem, index: QModelIndex) -> bool:
+        if event.type() not in (QEvent.MouseMove, QEvent.MouseButtonRelease):
+            return False
+
+        item = index.data(ItemRole)
+        hit = None
+        for name, button_rect in self.button_rects(option, item):
+            if button_rect.contains(event.pos()):
+                hit = name
+                break
+
+        if event.type() == QEvent.MouseMove:
+            hover = (index.row(), hit) if hit else None
+            if hover != self.hover:
+                self.hover = hover
+                self.parent().viewport().update()
+            return False
+
+        if hit and event.button() == Qt.LeftButton:
+            self.option_clicked.emit(item.name, hit)
+            return True
+        return False
+
+class InventoryView(QListView):
+    option_clicked = pyqtSignal(str, str)
+
+    def __init__(self):
+        super().__init__()
+        self.inventory_model = InventoryModel()
+        self.delegate = InventoryDelegate(self)
+        self.setModel(self.inventory_model)
+        self.setItemDelegate(self.delegate)
+        self.setMouseTracking(True)
+        self.setSelectionMode(QListView.NoSelection)
+        self.setUniformItemSizes(True)
+        self.setSpacing(2)
+        self.delegate.option_clicked.connect(self.option_clicked)
+
+    def set_items(self, items: list[GameModel.InventoryItem]):
+        self.inventory_model.set_items(items)
+
+    def leaveEvent(self, event):
+        if self.delegate.hover:
+            self.delegate.hover = None
+            self.viewport().update()
+        super().leaveEvent(event)
@@ -0,0 +1,185 @@
+import json
+import os
+import time
+import pickle
+from typing import Callable
+from google.genai import types
+from chat import Chat, make_response, is_model_turn
+from gameModel import GameModel, GameDelta
+from rules import RulesEngine
+from tracing import traced
+from metrics import save_latency
+
+# Session files (.dms) are JSON lines: a header with the chat config, then one record per turn:
+#   {"user": [message, ...], "model": "<response JSON>" | null, "image": "<image cache key>" | null, "usage": {...} | null}
+# Autosave only ever appends records, so saving doesn't get slower as the session grows.
+# Sessions saved by older versions (a pickled Chat) can still be loaded.
+
+FORMAT = "dungeon-master-session"
+VERSION = 1
+
+def header(chat: Chat) -> dict:
+    return {
+        "format": FORMAT,
+        "version": VERSION,
+        "model": chat.model,
+        "response_mode": chat.response_mode,
+        "temperature": chat.config.temperature,
+        "system_instruction": chat.config.system_instruction,
+    }
+
+def turn_records(chat: Chat, start: int = 0, image_key: Callable[[str], str] = None) -> list[dict]:
+    records = []
+    user = []
+    for res in chat.history[start:]:
+        if not is_model_turn(res):
+            user.append(" ".join(part.text for part in res.parts if part.text))
+            continue
+
+        if isinstance(res, types.GenerateContentResponse):
+            text = res.text
+            usage = res.usage_metadata.model_dump(mode="json", exclude_none=True) if res.usage_metadata else None
+            prompt = getattr(res.parsed, "imagePrompt", None)
+        else:
+            text = " ".join(part.text for part in res.parts if part.text)
+            usage = None
+            prompt = None
+
+        records.append({
+            "user": user,
+            "model": text,
+            "image": image_key(prompt) if image_key and prompt else None,
+            "usage": usage,
+        })
+        user = []
+
+    if user:
+        records.append({ "user": user, "model": None, "image": None, "usage": None })
+    return records
+
+def encode(record: dict) -> bytes:
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+@traced("write", "save")
+def write_atomic(path: str, data: bytes):
+    started = time.perf_counter()
+    temp = path + ".tmp"
+    with open(temp, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, path)
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    save_latency.observe(time.perf_counter() - started, mode="snapshot")
+
+@traced("append", "save")
+def append(path: str, data: bytes):
+    started = time.perf_counter()
+    with open(path, "ab") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    save_latency.observe(time.perf_counter() - started, mode="append")
+
+class SessionJournal:
+    def __init__(self, path: str, written: int = 0, image_key: Callable[[str], str] = None):
+        self.path = path
+        self.written = written
+        self.image_key = image_key
+        # set when a write failed: the file may be missing turns, so the next save rewrites it whole
+        self.dirty = False
+
+    # the whole session, for writing to a new file
+    @traced("encode", "save")
+    def snapshot(self, chat: Chat) -> bytes:
+        data = encode(header(chat)) + b"".join(encode(record) for record in turn_records(chat, 0, self.image_key))
+        self.written = len(chat.history)
+        self.dirty = False
+        return data
+
+    # the turns added since the last snapshot/append, for appending to the file
+    @traced("encode", "save")
+    def pending(self, chat: Chat) -> bytes:
+        records = turn_records(chat, self.written, self.image_key)
+        data = b"".join(encode(record) for record in records if record["model"] is not None)
+        self.written = self.complete_turns(chat)
+        return data
+
+    # called by the writer (on its thread) when writing this journal failed
+    def invalidate(self):
+        self.dirty = True
+
+    def write(self, chat: Chat):
+        write_atomic(self.path, self.snapshot(chat))
+
+    def append(self, chat: Chat):
+        data = self.pending(chat)
+        if data:
+            append(self.path, data)
+
+    # messages still waiting for the model's response are appended together with it
+    def complete_turns(self, chat: Chat) -> int:
+        end = len(chat.history)
+        while end > self.written and not is_model_turn(chat.history[end - 1]):
+            end -= 1
+        return end if end > self.written else self.written
+
+@traced("load", "save")
+def load_session(path: str) -> tuple[Chat, SessionJournal | None]:
+    with open(path, "rb") as file:
+        first = file.read(1)
+        file.seek(0)
+        if first != b"{":
+            return pickle.load(file), None
+        lines = file.read().splitlines()
+
+    meta = json.loads(lines[0])
+    if meta.get("format") != FORMAT:
+        raise ValueError(f"{path} is not a Dungeon Master session file.")
+
+    schema = GameDelta if meta["response_mode"] == "delta" else GameModel
+    chat = Chat(
+        config = types.GenerateContentConfig(
+            temperature = meta["temperature"],
+            response_mime_type = "application/json",
+            response_schema = schema,
+            system_instruction = meta["system_instruction"],
+        ),
+    )
+    chat.model = meta["model"] or chat.model
+
+    rules = RulesEngine()
+    torn = False
+    for idx, line in enumerate(lines[1:], start=1):
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            # a write that was cut off part way, only possible for the last line
+            if idx == len(lines) - 1:
+                torn = True
+                break
+            raise
+
+        for text in record["user"]:
+            chat.history.append(types.Content(role="user", parts=[types.Part(text=text)]))
+
+        if record["model"] is not None:
+            usage = types.GenerateContentResponseUsageMetadata.model_validate(record["usage"]) if record["usage"] else None
+            res = make_response(record["model"], schema, usage)
+            chat.history.append(res)
+
+            # the same checks the session made when the turn was played. A response that didn't fit the schema
+            # (saved while its turn was being retried) is kept in the history but not played.
+            if res.parsed is None:
+                continue
+            game, problems = rules.enforce(chat.state.game, chat.state.merge(res.parsed))
+            if not problems:
+                chat.state.commit(game)
+
+    # a torn file is rewritten in full on the next save rather than appended to
+    return chat, None if torn else SessionJournal(path, len(chat.history))
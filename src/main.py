@@ -13,23 +13,31 @@ from PyQt5.QtWidgets import (
     QMessageBox,
 )
 from PyQt5.QtGui import QPixmap, QDesktopServices
-from PyQt5.QtCore import Qt, QPropertyAnimation, QRect, QThread, QUrl
-from game import GameWindow
-from generate_dmt import DMTEditor
+from PyQt5.QtCore import Qt, QPropertyAnimation, QRect, QThread, QUrl, QTimer, pyqtSignal
 from settings import Settings, loadSettings
 from style import *
 from button import Button
 
+# The game windows pull in google-genai, together, PIL and pydantic, which take longer to import than the
+# menu takes to show. They're imported on first use, and preloaded here once the menu is on screen.
+class PreloadThread(QThread):
+    def run(self):
+        import game, generate_dmt, session_library
+
 class MainWindow(QMainWindow):
+    first_painted = pyqtSignal()
+
     def __init__(self):
         super().__init__()
+        self.painted = False
+        self.preload_thread = PreloadThread()
         self.setWindowTitle("Dungeon Master")
         self.setGeometry(100, 100, 1366, 768)
 
         self.main_widget = QWidget()
         self.layout = QVBoxLayout()
 
-        pixmap = QPixmap("assets/icon.png")
+        pixmap = assets.pixmap(icon_path)
         pixmap = pixmap.scaled(500, 500, Qt.KeepAspectRatio, Qt.SmoothTransformation)
         self.icon_label = AutoResizingLabel(pixmap)
         self.icon_label.setMaximumSize(500, 500)
@@ -93,6 +101,7 @@ class MainWindow(QMainWindow):
                 "Settings not configured!\nBefore starting the game, go back and hit the 'Settings' option, then enter your API keys."
             )
             return
+        from game import GameWindow
         self.game_window = GameWindow(self)
         self.game_window.show()
         self.hide()
@@ -104,9 +113,13 @@ class MainWindow(QMainWindow):
                 "Settings not configured!\nBefore starting the game, go back and hit the 'Settings' option, then enter your API keys."
             )
             return
-        options = QFileDialog.Options()
-        file_name, _ = QFileDialog.getOpenFileName(self, "Load DMS", "", "Dungeon Master Session Files (*.dms)", options=options)
-        self.game_window = GameWindow(self, file=file_name)
+        from session_library import SessionLibrary
+        self.library_window = SessionLibrary(self)
+        self.library_window.show()
+
+    def open_session(self, file_name, preview=None):
+        from game import GameWindow
+        self.game_window = GameWindow(self, file=file_name, preview=preview)
         self.game_window.show()
         self.hide()
 
@@ -119,11 +132,13 @@ class MainWindow(QMainWindow):
             return
         options = QFileDialog.Options()
         file_name, _ = QFileDialog.getOpenFileName(self, "Load DMT", "", "Dungeon Master World Files (*.dmt)", options=options)
+        from game import GameWindow
         self.game_window = GameWindow(self, file=file_name)
         self.game_window.show()
         self.hide()
 
     def dmt_editor(self):
+        from generate_dmt import DMTEditor
         self.dmt_window = DMTEditor(self)
         self.dmt_window.show()
         self.hide()
@@ -140,6 +155,14 @@ class MainWindow(QMainWindow):
         self.background.setGeometry(self.rect())
         super().resizeEvent(event)
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            self.first_painted.emit()
+            # after this paint has reached the screen
+            QTimer.singleShot(0, self.preload_thread.start)
+
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     app.setDesktopFileName("dev.uukelele.dungeonmaster")
@@ -0,0 +1,262 @@
+import os
+import time
+import atexit
+import bisect
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Counters and histograms for what the game spends: tokens and latency of every model request, image requests and
+# the image and context caches, retries, turns and saves, labelled by model and session. Exported in the Prometheus text format.
+#
+#   DM_METRICS=9464           serve http://127.0.0.1:9464/metrics
+#   DM_METRICS=game.prom      rewrite that file every few seconds and on exit (e.g. for node_exporter's textfile collector)
+#
+# Ctrl+Shift+M in the game window shows the current session's numbers over the game.
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.series: dict[tuple, object] = {}
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    # metrics without any of these labels keep everything
+    def forget(self, **labels):
+        if not any(label in self.labels for label in labels):
+            return
+        with self.lock:
+            for key in [key for key in self.series if matches(self, key, labels)]:
+                del self.series[key]
+
+    def label_text(self, key: tuple, extra: str = "") -> str:
+        pairs = [f'{label}="{escape(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def export(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            series = list(self.series.items())
+        for key, value in series:
+            lines += self.export_series(key, value)
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    # summed over every series matching the labels given
+    def total(self, **labels) -> float:
+        with self.lock:
+            return sum(value for key, value in self.series.items() if matches(self, key, labels))
+
+    def export_series(self, key: tuple, value: float) -> list[str]:
+        return [f"{self.name}{self.label_text(key)} {number(value)}"]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = ()):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    # per series: [count per bucket (the last one is +Inf), sum, count]
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def merged(self, labels: dict) -> list:
+        counts, total, count = [0] * (len(self.buckets) + 1), 0.0, 0
+        with self.lock:
+            for key, series in self.series.items():
+                if matches(self, key, labels):
+                    counts = [a + b for a, b in zip(counts, series[0])]
+                    total += series[1]
+                    count += series[2]
+        return [counts, total, count]
+
+    def count(self, **labels) -> int:
+        return self.merged(labels)[2]
+
+    def mean(self, **labels) -> float | None:
+        _, total, count = self.merged(labels)
+        return total / count if count else None
+
+    # estimated from the buckets like Prometheus' histogram_quantile, interpolating inside the bucket
+    def quantile(self, share: float, **labels) -> float | None:
+        counts, _, count = self.merged(labels)
+        if not count:
+            return None
+        rank = share * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1] if self.buckets else None
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return None
+
+    def export_series(self, key: tuple, series: list) -> list[str]:
+        counts, total, count = series
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else number(bound)
+            bound_label = f'le="{le}"'
+            lines.append(f"{self.name}_bucket{self.label_text(key, bound_label)} {cumulative}")
+        lines.append(f"{self.name}_sum{self.label_text(key)} {number(total)}")
+        lines.append(f"{self.name}_count{self.label_text(key)} {count}")
+        return lines
+
+def matches(metric: Metric, key: tuple, labels: dict) -> bool:
+    return all(key[metric.labels.index(label)] == str(value) for label, value in labels.items() if label in metric.labels)
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.add(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = ()) -> Histogram:
+        return self.add(Histogram(name, help, labels, buckets))
+
+    def add(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self.metrics[metric.name] = metric
+        return metric
+
+    # drops the series of e.g. a session that's gone, so a long-running server doesn't keep them all
+    def forget(self, **labels):
+        for metric in self.metrics.values():
+            metric.forget(**labels)
+
+    def export(self) -> str:
+        return "\n".join(line for metric in self.metrics.values() for line in metric.export()) + "\n"
+
+    # written next to the target and renamed, so a scraper never reads half a file
+    def write(self, path: str):
+        temp = path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as file:
+            file.write(self.export())
+        os.replace(temp, path)
+
+    # a daemon thread answering GET /metrics, returns the server (its port is server.server_address[1])
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.export().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        return server
+
+registry = Registry()
+
+latency_buckets = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+token_buckets = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+
+# request is "turn", "repair" or "summary". speculative="1" is what speculative forks (see speculation.py) spent,
+# whether or not the player then took that branch; an adopted branch's turn is counted again with speculative="0".
+prompt_tokens = registry.counter("dm_prompt_tokens_total", "Prompt tokens sent to the model.", ("model", "session", "speculative", "request"))
+cached_tokens = registry.counter("dm_cached_tokens_total", "Prompt tokens served from a context cache.", ("model", "session", "speculative", "request"))
+output_tokens = registry.counter("dm_output_tokens_total", "Output tokens generated by the model.", ("model", "session", "speculative", "request"))
+prompt_size = registry.histogram("dm_prompt_tokens", "Prompt tokens per model request.", ("model", "session", "speculative", "request"), token_buckets)
+model_latency = registry.histogram("dm_model_request_seconds", "Time for one model request as the session sees it, including building the prompt and streaming.", ("model", "session", "speculative", "request"), latency_buckets)
+turns = registry.counter("dm_turns_total", "Turns played (or generated ahead, if speculative), by outcome (accepted or failed).", ("model", "session", "speculative", "outcome"))
+retries = registry.counter("dm_retries_total", "Whole turns requested again because the response was invalid.", ("model", "session", "speculative"))
+image_latency = registry.histogram("dm_image_request_seconds", "Time to get an image from the image model, including retries.", ("model", "session"), latency_buckets)
+image_cache = registry.counter("dm_image_cache_lookups_total", "Image cache lookups, by result (hit or miss).", ("session", "result"))
+context_cache = registry.counter("dm_context_cache_operations_total", "Context caches created, refreshed, or that failed to create.", ("model", "operation"))
+save_latency = registry.histogram("dm_save_seconds", "Time to write a save, by mode (snapshot or append).", ("mode",), (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+
+# labels: model, session and speculative
+def record_response(res, request: str, started: float, **labels):
+    model_latency.observe(time.perf_counter() - started, request=request, **labels)
+    usage = getattr(res, "usage_metadata", None)
+    if usage:
+        prompt_tokens.inc(usage.prompt_token_count or 0, request=request, **labels)
+        cached_tokens.inc(usage.cached_content_token_count or 0, request=request, **labels)
+        output_tokens.inc(usage.candidates_token_count or 0, request=request, **labels)
+        prompt_size.observe(usage.prompt_token_count or 0, request=request, **labels)
+
+# the lines of the in-game overlay
+def overview(session: str) -> list[str]:
+    def seconds(value):
+        return f"{value:.2f}s" if value is not None else "-"
+    hits, misses = image_cache.total(session=session, result="hit"), image_cache.total(session=session, result="miss")
+    saves = save_latency.mean()
+    return [
+        f"Session {session}",
+        f"Turns: {int(turns.total(session=session, speculative='0', outcome='accepted'))}, failed {int(turns.total(session=session, speculative='0', outcome='failed'))}, "
+            f"retries {int(retries.total(session=session, speculative='0'))}",
+        f"Tokens: {int(prompt_tokens.total(session=session))} in ({int(cached_tokens.total(session=session))} cached), {int(output_tokens.total(session=session))} out, "
+            f"{int(prompt_tokens.total(session=session, speculative='1') + output_tokens.total(session=session, speculative='1'))} of them speculative",
+        f"Model: p50 {seconds(model_latency.quantile(0.5, session=session, request='turn'))}, p95 {seconds(model_latency.quantile(0.95, session=session, request='turn'))}, "
+            f"{model_latency.count(session=session, request='repair')} repairs",
+        f"Images: p50 {seconds(image_latency.quantile(0.5, session=session))}, cache {int(hits)}/{int(hits + misses)} hits",
+        f"Saves: {save_latency.count()}, {saves * 1000:.1f} ms average" if saves is not None else "Saves: none",
+    ]
+
+def write_periodically(path: str, interval: float = 5.0):
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                registry.write(path)
+            except OSError:
+                pass
+    threading.Thread(target=run, name="metrics-file", daemon=True).start()
+    atexit.register(registry.write, path)
+
+def init_from_environment():
+    setting = os.environ.get("DM_METRICS", "")
+    if not setting or setting == "0":
+        return
+    if setting.isdigit():
+        registry.serve(int(setting))
+    else:
+        write_periodically(setting)
+
+init_from_environment()
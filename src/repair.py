@@ -0,0 +1,69 @@
+import time
+from pydantic import BaseModel, create_model
+from google.genai import types
+from chat import make_response
+from gameModel import GameModel, GameDelta
+
+repair_instruction = '''
+You are fixing one response of the Dungeon Master in a text RPG. You are given the chapter the player just read, their game state and what is wrong with the response.
+Reply with only the fields you are asked for, consistent with the chapter. Choices are what the player can do next, 2-4 of them, each a few words without markdown.
+'''
+
+# the fields a small request can fix on its own, everything else needs the whole turn again
+patch_fields = {
+    "choices": list[GameModel.GameChoice],
+    "currentQuest": GameModel.Quest,
+}
+
+def patchable(problems: dict[str, str]) -> bool:
+    return bool(problems) and all(field in patch_fields for field in problems)
+
+def patch_schema(fields: list[str]) -> type[BaseModel]:
+    return create_model("Patch_" + "_".join(fields), **{ field: (patch_fields[field], ...) for field in fields })
+
+def patch_request(game: GameModel, problems: dict[str, str]) -> str:
+    state = game.model_dump_json(include={"inventory", "health", "maxHealth", "stats", "currentQuest"})
+    wrong = "\n".join(f"- {field}: {problem}" for field, problem in problems.items())
+    return f"Chapter:\n{game.chapterText}\n\nGame state:\n{state}\n\nWhat is wrong:\n{wrong}"
+
+def patch_config(schema: type[BaseModel]) -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        temperature = 1.0,
+        response_mime_type = "application/json",
+        response_schema = schema,
+        system_instruction = repair_instruction,
+    )
+
+# the response as if the model had got those fields right the first time, so that's what the history keeps
+def patched_response(res: types.GenerateContentResponse, patch: BaseModel) -> types.GenerateContentResponse:
+    update = { field: getattr(patch, field) for field in type(patch).model_fields }
+    if isinstance(res.parsed, GameDelta) and "currentQuest" in update:
+        update["newQuest"] = update.pop("currentQuest")
+    parsed = res.parsed.model_copy(update=update)
+    return make_response(parsed.model_dump_json(), type(res.parsed), res.usage_metadata)
+
+# Latency and tokens of every repair request, next to how many of them fixed the turn.
+class RepairLog:
+    def __init__(self):
+        self.records: list[dict] = []
+
+    def record(self, fields: list[str], started: float, res: types.GenerateContentResponse | None, fixed: bool):
+        usage = res.usage_metadata if res else None
+        self.records.append({
+            "fields": fields,
+            "latency": time.perf_counter() - started,
+            "prompt_tokens": usage.prompt_token_count if usage else None,
+            "output_tokens": usage.candidates_token_count if usage else None,
+            "fixed": fixed,
+        })
+
+    def absorb(self, other: "RepairLog"):
+        self.records += other.records
+
+    def report(self) -> str:
+        if not self.records:
+            return "Repairs: none"
+        fixed = sum(1 for record in self.records if record["fixed"])
+        latency = sum(record["latency"] for record in self.records) / len(self.records)
+        tokens = sum((record["prompt_tokens"] or 0) + (record["output_tokens"] or 0) for record in self.records)
+        return f"Repairs: {len(self.records)} requests, {fixed} fixed the turn, {latency:.2f}s average, {tokens} tokens"
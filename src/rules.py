@@ -0,0 +1,127 @@
+from collections import Counter
+from gameModel import GameModel
+
+stat_max = 10
+health_regen = 5
+base_slots = 4
+slots_per_container = 4
+# items that give extra inventory slots
+containers = ("bag", "backpack", "satchel", "rucksack", "knapsack", "horse", "pony", "mule", "donkey", "cart", "wagon")
+default_options = ["examine", "discard"]
+# choices are button labels, anything longer than this belongs in the chapter
+choice_max_length = 100
+
+def is_container(item: GameModel.InventoryItem) -> bool:
+    name = item.name.lower()
+    return any(word in name for word in containers)
+
+def inventory_slots(inventory: list[GameModel.InventoryItem]) -> int:
+    return base_slots + slots_per_container * sum(1 for item in inventory if is_container(item))
+
+# The game's bookkeeping rules, checked on every response instead of asking the model to keep track of them.
+# Small violations are repaired in place (and counted), only what can't be repaired without the model is
+# returned, as a problem per field, which the session then asks the model to fix.
+class RulesEngine:
+    def __init__(self):
+        self.checked = 0
+        self.repairs = Counter()
+        # responses that broke a rule but were repaired, each of these would have needed another request
+        self.regenerations_avoided = 0
+
+    def enforce(self, previous: GameModel, game: GameModel) -> tuple[GameModel, dict[str, str]]:
+        self.checked += 1
+        repairs = Counter()
+        update = {}
+
+        stats = { name: min(max(0, value), stat_max) for name, value in game.stats.model_dump().items() }
+        if stats != game.stats.model_dump():
+            repairs["stats"] += 1
+            update["stats"] = GameModel.Stats(**stats)
+
+        max_health = max(1, game.maxHealth)
+        health = min(max(0, game.health), max_health)
+        # regeneration is left to us: when the chapter didn't touch health, the player rested a little.
+        # Less health means combat or danger, more means the model already healed them.
+        if health == previous.health and 0 < health < max_health:
+            health = min(health + health_regen, max_health)
+            repairs["regen"] += 1
+        elif health != game.health or max_health != game.maxHealth:
+            repairs["health"] += 1
+        if health != game.health or max_health != game.maxHealth:
+            update["health"] = health
+            update["maxHealth"] = max_health
+
+        problems = {}
+        if not game.currentQuest.title.strip():
+            problems["currentQuest"] = 'The quest has no title, use "No Quest" if there is none.'
+
+        percentage = min(max(0, game.currentQuest.completed_percentage), 100)
+        if percentage != game.currentQuest.completed_percentage:
+            repairs["quest"] += 1
+            update["currentQuest"] = game.currentQuest.model_copy(update={"completed_percentage": percentage})
+
+        inventory = [
+            item if item.options else item.model_copy(update={"options": list(default_options)})
+            for item in game.inventory
+        ]
+        repairs["options"] += sum(1 for item in game.inventory if not item.options)
+
+        if len(inventory) > inventory_slots(inventory):
+            inventory, dropped = self.fit(previous.inventory, inventory)
+            if dropped:
+                repairs["inventory"] += dropped
+            if len(inventory) > inventory_slots(inventory):
+                problems["inventory"] = (f"The inventory holds {len(inventory)} items but only has {inventory_slots(inventory)} slots. "
+                    "Let the player choose what to discard instead.")
+        if inventory != game.inventory:
+            update["inventory"] = inventory
+
+        choices = [choice for choice in game.choices if choice.text.strip()]
+        if len(choices) != len(game.choices):
+            repairs["choices"] += len(game.choices) - len(choices)
+            update["choices"] = choices
+        if not choices:
+            problems["choices"] = "Choices are empty"
+        elif any(len(choice.text) > choice_max_length for choice in choices):
+            problems["choices"] = f"Choices must be under {choice_max_length} characters, put the details in the chapter"
+
+        # regeneration isn't a violation, only a repair the model is no longer asked to make
+        if any(count for rule, count in repairs.items() if rule != "regen") and not problems:
+            self.regenerations_avoided += 1
+        self.repairs.update(repairs)
+
+        return game.model_copy(update=update), problems
+
+    # items the player already had stay, new ones are only picked up while there's room for them
+    def fit(self, previous: list[GameModel.InventoryItem], inventory: list[GameModel.InventoryItem]) -> tuple[list[GameModel.InventoryItem], int]:
+        had = Counter(item.name for item in previous)
+        kept = []
+        new = []
+        for item in inventory:
+            if had[item.name] > 0:
+                had[item.name] -= 1
+                kept.append(item)
+            else:
+                new.append(item)
+
+        # containers first, they make room for everything else
+        dropped = 0
+        for item in sorted(new, key=lambda item: not is_container(item)):
+            if len(kept) + 1 <= inventory_slots(kept + [item]):
+                kept.append(item)
+            else:
+                dropped += 1
+
+        order = { id(item): index for index, item in enumerate(inventory) }
+        kept.sort(key=lambda item: order[id(item)])
+        return kept, dropped
+
+    def absorb(self, other: "RulesEngine"):
+        self.checked += other.checked
+        self.repairs.update(other.repairs)
+        self.regenerations_avoided += other.regenerations_avoided
+
+    def report(self) -> str:
+        repairs = ", ".join(f"{rule} {count}" for rule, count in sorted(self.repairs.items()) if count)
+        return (f"Rules: {self.checked} responses checked, {sum(self.repairs.values())} repairs "
+            f"({repairs or 'none'}), {self.regenerations_avoided} regenerations avoided")
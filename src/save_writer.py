@@ -0,0 +1,101 @@
+import threading
+import time
+from typing import Callable
+from PyQt5.QtCore import QThread, QCoreApplication, pyqtSignal
+from journal import write_atomic, append
+
+class SaveJob:
+    def __init__(self, path: str, data: bytes, append: bool, on_failure: Callable[[], None] = None):
+        self.path = path
+        self.data = data
+        self.append = append
+        self.on_failure = [on_failure] if on_failure else []
+
+    def fail(self):
+        for callback in self.on_failure:
+            callback()
+
+# Writes session snapshots to disk on its own thread so saving never blocks the UI.
+# Saves that arrive while a write is in progress are coalesced per file: a full snapshot replaces
+# whatever was pending, journal appends are concatenated onto it (dropping one would lose a turn).
+# After a failed write, appends to that file are dropped until the next full snapshot, so nothing is written
+# after the gap; on_failure tells the journal to send one.
+class SaveWriter(QThread):
+    saved = pyqtSignal(str, float)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self):
+        super().__init__()
+        self.condition = threading.Condition()
+        self.pending: dict[str, SaveJob] = {}
+        self.busy = False
+        self.stopping = False
+        self.broken: set[str] = set()
+
+    def submit(self, path: str, data: bytes, append: bool = False, on_failure: Callable[[], None] = None):
+        with self.condition:
+            job = self.pending.get(path)
+            if job and append:
+                job.data += data
+                if on_failure:
+                    job.on_failure.append(on_failure)
+            else:
+                self.pending[path] = SaveJob(path, data, append, on_failure)
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopping:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                path = next(iter(self.pending))
+                job = self.pending.pop(path)
+                if job.append and path in self.broken:
+                    job.fail()
+                    continue
+                self.busy = True
+
+            started = time.perf_counter()
+            try:
+                if job.append:
+                    append(job.path, job.data)
+                else:
+                    write_atomic(job.path, job.data)
+            # anything else (e.g. a bad path) must not end the thread, every later save would be lost
+            except Exception as e:
+                self.broken.add(job.path)
+                job.fail()
+                self.failed.emit(job.path, str(e) or type(e).__name__)
+            else:
+                self.broken.discard(job.path)
+                self.saved.emit(job.path, time.perf_counter() - started)
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+
+    # waits (at most `timeout` seconds) for everything submitted so far to be written
+    def flush(self, timeout: float = 2.0) -> bool:
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.pending or self.busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    # the thread still writes whatever is pending before it ends, waited for (at most `timeout` seconds in all).
+    # If it's still writing after that it's handed to the application, so it isn't destroyed while running.
+    def stop(self, timeout: float = 2.0) -> bool:
+        deadline = time.monotonic() + timeout
+        self.flush(timeout)
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        stopped = self.wait(max(0, int((deadline - time.monotonic()) * 1000)))
+        if not stopped:
+            self.setParent(QCoreApplication.instance())
+        return stopped
@@ -0,0 +1,407 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import queue
+import base64
+import asyncio
+import argparse
+import threading
+from io import BytesIO
+from typing import Callable
+from pydantic_core import to_jsonable_python
+from websockets.asyncio.server import serve, ServerConnection
+from websockets.exceptions import ConnectionClosed
+import chat
+from settings import SettingsObject, loadSettings
+from session import GameSession, GenerationError
+from image_cache import ImageCache
+import metrics
+from journal import write_atomic, append
+from transport import make_clients
+
+# Hosts many game sessions on one asyncio loop, for playing over WebSocket instead of in a GameWindow.
+#
+#   python src/server.py [--host 127.0.0.1] [--port 8765] [--sessions DIR] [--worlds DIR] [--idle 300] [--max-active 1000]
+#
+# Messages are JSON objects with a "type". From the client:
+#   {"type": "hello", "session": id | null, "world": name | null}   first message, resumes or starts a session
+#   {"type": "choose", "text": choice}
+#   {"type": "use_item", "item": name, "option": option}
+#   {"type": "image"}                                               the image for the current chapter
+#   {"type": "retry"}                                               tries a turn that failed again
+# From the server:
+#   {"type": "session", "id": id, "game": state | null}
+#   {"type": "text", "text": chunk}, {"type": "field", "name": field, "value": value}, {"type": "retry", "problem": problem}
+#   {"type": "game", "game": state}
+#   {"type": "image", "prompt": prompt, "jpeg": base64}
+#   {"type": "error", "message": message}
+#
+# Every turn is appended to the session's file as it's played, so idle sessions can be dropped from memory at
+# any time and loaded again when the player reconnects. Metrics are labelled with the session id, set DM_METRICS
+# (see metrics.py) to scrape them; an evicted session's series are dropped.
+
+sessions_dir = os.path.join(os.path.dirname(__file__), "server_sessions")
+
+# Session files are written on one thread in the order they were submitted, so the loop never waits on disk.
+# Same interface as SaveWriter, without Qt, and like it drops appends to a file whose last write failed until
+# the next full snapshot.
+class DiskWriter:
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.failures = 0
+        self.broken: set[str] = set()
+        self.thread = threading.Thread(target=self.run, name="dm-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, path: str, data: bytes, append: bool = False, on_failure: Callable[[], None] = None):
+        self.jobs.put((path, data, append, on_failure))
+
+    def run(self):
+        while True:
+            path, data, appending, on_failure = self.jobs.get()
+            try:
+                if appending and path in self.broken:
+                    raise OSError(f"{path} is waiting for a full save")
+                if appending:
+                    append(path, data)
+                else:
+                    write_atomic(path, data)
+                self.broken.discard(path)
+            except Exception:
+                self.failures += 1
+                self.broken.add(path)
+                if on_failure:
+                    on_failure()
+            finally:
+                self.jobs.task_done()
+
+    def flush(self):
+        self.jobs.join()
+
+class HostedSession:
+    def __init__(self, id: str, session: GameSession):
+        self.id = id
+        self.session = session
+        # one turn at a time per session. The task is set as soon as a turn is started, so input is checked against
+        # the game before a second message could start another.
+        self.lock = asyncio.Lock()
+        self.turn: asyncio.Task = None
+        self.connections: set["Connection"] = set()
+        self.last_seen = time.monotonic()
+
+    def idle(self, now: float, timeout: float) -> bool:
+        return not self.connections and not self.playing() and now - self.last_seen > timeout
+
+    def playing(self) -> bool:
+        return self.turn is not None and not self.turn.done()
+
+    def broadcast(self, message: dict):
+        for connection in self.connections:
+            connection.send(message)
+
+# One client socket. Messages are queued and sent in order by their own task, so a slow client only
+# slows itself down.
+class Connection:
+    def __init__(self, websocket: ServerConnection):
+        self.websocket = websocket
+        self.outbox: asyncio.Queue = asyncio.Queue()
+        self.sender = asyncio.create_task(self.send_all())
+
+    def send(self, message: dict):
+        self.outbox.put_nowait(message)
+
+    async def send_all(self):
+        try:
+            while True:
+                message = await self.outbox.get()
+                await self.websocket.send(json.dumps(message, default=to_jsonable_python))
+        except ConnectionClosed:
+            pass
+
+    def close(self):
+        self.sender.cancel()
+
+class GameServer:
+    def __init__(self, genai_client, together_client, settings: SettingsObject, directory: str = sessions_dir, worlds: str = None,
+            idle_timeout: float = 300.0, max_active: int = 1000, image_cache: ImageCache = None):
+        self.genai_client = genai_client
+        self.together_client = together_client
+        self.settings = settings
+        self.directory = directory
+        self.worlds = worlds
+        self.idle_timeout = idle_timeout
+        self.max_active = max_active
+        self.image_cache = image_cache
+        self.writer = DiskWriter()
+        self.active: dict[str, HostedSession] = {}
+        self.opening: dict[str, asyncio.Future] = {}
+
+        self.connections = 0
+        self.turns = 0
+        self.turn_seconds = 0.0
+        self.failed_turns = 0
+        self.evictions = 0
+        self.rehydrations = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, id: str) -> str:
+        return os.path.join(self.directory, f"{id}.dms")
+
+    def world_path(self, name: str) -> str | None:
+        if not self.worlds or not name:
+            return None
+        path = os.path.join(self.worlds, os.path.basename(name))
+        if not path.endswith(".dmt"):
+            path += ".dmt"
+        return path if os.path.exists(path) else None
+
+    async def open(self, id: str = None, world: str = None) -> HostedSession:
+        # ids end up in file names, only ones we handed out are accepted
+        if not isinstance(id, str) or not re.fullmatch("[0-9a-f]{32}", id):
+            id = None
+        if id and id in self.active:
+            return self.active[id]
+        # two connections resuming the same session share one load
+        if id and id in self.opening:
+            hosted = await self.opening[id]
+            if hosted:
+                return hosted
+
+        if id:
+            self.opening[id] = asyncio.get_running_loop().create_future()
+            try:
+                # it may have been evicted moments ago, with its last save still queued
+                await asyncio.to_thread(self.writer.flush)
+                hosted = None
+                if os.path.exists(self.path(id)):
+                    session = await asyncio.to_thread(GameSession.load, self.path(id), self.genai_client, self.together_client, self.settings, image_cache=self.image_cache)
+                    hosted = self.host(id, session)
+                    self.rehydrations += 1
+                self.opening.pop(id).set_result(hosted)
+            except BaseException as e:
+                self.opening.pop(id).set_exception(e)
+                raise
+            if hosted:
+                return hosted
+
+        # unknown sessions start over
+        id = uuid.uuid4().hex
+        world_path = self.world_path(world)
+        if world_path:
+            session = await asyncio.to_thread(GameSession.load, world_path, self.genai_client, self.together_client, self.settings, image_cache=self.image_cache)
+        else:
+            session = GameSession.new(self.genai_client, self.together_client, self.settings, image_cache=self.image_cache)
+        return self.host(id, session)
+
+    def host(self, id: str, session: GameSession) -> HostedSession:
+        session.name = id
+        session.writer = self.writer
+        session.autosave = True
+        session.path = self.path(id)
+        hosted = HostedSession(id, session)
+        self.active[id] = hosted
+        self.make_room()
+        return hosted
+
+    def evict(self, hosted: HostedSession):
+        # turns are already on disk, this only writes a session that has never been saved
+        if not os.path.exists(hosted.session.path) or not hosted.session.journal:
+            hosted.session.save()
+        else:
+            hosted.session.save_turn()
+        del self.active[hosted.id]
+        metrics.registry.forget(session=hosted.id)
+        # it'd expire anyway, but a reloaded session makes its own
+        if hosted.session.chat.context_cache:
+            asyncio.create_task(hosted.session.chat.context_cache.arelease(hosted.session.chat.client))
+        self.evictions += 1
+
+    # least recently used sessions nobody is connected to go first
+    def make_room(self):
+        if len(self.active) <= self.max_active:
+            return
+        idle = sorted((hosted for hosted in self.active.values() if hosted.idle(time.monotonic(), 0)), key=lambda hosted: hosted.last_seen)
+        for hosted in idle[:len(self.active) - self.max_active]:
+            self.evict(hosted)
+
+    async def sweep(self):
+        while True:
+            await asyncio.sleep(max(0.05, self.idle_timeout / 4))
+            now = time.monotonic()
+            for hosted in [hosted for hosted in self.active.values() if hosted.idle(now, self.idle_timeout)]:
+                self.evict(hosted)
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self.active),
+            "connections": self.connections,
+            "turns": self.turns,
+            "failed_turns": self.failed_turns,
+            "average_turn": self.turn_seconds / self.turns if self.turns else None,
+            "evictions": self.evictions,
+            "rehydrations": self.rehydrations,
+            "write_failures": self.writer.failures,
+        }
+
+    async def handle(self, websocket: ServerConnection):
+        connection = Connection(websocket)
+        hosted = None
+        self.connections += 1
+        try:
+            async for raw in websocket:
+                try:
+                    message = json.loads(raw)
+                except json.JSONDecodeError:
+                    connection.send({ "type": "error", "message": "Messages must be JSON." })
+                    continue
+
+                if hosted is None:
+                    if message.get("type") != "hello":
+                        connection.send({ "type": "error", "message": "Say hello first." })
+                        continue
+                    try:
+                        hosted = await self.open(message.get("session"), message.get("world"))
+                    except Exception as e:
+                        connection.send({ "type": "error", "message": f"Could not open the session: {e}" })
+                        continue
+                    hosted.connections.add(connection)
+                    hosted.last_seen = time.monotonic()
+                    game = None if hosted.session.needs_response else hosted.session.game
+                    connection.send({ "type": "session", "id": hosted.id, "game": game })
+                    if hosted.session.needs_response and not hosted.playing():
+                        self.start_turn(hosted, hosted.session.astart)
+                    continue
+
+                hosted.last_seen = time.monotonic()
+                self.receive(hosted, connection, message)
+        except ConnectionClosed:
+            pass
+        finally:
+            self.connections -= 1
+            if hosted:
+                hosted.connections.discard(connection)
+                hosted.last_seen = time.monotonic()
+            connection.close()
+
+    def receive(self, hosted: HostedSession, connection: Connection, message: dict):
+        kind = message.get("type")
+        session = hosted.session
+
+        if kind == "image":
+            asyncio.create_task(self.send_image(session, connection))
+            return
+
+        if kind not in ("choose", "use_item", "retry"):
+            connection.send({ "type": "error", "message": f"Unknown message type: {kind}" })
+            return
+        if hosted.playing():
+            connection.send({ "type": "error", "message": "A turn is already in progress." })
+            return
+        if kind == "retry" or session.needs_response:
+            if session.needs_response:
+                self.start_turn(hosted, session.astart)
+            else:
+                connection.send({ "type": "error", "message": "There is no failed turn to retry." })
+            return
+
+        # players can only do what the game offers them
+        game = session.game
+        if kind == "choose":
+            text = message.get("text")
+            if text not in [choice.text for choice in game.choices]:
+                connection.send({ "type": "error", "message": "That isn't one of the choices." })
+                return
+            self.start_turn(hosted, lambda **callbacks: session.achoose(text, **callbacks))
+        else:
+            item, option = message.get("item"), message.get("option")
+            if not any(entry.name == item and option in entry.options for entry in game.inventory):
+                connection.send({ "type": "error", "message": "You don't have that item." })
+                return
+            self.start_turn(hosted, lambda **callbacks: session.ause_item(item, option, **callbacks))
+
+    def start_turn(self, hosted: HostedSession, turn: Callable):
+        hosted.turn = asyncio.create_task(self.play(hosted, turn))
+
+    async def play(self, hosted: HostedSession, turn: Callable):
+        async with hosted.lock:
+            started = time.perf_counter()
+            try:
+                game = await turn(
+                    on_text = lambda text: hosted.broadcast({ "type": "text", "text": text }),
+                    on_field = lambda name, value: hosted.broadcast({ "type": "field", "name": name, "value": value }),
+                    on_retry = lambda problem: hosted.broadcast({ "type": "retry", "problem": problem }),
+                )
+            except GenerationError as e:
+                self.failed_turns += 1
+                hosted.broadcast({ "type": "error", "message": str(e) })
+                return
+            except Exception as e:
+                self.failed_turns += 1
+                hosted.broadcast({ "type": "error", "message": f"The Dungeon Master couldn't respond: {e}" })
+                return
+            finally:
+                hosted.last_seen = time.monotonic()
+
+            self.turns += 1
+            self.turn_seconds += time.perf_counter() - started
+            hosted.broadcast({ "type": "game", "game": game })
+
+    async def send_image(self, session: GameSession, connection: Connection):
+        prompt = session.game.imagePrompt
+        image = await session.afetch_image(prompt)
+        if image is None:
+            connection.send({ "type": "error", "message": "No image for this chapter." })
+            return
+        connection.send({ "type": "image", "prompt": prompt, "jpeg": await asyncio.to_thread(encode_jpeg, image) })
+
+    async def serve(self, host: str, port: int, ready: Callable[[int], None] = None):
+        sweeper = asyncio.create_task(self.sweep())
+        try:
+            async with serve(self.handle, host, port, max_size=2 ** 20) as server:
+                if ready:
+                    ready(next(iter(server.sockets)).getsockname()[1])
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+            for hosted in list(self.active.values()):
+                self.evict(hosted)
+            await asyncio.to_thread(self.writer.flush)
+
+def encode_jpeg(image) -> str:
+    buffer = BytesIO()
+    image.convert("RGB").save(buffer, "JPEG", quality=85)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+def main():
+    parser = argparse.ArgumentParser(description="Host Dungeon Master sessions over WebSocket.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--sessions", default=sessions_dir, help="where session files are kept")
+    parser.add_argument("--worlds", default=None, help="folder of .dmt files players can start from")
+    parser.add_argument("--idle", type=float, default=300.0, help="seconds before a disconnected session is unloaded")
+    parser.add_argument("--max-active", type=int, default=1000, help="sessions kept in memory at once")
+    args = parser.parse_args()
+
+    settings = loadSettings() or SettingsObject()
+    settings.gemini_api_key = os.environ.get("GEMINI_API_KEY", settings.gemini_api_key)
+    settings.together_api_key = os.environ.get("TOGETHER_API_KEY", settings.together_api_key)
+    if not settings.gemini_api_key and settings.transport_mode != "replay":
+        print("No Gemini API key, set GEMINI_API_KEY or save one in the settings.")
+        return 1
+    chat.settings = settings
+
+    genai_client, together_client = make_clients(settings)
+    server = GameServer(genai_client, together_client, settings, args.sessions, args.worlds, args.idle, args.max_active,
+        ImageCache(max_bytes=settings.image_cache_mb * 1024 * 1024))
+    try:
+        asyncio.run(server.serve(args.host, args.port, lambda port: print(f"Listening on ws://{args.host}:{port}", flush=True)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,424 @@
+import asyncio
+import base64
+import time
+import uuid
+from io import BytesIO
+from typing import Callable
+from PIL import Image
+from google.genai import types
+from chat import Chat
+from gameModel import GameModel, GameDelta
+from generate_dmt import system_instruction, delta_instruction
+from stream_parser import GameModelStreamParser
+from image_cache import ImageCache
+from rules import RulesEngine
+from repair import RepairLog, patchable, patch_schema, patch_request, patch_config, patched_response
+from journal import SessionJournal, load_session, write_atomic, append as append_data
+from settings import SettingsObject
+from tracing import span, traced
+import metrics
+
+image_model = "black-forest-labs/FLUX.1-schnell-Free"
+image_width = 1024
+image_height = 768
+image_steps = 2
+
+class GenerationError(RuntimeError):
+    pass
+
+def image_key(image_prompt: str) -> str:
+    return ImageCache.key(image_prompt, image_model, image_width, image_height, image_steps)
+
+# cached image for the prompt, or a new one from Together. Doesn't need a session, so the library preview can use it.
+def fetch_image(client, image_prompt: str, cache: ImageCache = None, attempts: int = 3, session: str = "") -> Image.Image | None:
+    key = image_key(image_prompt)
+    if cache:
+        with span("image.cache", "image"):
+            image = cache.get(key)
+        metrics.image_cache.inc(session=session, result="hit" if image else "miss")
+        if image:
+            return image
+
+    if not client:
+        return None
+
+    started = time.perf_counter()
+    res = None
+    for attempt in range(attempts):
+        try:
+            with span("together", "network", attempt=attempt):
+                res = client.images.generate(
+                    prompt = image_prompt,
+                    model = image_model,
+                    width = image_width,
+                    height = image_height,
+                    steps = image_steps,
+                    n = 1,
+                    response_format = "b64_json",
+                )
+            break
+        except Exception:
+            pass
+
+    if not res:
+        return None
+    metrics.image_latency.observe(time.perf_counter() - started, model=image_model, session=session)
+
+    with span("image.decode", "image"):
+        image = Image.open(BytesIO(base64.b64decode(res.data[0].b64_json)))
+        image.load()
+    if cache:
+        cache.put(key, image, time.perf_counter() - started)
+    return image
+
+# The game loop without any UI: owns the Chat and the game state, checks responses against the rules (repairing
+# what it can locally, then with small requests for single fields, retrying the whole turn a bounded number of
+# times otherwise), fetches images and saves the session. GameWindow is a view over one of these, and it
+# can be driven directly for tests, benchmarks or a server.
+class GameSession:
+    def __init__(self, chat: Chat, genai_client=None, together_client=None, settings: SettingsObject=None, image_cache: ImageCache=None, max_retries: int=3, max_repairs: int=2):
+        self.chat = chat
+        self.genai_client = genai_client
+        self.together_client = together_client
+        self.settings = settings or SettingsObject()
+        self.image_cache = image_cache
+        self.max_retries = max_retries
+        # field repair requests per attempt, before falling back to a full retry
+        self.max_repairs = max_repairs
+
+        if genai_client:
+            self.chat.client = genai_client
+
+        self.path: str = None
+        self.journal: SessionJournal = None
+        # when set, every valid turn is appended to `path` as soon as it is committed
+        self.autosave = False
+        # anything with submit(path, data, append=False), e.g. SaveWriter. Saves are written inline without one.
+        self.writer = None
+
+        # the session label on its metrics, unique per session (the server and autoplay set their own ids)
+        self.name = uuid.uuid4().hex[:12]
+        # a speculative fork's metrics are labelled apart from the turns actually played
+        self.speculative = False
+        self.retries = 0
+        # every response's tokens, including retries and repairs that didn't make it into the history
+        self.tokens_used = 0
+        self.rules = RulesEngine()
+        self.repairs = RepairLog()
+
+    @classmethod
+    def new(cls, genai_client=None, together_client=None, settings: SettingsObject=None, instruction: str=system_instruction, **kwargs) -> "GameSession":
+        chat = Chat(
+            config = types.GenerateContentConfig(
+                temperature = 2.0,
+                response_mime_type = "application/json",
+                response_schema = GameModel,
+                system_instruction = instruction,
+            ),
+            client = genai_client,
+        )
+        session = cls(chat, genai_client, together_client, settings, **kwargs)
+        session.set_response_mode(session.settings.response_mode)
+        return session
+
+    @classmethod
+    def load(cls, path: str, genai_client=None, together_client=None, settings: SettingsObject=None, **kwargs) -> "GameSession":
+        chat, journal = load_session(path)
+        session = cls(chat, genai_client, together_client, settings, **kwargs)
+        session.journal = journal
+        if journal:
+            journal.image_key = image_key
+        if not path.endswith(".dmt"):
+            session.path = path
+        # a fresh world file, nothing has been generated yet
+        if len(chat.history) == 1 and session.needs_response:
+            session.set_response_mode(session.settings.response_mode)
+        return session
+
+    # a copy that can play ahead without touching this session's history or files
+    def fork(self) -> "GameSession":
+        fork = GameSession(self.chat.fork(), self.genai_client, self.together_client, self.settings, self.image_cache, self.max_retries, self.max_repairs)
+        fork.name = self.name
+        fork.speculative = True
+        return fork
+
+    def adopt(self, fork: "GameSession"):
+        self.chat = fork.chat
+        self.rules.absorb(fork.rules)
+        self.repairs.absorb(fork.repairs)
+        # the fork counted its turn as speculative, this is the one the player played
+        if not fork.needs_response:
+            metrics.turns.inc(outcome="accepted", **self.metric_labels())
+        if self.autosave and not fork.needs_response:
+            self.save_turn()
+
+    # only possible before the first response, a session keeps its mode from then on
+    def set_response_mode(self, mode: str):
+        if mode == "delta" and self.chat.response_mode != "delta":
+            self.chat.config.response_schema = GameDelta
+            self.chat.config.system_instruction += delta_instruction
+
+    @property
+    def game(self) -> GameModel:
+        return self.chat.state.game
+
+    @property
+    def needs_response(self) -> bool:
+        return not self.chat.history or isinstance(self.chat.history[-1], types.Content)
+
+    @traced("turn", "session")
+    def send(self, message: types.Part | str = None, on_text: Callable[[str], None]=None, on_field: Callable[[str, object], None]=None, on_retry: Callable[[str], None]=None) -> GameModel:
+        replaced = self.replace_pending(message)
+        start = len(self.chat.history)
+        first = message
+        try:
+            for attempt in range(self.max_retries + 1):
+                started = time.perf_counter()
+                res = self.chat.send_message(content=message, on_chunk=self.chunk_handler(on_text, on_field))
+                self.record(res, "turn", started)
+                game, problems = self.check(res)
+                for _ in range(self.max_repairs):
+                    if not patchable(problems):
+                        break
+                    game, problems = self.repair(game, problems, self.patch(game, problems))
+                if not problems:
+                    break
+                message = self.retry_message(problems, attempt, on_retry)
+        except BaseException as e:
+            self.restore(start, replaced, failed=isinstance(e, Exception))
+            raise
+
+        if not problems:
+            return self.accept(game, start, first)
+        self.rollback(start, first)
+        raise GenerationError(f"No valid response after {self.max_retries + 1} attempts: {describe(problems)}")
+
+    # runs on the chat's async client. An error, or cancelling it (or a timeout around it), leaves the session as it was before the call.
+    @traced("turn", "session")
+    async def asend(self, message: types.Part | str = None, on_text: Callable[[str], None]=None, on_field: Callable[[str, object], None]=None, on_retry: Callable[[str], None]=None) -> GameModel:
+        replaced = self.replace_pending(message)
+        start = len(self.chat.history)
+        first = message
+        try:
+            for attempt in range(self.max_retries + 1):
+                started = time.perf_counter()
+                res = await self.chat.send_message_async(content=message, on_chunk=self.chunk_handler(on_text, on_field))
+                self.record(res, "turn", started)
+                game, problems = self.check(res)
+                for _ in range(self.max_repairs):
+                    if not patchable(problems):
+                        break
+                    game, problems = self.repair(game, problems, await self.apatch(game, problems))
+                if not problems:
+                    break
+                message = self.retry_message(problems, attempt, on_retry)
+        except BaseException as e:
+            self.restore(start, replaced, failed=isinstance(e, Exception))
+            raise
+
+        if not problems:
+            return self.accept(game, start, first)
+        self.rollback(start, first)
+        raise GenerationError(f"No valid response after {self.max_retries + 1} attempts: {describe(problems)}")
+
+    def record(self, res: types.GenerateContentResponse, request: str, started: float):
+        usage = res.usage_metadata
+        if usage and usage.total_token_count:
+            self.tokens_used += usage.total_token_count
+        metrics.record_response(res, request, started, **self.metric_labels())
+
+    def metric_labels(self) -> dict:
+        return { "model": self.chat.model, "session": self.name, "speculative": "1" if self.speculative else "0" }
+
+    def chunk_handler(self, on_text, on_field) -> Callable[[str], None] | None:
+        if not on_text and not on_field:
+            return None
+        parser = GameModelStreamParser(self.chat.config.response_schema)
+        return lambda chunk: self.dispatch(parser.feed(chunk), on_text, on_field)
+
+    # the merged game (after the rules' repairs) and what's still wrong with it, by field
+    def check(self, res: types.GenerateContentResponse) -> tuple[GameModel, dict[str, str]]:
+        # not valid for the schema (or cut off): nothing to patch, the turn is requested again
+        if res.parsed is None:
+            return self.chat.state.game, { "response": "Your response was not valid JSON for the schema." }
+        with span("rules", "rules"):
+            return self.rules.enforce(self.chat.state.game, self.chat.state.merge(res.parsed))
+
+    def patch(self, game: GameModel, problems: dict[str, str]) -> tuple[list[str], float, types.GenerateContentResponse | None]:
+        started = time.perf_counter()
+        try:
+            with span("repair", "network", fields=",".join(problems)):
+                res = self.chat.client.models.generate_content(
+                    model = self.chat.model,
+                    config = patch_config(patch_schema(list(problems))),
+                    contents = patch_request(game, problems),
+                )
+        except Exception:
+            res = None
+        else:
+            self.record(res, "repair", started)
+        return list(problems), started, res
+
+    async def apatch(self, game: GameModel, problems: dict[str, str]) -> tuple[list[str], float, types.GenerateContentResponse | None]:
+        started = time.perf_counter()
+        try:
+            with span("repair", "network", fields=",".join(problems)):
+                res = await self.chat.client.aio.models.generate_content(
+                    model = self.chat.model,
+                    config = patch_config(patch_schema(list(problems))),
+                    contents = patch_request(game, problems),
+                )
+        except Exception:
+            res = None
+        else:
+            self.record(res, "repair", started)
+        return list(problems), started, res
+
+    # puts the patched fields into the last response (which is what the history keeps) and checks it again
+    def repair(self, game: GameModel, problems: dict[str, str], patch: tuple) -> tuple[GameModel, dict[str, str]]:
+        fields, started, res = patch
+        if res is None or res.parsed is None:
+            self.repairs.record(fields, started, res, False)
+            return game, problems
+
+        self.rewrite(len(self.chat.history) - 1)
+        self.chat.history[-1] = patched_response(self.chat.history[-1], res.parsed)
+        game, problems = self.check(self.chat.history[-1])
+        self.repairs.record(fields, started, res, not problems)
+        return game, problems
+
+    # commits the game, dropping the failed attempts and the requests to fix them from the history
+    def accept(self, game: GameModel, start: int, message) -> GameModel:
+        first = start + (1 if message else 0)
+        if first < len(self.chat.history) - 1:
+            self.rewrite(first)
+        del self.chat.history[first:-1]
+        self.chat.summarized = min(self.chat.summarized, first)
+        self.chat.state.commit(game)
+        metrics.turns.inc(outcome="accepted", **self.metric_labels())
+        if self.autosave:
+            self.save_turn()
+        return game
+
+    # a new message takes the place of one whose turn failed (see rollback), rather than following it with no response between them
+    def replace_pending(self, message) -> types.Content | None:
+        if message and self.chat.history and isinstance(self.chat.history[-1], types.Content):
+            self.chat.summarized = min(self.chat.summarized, len(self.chat.history) - 1)
+            self.rewrite(len(self.chat.history) - 1)
+            return self.chat.history.pop()
+        return None
+
+    # the history from `index` on is about to be removed or replaced. The journal only appends, so if any of it is
+    # already in the file the next save writes the whole session instead.
+    def rewrite(self, index: int):
+        if self.journal and index < min(self.journal.written, len(self.chat.history)):
+            self.journal.invalidate()
+
+    # as before a send that raised or was cancelled, with the failed message it replaced (if any) pending again
+    def restore(self, start: int, replaced: types.Content | None, failed: bool):
+        self.rewrite(start)
+        del self.chat.history[start:]
+        if replaced:
+            self.chat.history.append(replaced)
+        self.chat.summarized = min(self.chat.summarized, len(self.chat.history))
+        if failed:
+            metrics.turns.inc(outcome="failed", **self.metric_labels())
+
+    # back to waiting for a response to `message`
+    def rollback(self, start: int, message):
+        self.rewrite(start + (1 if message else 0))
+        del self.chat.history[start + (1 if message else 0):]
+        self.chat.summarized = min(self.chat.summarized, len(self.chat.history))
+        metrics.turns.inc(outcome="failed", **self.metric_labels())
+
+    def retry_message(self, problems: dict[str, str], attempt: int, on_retry) -> types.Part:
+        problem = describe(problems)
+        if attempt < self.max_retries:
+            self.retries += 1
+            metrics.retries.inc(**self.metric_labels())
+            if on_retry:
+                on_retry(problem)
+        return types.Part(text=f"Please regenerate your response. What you need to fix: {problem}")
+
+    def dispatch(self, events: list[tuple], on_text, on_field):
+        for event in events:
+            if event[0] == "text":
+                if on_text:
+                    on_text(event[1])
+            elif on_field:
+                on_field(event[1], event[2])
+
+    def start(self, **callbacks) -> GameModel:
+        return self.send("..." if not self.chat.history else None, **callbacks)
+
+    def choose(self, choice_text: str, **callbacks) -> GameModel:
+        return self.send(choice_message(choice_text), **callbacks)
+
+    def use_item(self, item_name: str, option: str, **callbacks) -> GameModel:
+        return self.send(item_message(item_name, option), **callbacks)
+
+    def fetch_image(self, image_prompt: str = None) -> Image.Image | None:
+        image_prompt = image_prompt or self.game.imagePrompt
+        if not image_prompt:
+            return None
+        return fetch_image(self.together_client, image_prompt, self.image_cache, session=self.name)
+
+    # writes the whole session, and makes `path` the autosave location
+    @traced("autosave", "save")
+    def save(self, path: str = None):
+        path = path or self.path
+        if not path:
+            raise ValueError("No save location set.")
+        if not self.journal or self.journal.path != path:
+            self.journal = SessionJournal(path, image_key=image_key)
+        self.write(path, self.journal.snapshot(self.chat))
+        self.path = path
+
+    # appends the turns since the last save to `path`
+    @traced("autosave", "save")
+    def save_turn(self):
+        if not self.path:
+            return
+        if self.journal and self.journal.path == self.path and not self.journal.dirty:
+            self.write(self.path, self.journal.pending(self.chat), append=True)
+        else:
+            # first save of a session loaded from an older (pickled) file, or the last write failed
+            self.save(self.path)
+
+    def write(self, path: str, data: bytes, append: bool = False):
+        if self.writer:
+            self.writer.submit(path, data, append=append, on_failure=self.journal.invalidate)
+            return
+        try:
+            if append:
+                append_data(path, data)
+            else:
+                write_atomic(path, data)
+        except BaseException:
+            self.journal.invalidate()
+            raise
+
+    async def astart(self, **callbacks) -> GameModel:
+        return await self.asend("..." if not self.chat.history else None, **callbacks)
+
+    async def achoose(self, choice_text: str, **callbacks) -> GameModel:
+        return await self.asend(choice_message(choice_text), **callbacks)
+
+    async def ause_item(self, item_name: str, option: str, **callbacks) -> GameModel:
+        return await self.asend(item_message(item_name, option), **callbacks)
+
+    # together's client is blocking, image requests run on the loop's executor
+    async def afetch_image(self, image_prompt: str = None) -> Image.Image | None:
+        return await asyncio.to_thread(self.fetch_image, image_prompt)
+
+    async def asave(self, path: str = None):
+        await asyncio.to_thread(self.save, path)
+
+def describe(problems: dict[str, str]) -> str:
+    return " ".join(problems.values())
+
+def choice_message(choice_text: str) -> str:
+    return f"I have chosen: {choice_text}"
+
+def item_message(item_name: str, option: str) -> str:
+    return f"Use item '{item_name}' - Option '{option}'"
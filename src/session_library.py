@@ -0,0 +1,183 @@
+import sys
+import os
+import json
+import time
+import hashlib
+from datetime import datetime
+from PyQt5.QtWidgets import (
+    QMainWindow,
+    QWidget,
+    QVBoxLayout,
+    QHBoxLayout,
+    QPushButton,
+    QListWidget,
+    QListWidgetItem,
+    QFileDialog,
+    QLabel,
+)
+from PyQt5.QtGui import QIcon, QPixmap, QImage
+from PyQt5.QtCore import Qt, QSize
+from google.genai import types
+from style import init_window
+from chat import Chat, is_model_turn
+from journal import write_atomic
+
+index_path = os.path.join(os.path.dirname(__file__), "sessions.json")
+thumbnail_dir = os.path.join(os.path.dirname(__file__), "cache", "thumbnails")
+thumbnail_size = QSize(160, 120)
+
+# Small sidecar index of saved sessions, so the library can be shown without opening any session file.
+# Each entry also keeps the last game state, which is rendered straight away when a session is opened.
+class SessionIndex:
+    def __init__(self, path: str = index_path):
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    self.entries = json.load(file)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def update(self, session_path: str, entry: dict):
+        self.entries[os.path.abspath(session_path)] = entry
+
+    def remove(self, session_path: str):
+        self.entries.pop(os.path.abspath(session_path), None)
+
+    def data(self) -> bytes:
+        return json.dumps(self.entries, ensure_ascii=False, indent=1).encode("utf-8")
+
+    def save(self):
+        write_atomic(self.path, self.data())
+
+    def sessions(self) -> list[tuple[str, dict]]:
+        return sorted(self.entries.items(), key=lambda item: item[1].get("last_played", 0), reverse=True)
+
+def save_thumbnail(session_path: str, image: QImage) -> str | None:
+    if image is None or image.isNull():
+        return None
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    name = hashlib.sha1(os.path.abspath(session_path).encode("utf-8")).hexdigest() + ".jpg"
+    path = os.path.join(thumbnail_dir, name)
+    image.scaled(thumbnail_size, Qt.KeepAspectRatio, Qt.SmoothTransformation).save(path, "JPG", 85)
+    return path
+
+def session_entry(session_path: str, chat: Chat, thumbnail: str = None) -> dict:
+    game = chat.state.game
+
+    character = ""
+    for res in chat.history:
+        if isinstance(res, types.Content) and res.role == "user":
+            text = " ".join(part.text for part in res.parts if part.text)
+            if text.startswith("I have chosen: "):
+                character = text.removeprefix("I have chosen: ")
+                break
+
+    excerpt = game.chapterText.replace("\\n", " ").replace("\n", " ").strip()
+    if len(excerpt) > 200:
+        excerpt = excerpt[:200].rsplit(" ", 1)[0] + "..."
+
+    return {
+        "title": os.path.splitext(os.path.basename(session_path))[0],
+        "character": character,
+        "excerpt": excerpt,
+        "quest": game.currentQuest.title,
+        "turns": sum(1 for res in chat.history if is_model_turn(res)),
+        "last_played": time.time(),
+        "thumbnail": thumbnail,
+        "state": game.model_dump(mode="json"),
+    }
+
+class SessionLibrary(QMainWindow):
+    def __init__(self, main_window):
+        super().__init__()
+        self.setWindowTitle("Dungeon Master - Saved Sessions")
+        self.setGeometry(100, 100, 1366, 768)
+
+        self.main_window = main_window
+        self.index = SessionIndex()
+
+        self.main_widget = QWidget()
+        self.main_layout = QVBoxLayout()
+
+        self.title_label = QLabel("Saved sessions")
+        self.main_layout.addWidget(self.title_label)
+
+        self.session_list = QListWidget()
+        self.session_list.setIconSize(thumbnail_size)
+        self.session_list.itemDoubleClicked.connect(self.open_selected)
+        self.main_layout.addWidget(self.session_list)
+
+        self.button_layout = QHBoxLayout()
+
+        self.open_button = QPushButton("Open")
+        self.open_button.clicked.connect(self.open_selected)
+        self.button_layout.addWidget(self.open_button)
+
+        self.browse_button = QPushButton("Browse for a session file...")
+        self.browse_button.clicked.connect(self.browse)
+        self.button_layout.addWidget(self.browse_button)
+
+        self.remove_button = QPushButton("Remove from list")
+        self.remove_button.clicked.connect(self.remove_selected)
+        self.button_layout.addWidget(self.remove_button)
+
+        self.main_layout.addLayout(self.button_layout)
+
+        init_window(self)
+
+        self.main_widget.setLayout(self.main_layout)
+        self.setCentralWidget(self.main_widget)
+
+        self.populate()
+
+    def populate(self):
+        self.session_list.clear()
+        for path, entry in self.index.sessions():
+            if not os.path.exists(path):
+                continue
+            last_played = datetime.fromtimestamp(entry.get("last_played", 0)).strftime("%d %b %Y, %H:%M")
+            character = f" - {entry['character']}" if entry.get("character") else ""
+            item = QListWidgetItem(
+                f"{entry.get('title', os.path.basename(path))}{character}\n"
+                f"{entry.get('quest', '')} · {entry.get('turns', 0)} turns · {last_played}\n"
+                f"{entry.get('excerpt', '')}"
+            )
+            if entry.get("thumbnail") and os.path.exists(entry["thumbnail"]):
+                item.setIcon(QIcon(QPixmap(entry["thumbnail"])))
+            item.setData(Qt.UserRole, path)
+            self.session_list.addItem(item)
+
+    def open_selected(self):
+        item = self.session_list.currentItem()
+        if not item:
+            return
+        path = item.data(Qt.UserRole)
+        self.open_session(path, self.index.entries.get(path))
+
+    def browse(self):
+        options = QFileDialog.Options()
+        file_name, _ = QFileDialog.getOpenFileName(self, "Load DMS", "", "Dungeon Master Session Files (*.dms)", options=options)
+        if file_name:
+            self.open_session(file_name, self.index.entries.get(os.path.abspath(file_name)))
+
+    def remove_selected(self):
+        item = self.session_list.currentItem()
+        if not item:
+            return
+        self.index.remove(item.data(Qt.UserRole))
+        self.index.save()
+        self.populate()
+
+    def open_session(self, path, entry):
+        self.main_window.open_session(path, entry)
+        self.hide()
+
+    def resizeEvent(self, event):
+        self.background.setGeometry(self.rect())
+        super().resizeEvent(event)
+
+if __name__ == '__main__':
+    print("This file is not to be run as a standalone program.")
+    sys.exit(1)
@@ -13,6 +13,8 @@ from PyQt5.QtWidgets import (
     QMessageBox,
     QLineEdit,
     QComboBox,
+    QCheckBox,
+    QSpinBox,
 )
 from style import init_window
 import pickle, os
@@ -32,10 +34,27 @@ gemini_models = [
 ]
 
 class SettingsObject:
-    def __init__(self, gemini_api_key: str="", together_api_key: str="", gemini_model: str=""):
+    def __init__(self, gemini_api_key: str="", together_api_key: str="", gemini_model: str="", stream_responses: bool=True, history_turns: int=6, history_token_budget: int=8000, summary_mode: str="local", speculative: bool=False, speculative_concurrency: int=2, speculative_token_budget: int=200000, response_mode: str="full", image_cache_mb: int=256, transport_mode: str="live", cassette_dir: str="", context_cache: bool=True):
         self.gemini_api_key: str = gemini_api_key
         self.together_api_key: str = together_api_key
         self.gemini_model: str = gemini_model or "gemini-flash-latest"
+        self.stream_responses: bool = stream_responses
+        self.history_turns: int = history_turns
+        self.history_token_budget: int = history_token_budget
+        self.summary_mode: str = summary_mode
+        self.speculative: bool = speculative
+        self.speculative_concurrency: int = speculative_concurrency
+        self.speculative_token_budget: int = speculative_token_budget
+        self.response_mode: str = response_mode
+        self.image_cache_mb: int = image_cache_mb
+        self.transport_mode: str = transport_mode
+        self.cassette_dir: str = cassette_dir
+        self.context_cache: bool = context_cache
+
+    def __setstate__(self, state):
+        # settings saved by older versions won't have the newer fields
+        self.__init__()
+        self.__dict__.update(state)
 
 def loadSettings() -> SettingsObject | None:
     settings_path = os.path.join(os.path.dirname(__file__), "settings.dmx")
@@ -54,8 +73,8 @@ class Settings(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Dungeon Master - Settings")
-        self.setGeometry(500, 500, 600, 200)
-        self.setFixedSize(600, 200)
+        self.setGeometry(500, 500, 600, 600)
+        self.setFixedSize(600, 600)
         init_window(self)
         self.main_layout = QVBoxLayout()
         self.main_widget = QWidget()
@@ -92,9 +111,106 @@ class Settings(QMainWindow):
         self.gemini_model_field.addWidget(self.gemini_model_dropdown)
         self.field_layout.addLayout(self.gemini_model_field)
 
+        self.response_mode_field = QHBoxLayout()
+        self.response_mode_label = QLabel("Response format for new sessions")
+        self.response_mode_field.addWidget(self.response_mode_label)
+        self.response_mode_dropdown = QComboBox()
+        self.response_mode_dropdown.addItems(["full", "delta"])
+        self.response_mode_dropdown.setToolTip("'delta' asks the model for changes only, which makes responses shorter and faster.")
+        self.response_mode_field.addWidget(self.response_mode_dropdown)
+        self.field_layout.addLayout(self.response_mode_field)
+
+        self.stream_toggle = QCheckBox("Stream chapters as they are written")
+        self.stream_toggle.setChecked(True)
+        self.field_layout.addWidget(self.stream_toggle)
+
+        self.context_cache_toggle = QCheckBox("Cache the game instructions with Gemini (cheaper prompts)")
+        self.context_cache_toggle.setChecked(True)
+        self.field_layout.addWidget(self.context_cache_toggle)
+
+        self.history_turns_field = QHBoxLayout()
+        self.history_turns_label = QLabel("Recent turns sent in full")
+        self.history_turns_field.addWidget(self.history_turns_label)
+        self.history_turns_input = QSpinBox()
+        self.history_turns_input.setRange(1, 100)
+        self.history_turns_input.setValue(6)
+        self.history_turns_field.addWidget(self.history_turns_input)
+        self.field_layout.addLayout(self.history_turns_field)
+
+        self.history_budget_field = QHBoxLayout()
+        self.history_budget_label = QLabel("History token budget")
+        self.history_budget_field.addWidget(self.history_budget_label)
+        self.history_budget_input = QSpinBox()
+        self.history_budget_input.setRange(1000, 1000000)
+        self.history_budget_input.setSingleStep(1000)
+        self.history_budget_input.setValue(8000)
+        self.history_budget_field.addWidget(self.history_budget_input)
+        self.field_layout.addLayout(self.history_budget_field)
+
+        self.summary_mode_field = QHBoxLayout()
+        self.summary_mode_label = QLabel("Summary of older turns")
+        self.summary_mode_field.addWidget(self.summary_mode_label)
+        self.summary_mode_dropdown = QComboBox()
+        self.summary_mode_dropdown.addItems(["local", "model"])
+        self.summary_mode_field.addWidget(self.summary_mode_dropdown)
+        self.field_layout.addLayout(self.summary_mode_field)
+
+        self.speculative_toggle = QCheckBox("Pre-generate the next chapter for every choice (uses more tokens)")
+        self.field_layout.addWidget(self.speculative_toggle)
+
+        self.speculative_field = QHBoxLayout()
+        self.speculative_concurrency_label = QLabel("Parallel requests")
+        self.speculative_field.addWidget(self.speculative_concurrency_label)
+        self.speculative_concurrency_input = QSpinBox()
+        self.speculative_concurrency_input.setRange(1, 4)
+        self.speculative_concurrency_input.setValue(2)
+        self.speculative_field.addWidget(self.speculative_concurrency_input)
+        self.speculative_budget_label = QLabel("Token budget")
+        self.speculative_field.addWidget(self.speculative_budget_label)
+        self.speculative_budget_input = QSpinBox()
+        self.speculative_budget_input.setRange(10000, 10000000)
+        self.speculative_budget_input.setSingleStep(10000)
+        self.speculative_budget_input.setValue(200000)
+        self.speculative_field.addWidget(self.speculative_budget_input)
+        self.field_layout.addLayout(self.speculative_field)
+
+        self.image_cache_field = QHBoxLayout()
+        self.image_cache_label = QLabel("Image cache size (MB)")
+        self.image_cache_field.addWidget(self.image_cache_label)
+        self.image_cache_input = QSpinBox()
+        self.image_cache_input.setRange(16, 8192)
+        self.image_cache_input.setSingleStep(64)
+        self.image_cache_input.setValue(256)
+        self.image_cache_field.addWidget(self.image_cache_input)
+        self.field_layout.addLayout(self.image_cache_field)
+
+        self.transport_field = QHBoxLayout()
+        self.transport_label = QLabel("Network")
+        self.transport_field.addWidget(self.transport_label)
+        self.transport_dropdown = QComboBox()
+        self.transport_dropdown.addItems(["live", "record", "replay"])
+        self.transport_dropdown.setToolTip("'record' saves every request and response to the cassette folder, 'replay' plays them back without any network access.")
+        self.transport_field.addWidget(self.transport_dropdown)
+        self.cassette_input = QLineEdit()
+        self.cassette_input.setPlaceholderText("Cassette folder (default: src/cassettes)")
+        self.transport_field.addWidget(self.cassette_input)
+        self.field_layout.addLayout(self.transport_field)
+
         self.gemini_input.textEdited.connect(self.updateSettings)
         self.together_input.textEdited.connect(self.updateSettings)
         self.gemini_model_dropdown.currentTextChanged.connect(self.updateSettings)
+        self.stream_toggle.stateChanged.connect(self.updateSettings)
+        self.context_cache_toggle.stateChanged.connect(self.updateSettings)
+        self.response_mode_dropdown.currentTextChanged.connect(self.updateSettings)
+        self.history_turns_input.valueChanged.connect(self.updateSettings)
+        self.history_budget_input.valueChanged.connect(self.updateSettings)
+        self.summary_mode_dropdown.currentTextChanged.connect(self.updateSettings)
+        self.speculative_toggle.stateChanged.connect(self.updateSettings)
+        self.speculative_concurrency_input.valueChanged.connect(self.updateSettings)
+        self.speculative_budget_input.valueChanged.connect(self.updateSettings)
+        self.image_cache_input.valueChanged.connect(self.updateSettings)
+        self.transport_dropdown.currentTextChanged.connect(self.updateSettings)
+        self.cassette_input.textEdited.connect(self.updateSettings)
 
         self.autoLoadSettings()
         self.settings_loaded = True
@@ -105,6 +221,18 @@ class Settings(QMainWindow):
             self.gemini_input.setText(settings.gemini_api_key)
             self.together_input.setText(settings.together_api_key)
             self.gemini_model_dropdown.setCurrentText(settings.gemini_model)
+            self.stream_toggle.setChecked(settings.stream_responses)
+            self.context_cache_toggle.setChecked(settings.context_cache)
+            self.response_mode_dropdown.setCurrentText(settings.response_mode)
+            self.history_turns_input.setValue(settings.history_turns)
+            self.history_budget_input.setValue(settings.history_token_budget)
+            self.summary_mode_dropdown.setCurrentText(settings.summary_mode)
+            self.speculative_toggle.setChecked(settings.speculative)
+            self.speculative_concurrency_input.setValue(settings.speculative_concurrency)
+            self.speculative_budget_input.setValue(settings.speculative_token_budget)
+            self.image_cache_input.setValue(settings.image_cache_mb)
+            self.transport_dropdown.setCurrentText(settings.transport_mode)
+            self.cassette_input.setText(settings.cassette_dir)
 
     def updateSettings(self):
         if self.settings_loaded == False: return
@@ -112,6 +240,18 @@ class Settings(QMainWindow):
             gemini_api_key = self.gemini_input.text(),
             together_api_key = self.together_input.text(),
             gemini_model = self.gemini_model_dropdown.currentText(),
+            stream_responses = self.stream_toggle.isChecked(),
+            response_mode = self.response_mode_dropdown.currentText(),
+            history_turns = self.history_turns_input.value(),
+            history_token_budget = self.history_budget_input.value(),
+            summary_mode = self.summary_mode_dropdown.currentText(),
+            speculative = self.speculative_toggle.isChecked(),
+            speculative_concurrency = self.speculative_concurrency_input.value(),
+            speculative_token_budget = self.speculative_budget_input.value(),
+            image_cache_mb = self.image_cache_input.value(),
+            transport_mode = self.transport_dropdown.currentText(),
+            cassette_dir = self.cassette_input.text(),
+            context_cache = self.context_cache_toggle.isChecked(),
         )
         settings_path = os.path.join(os.path.dirname(__file__), "settings.dmx")
         pickle.dump(settings, open(settings_path, 'wb'))
@@ -0,0 +1,146 @@
+import time
+from PyQt5.QtCore import QObject
+from gameModel import GameModel
+from session import GameSession, choice_message
+from tasks import Task
+
+class Branch:
+    def __init__(self, message: str, session: GameSession):
+        self.message = message
+        self.session = session
+        self.task: Task = None
+        self.result: GameModel = None
+        self.error: str = None
+        self.started_at: float = None
+        self.finished_at: float = None
+        self.discarded = False
+        # its tokens have been added to the Speculator's
+        self.spent = False
+        # what has been streamed so far, so adopting a running branch can show it before the rest arrives
+        self.text: str = None
+        self.fields: dict = {}
+
+    def tokens(self) -> int:
+        return self.session.tokens_used
+
+    def set_field(self, name: str, value):
+        self.fields[name] = value
+
+    def replay(self, on_text, on_field):
+        if self.text is not None:
+            on_text(self.text)
+        for name, value in self.fields.items():
+            on_field(name, value)
+
+# Generates the next chapter for every visible choice in the background, on forks of the session,
+# so that handle_choice can commit the matching branch without waiting for the model.
+# token_budget is per turn: once the branches for the current choices have used that much, the rest aren't started.
+class Speculator(QObject):
+    def __init__(self, max_concurrent: int = 2, token_budget: int = 200000, timeout: float = None, stream: bool = False):
+        super().__init__()
+        self.max_concurrent = max_concurrent
+        self.token_budget = token_budget
+        self.timeout = timeout
+        self.stream = stream
+
+        self.branches: dict[str, Branch] = {}
+        self.queue: list[Branch] = []
+        self.running: list[Branch] = []
+
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        self.tokens_used = 0
+        self.tokens_wasted = 0
+        self.turn_tokens = 0
+
+    def start(self, session: GameSession, choices: list[GameModel.GameChoice]):
+        self.discard()
+        self.turn_tokens = 0
+        for choice in choices:
+            message = choice_message(choice.text)
+            branch = Branch(message, session.fork())
+            self.branches[message] = branch
+            self.queue.append(branch)
+        self.pump()
+
+    def pump(self):
+        while self.queue and len(self.running) < self.max_concurrent and self.turn_tokens < self.token_budget:
+            branch = self.queue.pop(0)
+            branch.task = Task()
+            branch.task.result_ready.connect(lambda game, branch=branch: self.branch_done(branch, game))
+            branch.task.failed.connect(lambda error, branch=branch: setattr(branch, "error", error))
+            branch.task.finished.connect(lambda branch=branch: self.task_done(branch))
+            callbacks = {}
+            if self.stream:
+                branch.task.text_ready.connect(lambda text, branch=branch: setattr(branch, "text", text))
+                branch.task.field_ready.connect(branch.set_field)
+                callbacks = { "on_text": branch.task.later(branch.task.text_ready), "on_field": branch.task.later(branch.task.field_ready) }
+            branch.started_at = time.perf_counter()
+            self.running.append(branch)
+            branch.task.start(branch.session.asend(branch.message, **callbacks), self.timeout)
+
+    def branch_done(self, branch: Branch, game: GameModel):
+        branch.result = game
+        branch.finished_at = time.perf_counter()
+
+    # finished or failed, not cancelled (see discard)
+    def task_done(self, branch: Branch):
+        self.spend(branch, branch.tokens())
+        self.running = [running for running in self.running if running is not branch]
+        self.pump()
+
+    def spend(self, branch: Branch, tokens: int):
+        branch.spent = True
+        self.tokens_used += tokens
+        # a branch from an earlier turn can finish after the next one started
+        if self.branches.get(branch.message) is branch:
+            self.turn_tokens += tokens
+        if branch.discarded:
+            self.tokens_wasted += tokens
+
+    # returns the branch for `message` (finished or still running) and drops all the others
+    def take(self, message: str) -> Branch | None:
+        speculated = bool(self.branches)
+        branch = self.branches.pop(message, None)
+
+        if branch and branch.task and not branch.error:
+            self.hits += 1
+            if branch.result:
+                self.latency_saved += branch.finished_at - branch.started_at
+            else:
+                self.latency_saved += time.perf_counter() - branch.started_at
+            self.running = [running for running in self.running if running is not branch]
+        else:
+            if speculated:
+                self.misses += 1
+            branch = None
+
+        self.discard()
+        return branch
+
+    # unfinished branches are cancelled straight away, so they stop using tokens too. The request in flight is
+    # counted by the size of its prompt, its usage never arrives.
+    def discard(self):
+        for branch in self.branches.values():
+            branch.discarded = True
+            if branch.task and branch.task.running():
+                branch.task.cancel()
+                self.spend(branch, branch.tokens() + (branch.session.chat.last_compaction.get("sent_tokens") or 0))
+            elif branch.spent:
+                self.tokens_wasted += branch.tokens()
+            # otherwise task_done is still on its way, and counts it as wasted
+        self.running = []
+        self.branches = {}
+        self.queue = []
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "latency_saved": self.latency_saved,
+            "tokens_used": self.tokens_used,
+            "tokens_wasted": self.tokens_wasted,
+        }
@@ -0,0 +1,114 @@
+import json
+import re
+from pydantic import BaseModel, TypeAdapter
+from gameModel import GameModel
+
+_partial_unicode = re.compile(r'(?<!\\)((?:\\\\)*)\\u[0-9a-fA-F]{0,3}$')
+
+# Incremental parser for a streamed JSON response. feed() returns a list of events:
+#   ("text", str)          - the decoded value of `text_field` received so far
+#   ("field", name, value) - a top-level field that has been fully received, validated against the schema
+class GameModelStreamParser:
+    def __init__(self, schema: type[BaseModel] = GameModel, text_field: str = "chapterText"):
+        self.schema = schema
+        self.text_field = text_field
+        self.adapters = { name: TypeAdapter(field.annotation) for name, field in schema.model_fields.items() }
+
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+
+        self.key = None
+        self.expect_value = False
+        self.value_start = None
+        self.fields = {}
+
+    def feed(self, chunk: str) -> list[tuple]:
+        events = []
+        self.buffer += chunk
+
+        for i in range(self.pos, len(self.buffer)):
+            char = self.buffer[i]
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        if self.expect_value:
+                            self.complete(i + 1, events)
+                        else:
+                            self.key = json.loads(self.buffer[self.string_start:i + 1])
+                continue
+
+            if char == '"':
+                self.in_string = True
+                self.string_start = i
+                if self.depth == 1 and self.expect_value and self.value_start is None:
+                    self.value_start = i
+            elif char in "{[":
+                self.depth += 1
+                if self.depth == 2 and self.expect_value and self.value_start is None:
+                    self.value_start = i
+            elif char in "}]":
+                if self.depth == 1 and self.expect_value and self.value_start is not None:
+                    self.complete(i, events)
+                self.depth -= 1
+                if self.depth == 1 and self.expect_value and self.value_start is not None:
+                    self.complete(i + 1, events)
+            elif self.depth == 1:
+                if char == ":":
+                    self.expect_value = True
+                    self.value_start = None
+                elif char == ",":
+                    if self.expect_value and self.value_start is not None:
+                        self.complete(i, events)
+                    self.expect_value = False
+                elif not char.isspace() and self.expect_value and self.value_start is None:
+                    self.value_start = i
+
+        self.pos = len(self.buffer)
+
+        if self.in_string and self.depth == 1 and self.expect_value and self.key == self.text_field and self.value_start is not None:
+            text = self.partial_string(self.buffer[self.value_start + 1:])
+            if text is not None:
+                events.append(("text", text))
+
+        return events
+
+    def complete(self, end: int, events: list):
+        raw = self.buffer[self.value_start:end].strip()
+        self.expect_value = False
+        self.value_start = None
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+
+        if self.key in self.adapters:
+            try:
+                value = self.adapters[self.key].validate_python(value)
+            except Exception:
+                return
+
+        self.fields[self.key] = value
+        if self.key == self.text_field:
+            events.append(("text", value))
+        events.append(("field", self.key, value))
+
+    def partial_string(self, raw: str) -> str | None:
+        trailing = len(raw) - len(raw.rstrip("\\"))
+        if trailing % 2:
+            raw = raw[:-1]
+        else:
+            raw = _partial_unicode.sub(r"\1", raw)
+        try:
+            return json.loads('"' + raw + '"')
+        except json.JSONDecodeError:
+            return None
@@ -3,7 +3,8 @@
 import sys
 from PyQt5.QtWidgets import QLabel, QMainWindow, QApplication, QSizePolicy
 from PyQt5.QtGui import QPixmap, QIcon, QFont, QFontDatabase
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QSize
+from collections import OrderedDict
 import os
 
 text = QFont("Helvetica")
@@ -55,7 +56,7 @@ def get_stylesheet(fonts = None):
                     padding:10px;
                 }
 
-                QListWidget {
+                QListWidget, QListView {
                     background:rgba(0,0,0,0.4);
                     color:white;
                     border: rgba(0,0,0,0);
@@ -104,6 +105,62 @@ def get_stylesheet(fonts = None):
     """
 
 
+icon_path = "assets/icon.png"
+background_path = "assets/background.jpeg"
+
+# Process-wide: fonts are registered and the stylesheet built once, pixmaps decoded once, and the background
+# kept pre-scaled for the last few window sizes, instead of every window doing it all again.
+class AssetCache:
+    def __init__(self, max_backgrounds: int = 8):
+        self.max_backgrounds = max_backgrounds
+        self.fonts: dict[str, str] = None
+        self.style: str = None
+        self.pixmaps: dict[str, QPixmap] = {}
+        self.icons: dict[str, QIcon] = {}
+        self.backgrounds: OrderedDict[tuple, QPixmap] = OrderedDict()
+
+    def font_families(self) -> dict[str, str]:
+        if self.fonts is None:
+            self.fonts = load_fonts()
+        return self.fonts
+
+    def stylesheet(self) -> str:
+        if self.style is None:
+            self.style = get_stylesheet(self.font_families())
+        return self.style
+
+    def pixmap(self, path: str) -> QPixmap:
+        if path not in self.pixmaps:
+            self.pixmaps[path] = QPixmap(path)
+        return self.pixmaps[path]
+
+    def icon(self, path: str) -> QIcon:
+        if path not in self.icons:
+            self.icons[path] = QIcon(self.pixmap(path))
+        return self.icons[path]
+
+    def background(self, size: QSize, ratio: float = 1.0, path: str = background_path) -> QPixmap:
+        key = (path, size.width(), size.height(), ratio)
+        if key in self.backgrounds:
+            self.backgrounds.move_to_end(key)
+            return self.backgrounds[key]
+
+        scaled = self.pixmap(path).scaled(size * ratio, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        scaled.setDevicePixelRatio(ratio)
+        self.backgrounds[key] = scaled
+        if len(self.backgrounds) > self.max_backgrounds:
+            self.backgrounds.popitem(last=False)
+        return scaled
+
+assets = AssetCache()
+
+# Window background, drawn from a pixmap scaled once per size rather than rescaling the full image on every paint
+class BackgroundLabel(QLabel):
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if not self.size().isEmpty():
+            self.setPixmap(assets.background(self.size(), self.devicePixelRatioF()))
+
 image_friendly = """
 QLabel {
     padding:0;
@@ -134,24 +191,17 @@ def init_window(win: QMainWindow, autosize: bool = True):
         win.setGeometry(x, y, w, h)
     
 
-    icon_path = "assets/icon.png"
-    background_path = "assets/background.jpeg"
-
-    pixmap = QPixmap(icon_path)
-    win.setWindowIcon(QIcon(pixmap))
+    win.setWindowIcon(assets.icon(icon_path))
 
-    pixmap = QPixmap(background_path)
-    win.background = QLabel(win)
-    win.background.setPixmap(pixmap)
+    win.background = BackgroundLabel(win)
     win.background.setGeometry(win.rect())
-    win.background.setScaledContents(True)
     win.background.lower()
     if hasattr(win, "image_label"):
         win.image_label.setStyleSheet(image_friendly)
     if hasattr(win, "icon_label"):
         win.icon_label.setStyleSheet(image_friendly)
     win.background.setStyleSheet(image_friendly)
-    win.setStyleSheet(get_stylesheet())
+    win.setStyleSheet(assets.stylesheet())
 
 class AutoResizingLabel(QLabel):
     def __init__(self, pixmap=None):
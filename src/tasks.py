@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Coroutine
+from PyQt5.QtCore import QObject, pyqtSignal
+
+# One asyncio loop on one background thread, shared by every window: generation runs on the async Gemini client,
+# blocking work (images, loading) on the loop's small thread pool. At most `max_concurrent` requests run at once.
+max_concurrent = 8
+max_workers = 4
+
+loop: asyncio.AbstractEventLoop = None
+limit: asyncio.Semaphore = None
+lock = threading.Lock()
+
+def shared_loop() -> asyncio.AbstractEventLoop:
+    global loop, limit
+    with lock:
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dm-worker"))
+            limit = asyncio.Semaphore(max_concurrent)
+            threading.Thread(target=loop.run_forever, name="dm-loop", daemon=True).start()
+    return loop
+
+async def bounded(coro: Coroutine, timeout: float = None):
+    async with limit:
+        return await asyncio.wait_for(coro, timeout)
+
+def run(coro: Coroutine, timeout: float = None) -> Future:
+    loop = shared_loop()
+    return asyncio.run_coroutine_threadsafe(bounded(coro, timeout), loop)
+
+# A request on the shared loop, seen from the UI thread. Signals are delivered on the thread the Task was
+# created on, and never after cancel(): a superseded request can't overwrite what replaced it.
+class Task(QObject):
+    result_ready = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    finished = pyqtSignal()
+    text_ready = pyqtSignal(str)
+    field_ready = pyqtSignal(str, object)
+    retrying = pyqtSignal(str)
+
+    # carries any of the signals above across from the loop thread
+    relay = pyqtSignal(object, tuple)
+
+    def __init__(self):
+        super().__init__()
+        self.future: Future = None
+        self.timeout: float = None
+        self.cancelled = False
+        self.relay.connect(self.deliver)
+
+    def start(self, coro: Coroutine, timeout: float = None) -> "Task":
+        self.timeout = timeout
+        self.future = run(coro, timeout)
+        self.future.add_done_callback(self.done)
+        return self
+
+    # for callbacks called on the loop thread, e.g. on_text=task.later(task.text_ready)
+    def later(self, signal) -> Callable:
+        return lambda *args: self.relay.emit(signal, args)
+
+    def deliver(self, signal, args: tuple):
+        if not self.cancelled:
+            signal.emit(*args)
+
+    def done(self, future: Future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            self.relay.emit(self.result_ready, (future.result(),))
+        elif isinstance(error, asyncio.TimeoutError):
+            self.relay.emit(self.failed, (f"No response within {self.timeout:g} seconds",))
+        else:
+            self.relay.emit(self.failed, (str(error) or type(error).__name__,))
+        self.relay.emit(self.finished, ())
+
+    def cancel(self):
+        self.cancelled = True
+        if self.future:
+            self.future.cancel()
+
+    def running(self) -> bool:
+        return self.future is not None and not self.future.done()
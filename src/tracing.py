@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import atexit
+import asyncio
+import functools
+import threading
+from collections import deque
+
+# Opt-in timing of the stages of a turn (the Gemini request, parsing, the rules, saving, the image request and
+# decoding, updating and painting the window), written out as a Chrome trace that chrome://tracing or
+# https://ui.perfetto.dev can open, one row per thread.
+#
+#   DM_TRACE=1             record from startup, Ctrl+Shift+T in the game window writes the trace
+#   DM_TRACE=trace.json    the same, and the trace is written there on exit
+#
+# Without DM_TRACE, Ctrl+Shift+T starts recording and pressing it again writes the trace. Spans go into a ring
+# buffer, so a long session only keeps its most recent events. When tracing is off, span() returns a shared
+# no-op context manager.
+
+trace_dir = os.path.join(os.path.dirname(__file__), "traces")
+
+class Span:
+    __slots__ = ("tracer", "name", "category", "args", "started")
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        if kind is not None:
+            self.args["error"] = kind.__name__
+        self.tracer.record(self.name, self.category, self.started, time.perf_counter_ns() - self.started, self.args)
+        return False
+
+class NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        return False
+
+no_span = NoSpan()
+
+class Tracer:
+    def __init__(self, capacity: int = 200_000):
+        self.events: deque = deque(maxlen=capacity)
+        self.threads: dict[int, str] = {}
+        self.enabled = False
+        self.origin = time.perf_counter_ns()
+
+    def start(self):
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    def clear(self):
+        self.events.clear()
+
+    def span(self, name: str, category: str = "game", **args) -> Span | NoSpan:
+        if not self.enabled:
+            return no_span
+        return Span(self, name, category, args)
+
+    def instant(self, name: str, category: str = "game", **args):
+        if self.enabled:
+            self.record(name, category, time.perf_counter_ns(), None, args)
+
+    # deque.append is atomic, spans can end on any thread without a lock
+    def record(self, name: str, category: str, started: int, duration: int | None, args: dict):
+        thread = threading.get_native_id()
+        if thread not in self.threads:
+            self.threads[thread] = threading.current_thread().name
+        self.events.append((name, category, started, duration, thread, args))
+
+    def chrome_trace(self) -> dict:
+        pid = os.getpid()
+        events = [
+            { "name": "thread_name", "ph": "M", "pid": pid, "tid": thread, "args": { "name": name } }
+            for thread, name in list(self.threads.items())
+        ]
+        for name, category, started, duration, thread, args in list(self.events):
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X" if duration is not None else "i",
+                "ts": (started - self.origin) / 1000,
+                "pid": pid,
+                "tid": thread,
+            }
+            if duration is not None:
+                event["dur"] = duration / 1000
+            else:
+                event["s"] = "t"
+            if args:
+                event["args"] = { key: value if isinstance(value, (int, float, bool)) else str(value) for key, value in args.items() }
+            events.append(event)
+        return { "traceEvents": events, "displayTimeUnit": "ms" }
+
+    def dump(self, path: str = None) -> str:
+        if not path:
+            os.makedirs(trace_dir, exist_ok=True)
+            path = os.path.join(trace_dir, time.strftime("trace-%Y%m%d-%H%M%S.json"))
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.chrome_trace(), file)
+        return path
+
+tracer = Tracer()
+
+def span(name: str, category: str = "game", **args) -> Span | NoSpan:
+    return tracer.span(name, category, **args)
+
+# wraps a function (or coroutine function) in a span named after it
+def traced(name: str = None, category: str = "game"):
+    def decorate(function):
+        label = name or function.__qualname__
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                with tracer.span(label, category):
+                    return await function(*args, **kwargs)
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with tracer.span(label, category):
+                    return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# the hotkey: starts recording, or writes what has been recorded. Returns the file written, if any.
+def toggle() -> str | None:
+    if not tracer.enabled:
+        tracer.clear()
+        tracer.start()
+        return None
+    path = tracer.dump()
+    if not os.environ.get("DM_TRACE"):
+        tracer.stop()
+    return path
+
+def init_from_environment():
+    setting = os.environ.get("DM_TRACE", "")
+    if not setting or setting == "0":
+        return
+    tracer.start()
+    if setting != "1":
+        atexit.register(tracer.dump, setting)
+
+init_from_environment()
@@ -0,0 +1,493 @@
+import os
+import json
+import asyncio
+import time
+import random
+import hashlib
+import threading
+import base64
+from io import BytesIO
+from typing import Callable, Iterator, AsyncIterator
+from google import genai
+from google.genai import types, errors
+import together
+from chat import make_response
+from gameModel import GameModel, GameDelta
+
+# Sits between the game and the Gemini / together.ai clients, with the same interface as the clients themselves
+# (client.models.generate_content(...), client.images.generate(...)), so Chat and the image code don't know it's there.
+#   live:   straight through to the real clients
+#   record: straight through, and every request/response pair is written to the cassette directory
+#   replay: served from the cassette directory, no network and no API keys needed
+# A cassette is a directory of JSON files, one per request, named after a hash of the request.
+
+modes = ["live", "record", "replay"]
+cassette_dir = os.path.join(os.path.dirname(__file__), "cassettes")
+
+class CassetteMiss(KeyError):
+    pass
+
+class Cassette:
+    def __init__(self, directory: str = cassette_dir):
+        self.directory = directory
+        # the same request can be made more than once in a session (e.g. a regenerate), replay returns
+        # the recorded responses in order
+        self.played: dict[str, int] = {}
+        # speculative branches make requests from several threads at once
+        self.lock = threading.Lock()
+
+    def key(self, kind: str, request: dict) -> str:
+        data = json.dumps({ "kind": kind, **request }, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def path(self, key: str, index: int) -> str:
+        return os.path.join(self.directory, f"{key}.{index}.json")
+
+    def load(self, kind: str, request: dict) -> dict:
+        key = self.key(kind, request)
+        with self.lock:
+            index = self.played.get(key, 0)
+            path = self.path(key, index)
+            if not os.path.exists(path):
+                # out of recordings for this request, repeat the last one
+                path = self.path(key, index - 1)
+                if index == 0 or not os.path.exists(path):
+                    raise CassetteMiss(f"No recording for this {kind} request in {self.directory}.")
+            else:
+                self.played[key] = index + 1
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)["response"]
+
+    def save(self, kind: str, request: dict, response: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        key = self.key(kind, request)
+        with self.lock:
+            index = self.played.get(key, 0)
+            self.played[key] = index + 1
+        with open(self.path(key, index), "w", encoding="utf-8") as file:
+            json.dump({ "kind": kind, "request": request, "response": response }, file, ensure_ascii=False, indent=1, default=str)
+
+# Replay latency: None for instant responses, "recorded" to wait as long as the recorded request took,
+# or a function returning the seconds to wait (see lognormal_latency).
+def lognormal_latency(median: float, sigma: float = 0.5, seed: int = None) -> Callable[[float], float]:
+    rng = random.Random(seed)
+    return lambda recorded: rng.lognormvariate(0, sigma) * median
+
+def replay_delay(latency, recorded: float) -> float:
+    if latency is None:
+        return 0.0
+    if latency == "recorded":
+        return recorded
+    return latency(recorded)
+
+def genai_request(model: str, config: types.GenerateContentConfig, contents) -> dict:
+    config_data = None
+    if config:
+        config_data = config.model_dump(mode="json", exclude_none=True, exclude={"response_schema"})
+        if config.response_schema:
+            config_data["response_schema"] = getattr(config.response_schema, "__name__", str(config.response_schema))
+    if isinstance(contents, list):
+        contents = [content.model_dump(mode="json", exclude_none=True) if isinstance(content, types.Content) else content for content in contents]
+    return { "model": model, "config": config_data, "contents": contents }
+
+class GenaiModels:
+    def __init__(self, transport: "GenaiTransport"):
+        self.transport = transport
+
+    def generate_content(self, model: str, config: types.GenerateContentConfig = None, contents=None) -> types.GenerateContentResponse:
+        transport = self.transport
+        request = genai_request(model, config, contents)
+        schema = config.response_schema if config else None
+
+        if transport.mode == "replay":
+            response = transport.cassette.load("generate_content", request)
+            time.sleep(replay_delay(transport.latency, response["latency"]))
+            return make_response(response["text"], schema, usage(response))
+
+        started = time.perf_counter()
+        res = transport.client.models.generate_content(model=model, config=config, contents=contents)
+        if transport.mode == "record":
+            transport.cassette.save("generate_content", request, recording([res.text], res.usage_metadata, started))
+        return res
+
+    def generate_content_stream(self, model: str, config: types.GenerateContentConfig = None, contents=None) -> Iterator[types.GenerateContentResponse]:
+        transport = self.transport
+        request = genai_request(model, config, contents)
+
+        # streamed and non-streamed requests share recordings, only the chunking differs
+        if transport.mode == "replay":
+            response = transport.cassette.load("generate_content", request)
+            chunks = response.get("chunks") or [response["text"]]
+            delay = replay_delay(transport.latency, response["latency"]) / len(chunks)
+            for idx, text in enumerate(chunks):
+                time.sleep(delay)
+                last = idx == len(chunks) - 1
+                yield chunk_response(text, usage(response) if last else None)
+            return
+
+        started = time.perf_counter()
+        chunks = []
+        usage_metadata = None
+        for chunk in transport.client.models.generate_content_stream(model=model, config=config, contents=contents):
+            usage_metadata = chunk.usage_metadata or usage_metadata
+            if chunk.text:
+                chunks.append(chunk.text)
+            yield chunk
+
+        if transport.mode == "record":
+            transport.cassette.save("generate_content", request, recording(chunks, usage_metadata, started))
+
+# client.aio.models
+class AsyncGenaiModels:
+    def __init__(self, transport: "GenaiTransport"):
+        self.transport = transport
+
+    async def generate_content(self, model: str, config: types.GenerateContentConfig = None, contents=None) -> types.GenerateContentResponse:
+        transport = self.transport
+        request = genai_request(model, config, contents)
+        schema = config.response_schema if config else None
+
+        if transport.mode == "replay":
+            response = transport.cassette.load("generate_content", request)
+            await asyncio.sleep(replay_delay(transport.latency, response["latency"]))
+            return make_response(response["text"], schema, usage(response))
+
+        started = time.perf_counter()
+        res = await transport.client.aio.models.generate_content(model=model, config=config, contents=contents)
+        if transport.mode == "record":
+            transport.cassette.save("generate_content", request, recording([res.text], res.usage_metadata, started))
+        return res
+
+    async def generate_content_stream(self, model: str, config: types.GenerateContentConfig = None, contents=None) -> AsyncIterator[types.GenerateContentResponse]:
+        transport = self.transport
+        request = genai_request(model, config, contents)
+
+        if transport.mode == "replay":
+            response = transport.cassette.load("generate_content", request)
+            return self.replay_stream(response)
+
+        return self.record_stream(request, await transport.client.aio.models.generate_content_stream(model=model, config=config, contents=contents))
+
+    async def replay_stream(self, response: dict) -> AsyncIterator[types.GenerateContentResponse]:
+        chunks = response.get("chunks") or [response["text"]]
+        delay = replay_delay(self.transport.latency, response["latency"]) / len(chunks)
+        for idx, text in enumerate(chunks):
+            await asyncio.sleep(delay)
+            last = idx == len(chunks) - 1
+            yield chunk_response(text, usage(response) if last else None)
+
+    async def record_stream(self, request: dict, stream: AsyncIterator[types.GenerateContentResponse]) -> AsyncIterator[types.GenerateContentResponse]:
+        started = time.perf_counter()
+        chunks = []
+        usage_metadata = None
+        async for chunk in stream:
+            usage_metadata = chunk.usage_metadata or usage_metadata
+            if chunk.text:
+                chunks.append(chunk.text)
+            yield chunk
+
+        if self.transport.mode == "record":
+            self.transport.cassette.save("generate_content", request, recording(chunks, usage_metadata, started))
+
+class AsyncGenai:
+    def __init__(self, transport: "GenaiTransport"):
+        self.models = AsyncGenaiModels(transport)
+
+def recording(chunks: list[str], usage_metadata: types.GenerateContentResponseUsageMetadata, started: float) -> dict:
+    return {
+        "text": "".join(chunks),
+        "chunks": chunks,
+        "usage": usage_metadata.model_dump(mode="json", exclude_none=True) if usage_metadata else None,
+        "latency": time.perf_counter() - started,
+    }
+
+def usage(response: dict) -> types.GenerateContentResponseUsageMetadata | None:
+    if not response.get("usage"):
+        return None
+    return types.GenerateContentResponseUsageMetadata.model_validate(response["usage"])
+
+def chunk_response(text: str, usage_metadata: types.GenerateContentResponseUsageMetadata = None) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(
+        candidates = [types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))],
+        usage_metadata = usage_metadata,
+    )
+
+class GenaiTransport:
+    def __init__(self, mode: str, client: genai.Client = None, cassette: Cassette = None, latency=None):
+        if mode not in modes:
+            raise ValueError(f"Unknown transport mode '{mode}'.")
+        self.mode = mode
+        self.client = client
+        self.cassette = cassette or Cassette()
+        self.latency = latency
+        self.models = GenaiModels(self)
+        self.aio = AsyncGenai(self)
+
+class ImageData:
+    def __init__(self, b64_json: str):
+        self.b64_json = b64_json
+
+class ImageResponse:
+    def __init__(self, b64_json: str):
+        self.data = [ImageData(b64_json)]
+
+class TogetherImages:
+    def __init__(self, transport: "TogetherTransport"):
+        self.transport = transport
+
+    def generate(self, **kwargs) -> ImageResponse:
+        transport = self.transport
+
+        if transport.mode == "replay":
+            response = transport.cassette.load("images", kwargs)
+            time.sleep(replay_delay(transport.latency, response["latency"]))
+            return ImageResponse(response["b64_json"])
+
+        started = time.perf_counter()
+        res = transport.client.images.generate(**kwargs)
+        if transport.mode == "record":
+            transport.cassette.save("images", kwargs, {
+                "b64_json": res.data[0].b64_json,
+                "latency": time.perf_counter() - started,
+            })
+        return res
+
+class TogetherTransport:
+    def __init__(self, mode: str, client: together.Together = None, cassette: Cassette = None, latency=None):
+        if mode not in modes:
+            raise ValueError(f"Unknown transport mode '{mode}'.")
+        self.mode = mode
+        self.client = client
+        self.cassette = cassette or Cassette()
+        self.latency = latency
+        self.images = TogetherImages(self)
+
+# Offline stand-ins for the clients, for load tests and autoplay without API keys or recordings. Responses are
+# made up to fit the request's schema: a GameModel or GameDelta with a few choices (and an item now and then),
+# the fields a repair asks for, or plain text for anything else (summaries). invalid_rate is the share of
+# game responses sent back without choices, to exercise repairs and retries.
+# client.caches works like the API's context caching: caches under min_cache_tokens are refused, requests on a cache
+# that's gone fail, and cached tokens show up in the usage metadata.
+class StubGenai:
+    sentences = ["The torches flicker as you move on.", "Somewhere ahead, water drips onto stone.", "A cold draft carries the smell of smoke.", "Your footsteps echo down the corridor."]
+
+    def __init__(self, latency=None, seed: int = None, invalid_rate: float = 0.0, chunk_size: int = 200):
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.invalid_rate = invalid_rate
+        self.chunk_size = chunk_size
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.min_cache_tokens = 1024
+        self.cached: dict[str, dict] = {}
+        self.models = StubModels(self)
+        self.caches = StubCaches(self)
+        self.aio = AsyncStub(self)
+
+    def delay(self) -> float:
+        return replay_delay(self.latency, 0.0)
+
+    def respond(self, config: types.GenerateContentConfig, contents) -> types.GenerateContentResponse:
+        cache = self.cache_for(config)
+        if cache and isinstance(contents, list):
+            contents = cache["contents"] + contents
+        with self.lock:
+            self.requests += 1
+            schema = config.response_schema if config else None
+            turn = sum(1 for content in contents if isinstance(content, types.Content) and content.role == "model") + 1 if isinstance(contents, list) else 1
+            if schema is GameModel:
+                text = self.game(turn).model_dump_json()
+            elif schema is GameDelta:
+                text = self.delta(turn).model_dump_json()
+            elif schema:
+                game = self.game(turn)
+                text = json.dumps({ field: getattr(game, field) for field in schema.model_fields }, default=lambda value: value.model_dump())
+            else:
+                text = " ".join(self.rng.choice(self.sentences) for _ in range(6))
+
+        instruction = cache["system_instruction"] if cache else getattr(config, "system_instruction", None) or ""
+        prompt = instruction + json.dumps(genai_request("", None, contents)["contents"], default=str)
+        return make_response(text, schema, types.GenerateContentResponseUsageMetadata(
+            prompt_token_count = len(prompt) // 4,
+            cached_content_token_count = cache["tokens"] if cache else None,
+            candidates_token_count = len(text) // 4,
+            total_token_count = (len(prompt) + len(text)) // 4,
+        ))
+
+    def cache_for(self, config: types.GenerateContentConfig) -> dict | None:
+        if not config or not config.cached_content:
+            return None
+        if config.system_instruction:
+            raise errors.ClientError(400, { "error": { "code": 400, "message": "CachedContent can not be used with GenerateContent request setting system_instruction", "status": "INVALID_ARGUMENT" } })
+        with self.lock:
+            cache = self.cached.get(config.cached_content)
+            if not cache or cache["expires"] < time.time():
+                self.cached.pop(config.cached_content, None)
+                raise errors.ClientError(403, { "error": { "code": 403, "message": "CachedContent not found (or permission denied)", "status": "PERMISSION_DENIED" } })
+            return cache
+
+    def create_cache(self, model: str, config: types.CreateCachedContentConfig) -> types.CachedContent:
+        contents = list(config.contents or [])
+        prompt = (config.system_instruction or "") + json.dumps(genai_request("", None, contents)["contents"], default=str)
+        if len(prompt) // 4 < self.min_cache_tokens:
+            raise errors.ClientError(400, { "error": { "code": 400, "message": f"Cached content is too small. total_token_count={len(prompt) // 4}, min_total_token_count={self.min_cache_tokens}", "status": "INVALID_ARGUMENT" } })
+        with self.lock:
+            name = f"cachedContents/stub-{len(self.cached) + 1}-{self.rng.getrandbits(32):08x}"
+            self.cached[name] = {
+                "system_instruction": config.system_instruction or "",
+                "contents": contents,
+                "tokens": len(prompt) // 4,
+                "expires": time.time() + int(config.ttl.rstrip("s")),
+            }
+        return types.CachedContent(name=name, model=model, usage_metadata=types.CachedContentUsageMetadata(total_token_count=len(prompt) // 4))
+
+    def update_cache(self, name: str, config: types.UpdateCachedContentConfig) -> types.CachedContent:
+        with self.lock:
+            if name not in self.cached:
+                raise errors.ClientError(404, { "error": { "code": 404, "message": "CachedContent not found", "status": "NOT_FOUND" } })
+            self.cached[name]["expires"] = time.time() + int(config.ttl.rstrip("s"))
+        return types.CachedContent(name=name)
+
+    def delete_cache(self, name: str):
+        with self.lock:
+            if self.cached.pop(name, None) is None:
+                raise errors.ClientError(404, { "error": { "code": 404, "message": "CachedContent not found", "status": "NOT_FOUND" } })
+
+    def chapter(self, turn: int) -> str:
+        return f"# Chapter {turn}\n\n" + " ".join(self.rng.choice(self.sentences) for _ in range(self.rng.randint(20, 60)))
+
+    def choices(self, turn: int) -> list[GameModel.GameChoice]:
+        if self.rng.random() < self.invalid_rate:
+            return []
+        return [GameModel.GameChoice(text=f"Option {turn}.{n}") for n in range(self.rng.randint(2, 4))]
+
+    def game(self, turn: int) -> GameModel:
+        return GameModel(
+            chapterText = self.chapter(turn),
+            inventory = [GameModel.InventoryItem(name="Health Potion", options=["consume", "discard"])] +
+                [GameModel.InventoryItem(name=f"Trinket {n}", options=["examine", "use", "discard"]) for n in range(min(turn // 3, 3))],
+            health = self.rng.randint(50, 100),
+            maxHealth = 100,
+            imagePrompt = f"A torch-lit dungeon corridor, chapter {turn}, realistic style",
+            choices = self.choices(turn),
+            stats = GameModel.Stats(STRENGTH=3, AGILITY=4, INTELLIGENCE=5, CHARISMA=6),
+            currentQuest = GameModel.Quest(title="Find the way out", description="Somewhere below there is a way out.", completed_percentage=min(turn * 5, 100)),
+        )
+
+    def delta(self, turn: int) -> GameDelta:
+        found = self.rng.random() < 0.3
+        return GameDelta(
+            chapterText = self.chapter(turn),
+            itemsAdded = [GameModel.InventoryItem(name=f"Trinket {turn}", options=["examine", "use", "discard"])] if found else [],
+            itemsRemoved = [],
+            healthChange = self.rng.choice([0, 0, -5, -10]),
+            maxHealthChange = 0,
+            imagePrompt = f"A torch-lit dungeon corridor, chapter {turn}, realistic style",
+            choices = self.choices(turn),
+            statChanges = GameDelta.StatChanges(STRENGTH=0, AGILITY=0, INTELLIGENCE=0, CHARISMA=0),
+            questProgressChange = 5,
+        )
+
+    def chunks(self, res: types.GenerateContentResponse) -> list[types.GenerateContentResponse]:
+        text = res.text
+        pieces = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+        return [chunk_response(piece, res.usage_metadata if idx == len(pieces) - 1 else None) for idx, piece in enumerate(pieces)]
+
+class StubModels:
+    def __init__(self, stub: StubGenai):
+        self.stub = stub
+
+    def generate_content(self, model: str, config: types.GenerateContentConfig = None, contents=None) -> types.GenerateContentResponse:
+        time.sleep(self.stub.delay())
+        return self.stub.respond(config, contents)
+
+    def generate_content_stream(self, model: str, config: types.GenerateContentConfig = None, contents=None) -> Iterator[types.GenerateContentResponse]:
+        chunks = self.stub.chunks(self.stub.respond(config, contents))
+        delay = self.stub.delay() / len(chunks)
+        for chunk in chunks:
+            time.sleep(delay)
+            yield chunk
+
+class AsyncStubModels:
+    def __init__(self, stub: StubGenai):
+        self.stub = stub
+
+    async def generate_content(self, model: str, config: types.GenerateContentConfig = None, contents=None) -> types.GenerateContentResponse:
+        await asyncio.sleep(self.stub.delay())
+        return self.stub.respond(config, contents)
+
+    async def generate_content_stream(self, model: str, config: types.GenerateContentConfig = None, contents=None) -> AsyncIterator[types.GenerateContentResponse]:
+        chunks = self.stub.chunks(self.stub.respond(config, contents))
+        delay = self.stub.delay() / len(chunks)
+        async def stream():
+            for chunk in chunks:
+                await asyncio.sleep(delay)
+                yield chunk
+        return stream()
+
+class StubCaches:
+    def __init__(self, stub: StubGenai):
+        self.stub = stub
+
+    def create(self, model: str, config: types.CreateCachedContentConfig = None) -> types.CachedContent:
+        return self.stub.create_cache(model, config)
+
+    def update(self, name: str, config: types.UpdateCachedContentConfig = None) -> types.CachedContent:
+        return self.stub.update_cache(name, config)
+
+    def delete(self, name: str, config=None):
+        self.stub.delete_cache(name)
+
+class AsyncStubCaches:
+    def __init__(self, stub: StubGenai):
+        self.stub = stub
+
+    async def create(self, model: str, config: types.CreateCachedContentConfig = None) -> types.CachedContent:
+        return self.stub.create_cache(model, config)
+
+    async def update(self, name: str, config: types.UpdateCachedContentConfig = None) -> types.CachedContent:
+        return self.stub.update_cache(name, config)
+
+    async def delete(self, name: str, config=None):
+        self.stub.delete_cache(name)
+
+class AsyncStub:
+    def __init__(self, stub: StubGenai):
+        self.models = AsyncStubModels(stub)
+        self.caches = AsyncStubCaches(stub)
+
+class StubImages:
+    def __init__(self, stub: "StubTogether"):
+        self.stub = stub
+
+    def generate(self, **kwargs) -> ImageResponse:
+        from PIL import Image
+        time.sleep(self.stub.delay())
+        buffer = BytesIO()
+        shade = int(hashlib.sha256(kwargs.get("prompt", "").encode("utf-8")).hexdigest()[:2], 16)
+        Image.new("RGB", (kwargs.get("width", 1024), kwargs.get("height", 768)), (shade, shade // 2, 64)).save(buffer, "JPEG")
+        return ImageResponse(base64.b64encode(buffer.getvalue()).decode("ascii"))
+
+class StubTogether:
+    def __init__(self, latency=None):
+        self.latency = latency
+        self.images = StubImages(self)
+
+    def delay(self) -> float:
+        return replay_delay(self.latency, 0.0)
+
+# the Gemini and together.ai clients for the settings' transport mode. Live mode returns the real clients untouched.
+def make_clients(settings, latency="recorded") -> tuple:
+    mode = getattr(settings, "transport_mode", "live")
+    if mode == "live":
+        return genai.Client(api_key=settings.gemini_api_key), together.Together(api_key=settings.together_api_key)
+
+    cassette = Cassette(settings.cassette_dir or cassette_dir)
+    genai_client = together_client = None
+    if mode == "record":
+        genai_client = genai.Client(api_key=settings.gemini_api_key)
+        together_client = together.Together(api_key=settings.together_api_key)
+    return (
+        GenaiTransport(mode, genai_client, cassette, latency),
+        TogetherTransport(mode, together_client, cassette, latency),
+    )
@@ -0,0 +1,31 @@
+import os
+import sys
+import pytest
+
+# Tests for the parts that talk to the model, run against the stub client in transport.py (no network, no keys):
+#
+#   pytest tests
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("TOGETHER_NO_BANNER", "1")
+sys.path.insert(0, os.path.join(os.path.dirname(here), "src"))
+
+import chat
+from settings import SettingsObject
+from transport import StubGenai
+from session import GameSession
+
+# defaults rather than whatever the local settings file has
+chat.settings = SettingsObject()
+
+@pytest.fixture
+def stub() -> StubGenai:
+    return StubGenai(seed=1)
+
+@pytest.fixture
+def session(stub) -> GameSession:
+    session = GameSession.new(stub, None, SettingsObject())
+    session.start()
+    return session
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+from google.genai import errors
+from context_cache import cache_error
+from session import GameSession
+from settings import SettingsObject
+from transport import StubGenai
+
+def play(session: GameSession, turns: int = 1):
+    for _ in range(turns):
+        session.choose(session.game.choices[0].text)
+
+def test_first_turn_creates_cache(session, stub):
+    cache = session.chat.context_cache
+    assert cache.name in stub.cached
+    assert len(stub.cached) == 1
+
+def test_cache_is_reused(session, stub):
+    cache = session.chat.context_cache
+    first = cache.name
+    play(session, 3)
+    assert cache.name == first
+    assert list(stub.cached) == [first]
+    assert session.chat.last_compaction["cached_tokens"] > 1000
+
+def test_reused_on_the_async_client(session, stub):
+    first = session.chat.context_cache.name
+    asyncio.run(session.achoose(session.game.choices[0].text, on_text=lambda text: None))
+    assert session.chat.context_cache.name == first
+    assert session.chat.last_compaction["cached_tokens"] > 1000
+
+def test_ttl_is_refreshed_when_half_gone(session, stub):
+    cache = session.chat.context_cache
+    cache.expires -= cache.ttl * 0.75
+    stub.cached[cache.name]["expires"] -= cache.ttl * 0.75
+    before = cache.expires
+    play(session)
+    assert cache.expires > before
+    assert stub.cached[cache.name]["expires"] > before
+
+def test_ttl_is_left_alone_while_fresh(session):
+    cache = session.chat.context_cache
+    before = cache.expires
+    play(session)
+    assert cache.expires == before
+
+def test_new_prefix_replaces_cache(session, stub):
+    cache = session.chat.context_cache
+    old = cache.name
+    session.chat.config.system_instruction += "\nA new custom rule."
+    play(session)
+    assert cache.name != old
+    assert list(stub.cached) == [cache.name]
+
+def test_falls_back_to_uncached_request_on_cache_error(session, stub):
+    cache = session.chat.context_cache
+    # deleted (or expired) on the server's side
+    stub.cached.clear()
+    history = len(session.chat.history)
+    play(session)
+    assert len(session.chat.history) == history + 2
+    assert session.chat.last_compaction["cached_tokens"] == 0
+    assert cache.name is None and cache.failures == 1
+    # and the next turn makes a new one
+    play(session)
+    assert cache.name in stub.cached and cache.failures == 0
+
+def test_stops_trying_after_refusals():
+    stub = StubGenai(seed=2)
+    stub.min_cache_tokens = 10 ** 6
+    session = GameSession.new(stub, None, SettingsObject())
+    session.start()
+    play(session, 5)
+    assert session.chat.context_cache.failures == session.chat.context_cache.max_failures
+    assert not stub.cached
+
+def test_only_cache_errors_fall_back():
+    assert cache_error(errors.ClientError(403, { "error": { "code": 403, "message": "CachedContent not found (or permission denied)", "status": "PERMISSION_DENIED" } }))
+    assert cache_error(errors.ClientError(400, { "error": { "code": 400, "message": "CachedContent can not be used with GenerateContent request setting system_instruction", "status": "INVALID_ARGUMENT" } }))
+    assert not cache_error(errors.ClientError(400, { "error": { "code": 400, "message": "Request contains an invalid argument.", "status": "INVALID_ARGUMENT" } }))
+    assert not cache_error(errors.ClientError(403, { "error": { "code": 403, "message": "API key not valid.", "status": "PERMISSION_DENIED" } }))
+
+def test_forks_share_one_cache(session, stub):
+    session.chat.config.system_instruction += "\nA new custom rule."
+    forks = [session.fork() for _ in range(8)]
+    failures = []
+
+    def send(fork):
+        try:
+            play(fork)
+        except Exception as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=send, args=(fork,)) for fork in forks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not failures
+    assert list(stub.cached) == [session.chat.context_cache.name]
+
+def test_release_deletes_cache(session, stub):
+    session.chat.context_cache.release(stub)
+    assert not stub.cached
+    assert session.chat.context_cache.name is None